@@ -74,6 +74,16 @@ DATABASES = {
     }
 }
 
+# Cache (face pipeline counters, session generations, dashboard warnings and
+# the trend change log). Point it at Redis or Memcached in production so all
+# gunicorn workers share it; `manage.py check --deploy` rejects LocMemCache.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -192,4 +202,88 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
-AWS_REGION_NAME = os.environ.get('AWS_REGION_NAME', 'eu-west-1')
\ No newline at end of file
+AWS_REGION_NAME = os.environ.get('AWS_REGION_NAME', 'eu-west-1')
+
+# ==============================================================================
+# FACE RECOGNITION
+# ==============================================================================
+
+# 'rekognition' (AWS), 'local' (NumPy memory-mapped index) or 'stub' (offline load tests)
+FACE_RECOGNITION_BACKEND = os.environ.get('FACE_RECOGNITION_BACKEND', 'rekognition')
+FACE_COLLECTION_ID = os.environ.get('FACE_COLLECTION_ID', 'smart_attendance_collection')
+FACE_MATCH_THRESHOLD = float(os.environ.get('FACE_MATCH_THRESHOLD', 85))
+
+# Local engine: embedding files shared by all workers + the embedding function
+FACE_INDEX_DIR = os.environ.get('FACE_INDEX_DIR', os.path.join(BASE_DIR, 'face_index'))
+FACE_EMBEDDER = os.environ.get('FACE_EMBEDDER', 'doctors.recognition.pixel_embedding')
+
+# Stub engine: simulated round-trip latency in milliseconds
+FACE_STUB_LATENCY_MS = int(os.environ.get('FACE_STUB_LATENCY_MS', 0))
+
+# Classroom-photo mode: threads used to match the faces cropped from one frame
+FACE_BATCH_WORKERS = int(os.environ.get('FACE_BATCH_WORKERS', 8))
+FACE_BATCH_MAX_FACES = int(os.environ.get('FACE_BATCH_MAX_FACES', 150))
+
+# Rekognition client: one pooled keep-alive client per process
+AWS_REKOGNITION_ENDPOINT_URL = os.environ.get('AWS_REKOGNITION_ENDPOINT_URL') or None
+AWS_REKOGNITION_CONNECT_TIMEOUT = float(os.environ.get('AWS_REKOGNITION_CONNECT_TIMEOUT', 2))
+AWS_REKOGNITION_READ_TIMEOUT = float(os.environ.get('AWS_REKOGNITION_READ_TIMEOUT', 5))
+AWS_REKOGNITION_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_REKOGNITION_MAX_POOL_CONNECTIONS', 20))
+
+# Retries (jittered exponential backoff) and circuit breaker for the backend
+FACE_RETRY_ATTEMPTS = int(os.environ.get('FACE_RETRY_ATTEMPTS', 3))
+FACE_RETRY_BASE_DELAY = float(os.environ.get('FACE_RETRY_BASE_DELAY', 0.1))
+FACE_RETRY_MAX_DELAY = float(os.environ.get('FACE_RETRY_MAX_DELAY', 1.0))
+FACE_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('FACE_BREAKER_FAILURE_THRESHOLD', 5))
+FACE_BREAKER_RESET_SECONDS = float(os.environ.get('FACE_BREAKER_RESET_SECONDS', 30))
+
+# Shard collections per 'course' or 'group' so a scan only searches the lecture's
+# roster (empty string = single global collection, the default). Build the shards
+# with `FACE_SHARD_KEY=course manage.py sync_face_shards` before turning it on.
+# Shard sync runs in a background thread unless FACE_SHARD_SYNC_ASYNC is off.
+FACE_SHARD_KEY = os.environ.get('FACE_SHARD_KEY', '')
+FACE_SHARD_SYNC_ASYNC = os.environ.get('FACE_SHARD_SYNC_ASYNC', '1') == '1'
+
+# Frame preprocessing: longest edge (px) and JPEG quality of what we send to the
+# backend, and the uplink speed used to estimate the upload time saved.
+FACE_FRAME_MAX_EDGE = int(os.environ.get('FACE_FRAME_MAX_EDGE', 960))
+FACE_BATCH_FRAME_MAX_EDGE = int(os.environ.get('FACE_BATCH_FRAME_MAX_EDGE', 2400))
+FACE_FRAME_JPEG_QUALITY = int(os.environ.get('FACE_FRAME_JPEG_QUALITY', 85))
+FACE_UPLINK_KBPS = float(os.environ.get('FACE_UPLINK_KBPS', 2000))
+FACE_FRAME_MAX_UPLOAD_BYTES = int(os.environ.get('FACE_FRAME_MAX_UPLOAD_BYTES', 8 * 1024 * 1024))
+
+# Local quality prefilter: frames below these scores are rejected before any
+# recognition call (see imaging.assess_frame_quality).
+FACE_QUALITY_PREFILTER = os.environ.get('FACE_QUALITY_PREFILTER', '1') == '1'
+FACE_MIN_SHARPNESS = float(os.environ.get('FACE_MIN_SHARPNESS', 25))
+FACE_MIN_BRIGHTNESS = float(os.environ.get('FACE_MIN_BRIGHTNESS', 40))
+FACE_MAX_BRIGHTNESS = float(os.environ.get('FACE_MAX_BRIGHTNESS', 225))
+FACE_MIN_SKIN_RATIO = float(os.environ.get('FACE_MIN_SKIN_RATIO', 0.03))
+
+# Kiosk (hands-free) mode: frames sampled per second and requests in flight on
+# the camera page, and the window in which a frame showing a just-marked
+# student's face again (dHash of the face crop within FACE_DUPLICATE_HASH_DISTANCE
+# bits) is answered without calling recognition.
+FACE_KIOSK_FPS = float(os.environ.get('FACE_KIOSK_FPS', 2))
+FACE_KIOSK_MAX_IN_FLIGHT = int(os.environ.get('FACE_KIOSK_MAX_IN_FLIGHT', 2))
+FACE_DUPLICATE_HASH_DISTANCE = int(os.environ.get('FACE_DUPLICATE_HASH_DISTANCE', 4))
+FACE_DUPLICATE_WINDOW_SECONDS = int(os.environ.get('FACE_DUPLICATE_WINDOW_SECONDS', 8))
+
+# ==============================================
+# ATTENDANCE SYNC
+# ==============================================
+# A scan belongs to the group's lecture whose window
+# [start - ATTENDANCE_EARLY_MINUTES, start + LECTURE_DURATION_MINUTES) holds it.
+LECTURE_DURATION_MINUTES = int(os.environ.get('LECTURE_DURATION_MINUTES', 120))
+ATTENDANCE_EARLY_MINUTES = int(os.environ.get('ATTENDANCE_EARLY_MINUTES', 15))
+# Max events accepted by one call of the offline batch sync API
+SCAN_SYNC_MAX_EVENTS = int(os.environ.get('SCAN_SYNC_MAX_EVENTS', 5000))
+
+# ==============================================
+# REPORTS
+# ==============================================
+# Rendered lecture PDFs, one file per lecture named after a hash of its
+# rendered HTML; a download whose data has not changed is served from here.
+REPORT_PDF_CACHE_DIR = os.environ.get('REPORT_PDF_CACHE_DIR', os.path.join(BASE_DIR, 'pdf_cache'))
+# Processes rendering PDFs for course / faculty bundles
+REPORT_PDF_WORKERS = int(os.environ.get('REPORT_PDF_WORKERS', os.cpu_count() or 2))
@@ -11,7 +11,8 @@ from django.http import HttpResponseRedirect
 from django.urls import reverse
 
 # استيراد الموديلات
-from .models import DoctorProfile, Course, Group, Student, Lecture, AttendanceRecord, Announcement
+from .models import DoctorProfile, Course, Group, Student, Lecture, AttendanceRecord, Announcement, FaceCollectionSnapshot, AttendanceSession, ScanEvent, AttendanceSummary
+from .attendance import close_session
 
 # ==============================================================================
 # 1. Doctor Profile Admin
@@ -221,4 +222,57 @@ class AnnouncementAdmin(admin.ModelAdmin):
     def has_file(self, obj):
         return bool(obj.attachment_file)
     has_file.boolean = True
-    has_file.short_description = 'File'
\ No newline at end of file
+    has_file.short_description = 'File'
+
+@admin.register(FaceCollectionSnapshot)
+class FaceCollectionSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('collection_id', 'created_at', 'faces_before', 'faces_after', 'duplicates_deleted', 'orphans_deleted', 'missing_faces', 'dry_run')
+    list_filter = ('collection_id', 'dry_run')
+    ordering = ('-created_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(AttendanceSession)
+class AttendanceSessionAdmin(admin.ModelAdmin):
+    list_display = ('group', 'lecture', 'opened_by', 'opened_at', 'closed_at')
+    list_filter = ('group__course',)
+    readonly_fields = ('lecture', 'group', 'opened_by', 'opened_at', 'closed_at')
+    actions = ['close_sessions']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Close selected sessions (mark everyone not scanned absent)')
+    def close_sessions(self, request, queryset):
+        absent = 0
+        for session in queryset.filter(closed_at__isnull=True):
+            absent += close_session(session)[1]
+        messages.success(request, f'Sessions closed, {absent} absent records written.')
+
+@admin.register(ScanEvent)
+class ScanEventAdmin(admin.ModelAdmin):
+    list_display = ('university_id', 'group', 'lecture', 'status', 'scanned_at', 'device_id', 'result', 'received_at')
+    list_filter = ('result', 'status', 'device_id')
+    search_fields = ('university_id', 'idempotency_key')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(AttendanceSummary)
+class AttendanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ('student', 'course', 'present', 'absent', 'late', 'excused', 'last_lecture_at')
+    list_filter = ('course',)
+    search_fields = ('student__name', 'student__university_id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,143 @@
+# doctors/analytics.py
+"""
+Attendance analytics on a course's students x lectures status matrix
+(``exports.AttendanceMatrix``, int8 codes 0 = no record, 1 = P, 2 = A,
+3 = L, 4 = E).
+
+Every metric is computed for all students at once with NumPy: absence and
+late totals, the longest and the current run of consecutive absences, the
+share of attended lectures the student was late to, and the lecture at
+which the student crossed the warning threshold. The warning rule itself
+(``is_at_risk``) and its wording (``warning_status_text``) live here too, so
+the dashboard, the course report, student search and the API agree.
+``benchmark_analytics`` compares the engine with the equivalent Python loops.
+"""
+import numpy as np
+
+from .exports import STATUS_CODES, AttendanceMatrix
+
+# حد الإنذار: 3 غيابات في نفس المقرر
+WARNING_THRESHOLD = 3
+
+PRESENT, ABSENT, LATE, EXCUSED = range(1, len(STATUS_CODES) + 1)
+
+
+def is_at_risk(absences, threshold=WARNING_THRESHOLD):
+    """The warning rule; works on a count or on a NumPy array of counts."""
+    return absences >= threshold
+
+
+def warning_status_text(warning_courses):
+    """Risk label of a student from their courses over the threshold (dicts with 'absences' and 'course_code')."""
+    if len(warning_courses) > 1:
+        return f"High Risk ({len(warning_courses)} Courses)"
+    if warning_courses:
+        return f"High Risk ({warning_courses[0]['absences']} Absences in {warning_courses[0]['course_code']})"
+    return "Safe (0)"
+
+
+def absence_streaks(statuses):
+    """
+    (longest, current) runs of consecutive absences per row of ``statuses``.
+    Cells without a record (lectures of the course's other groups) are not
+    the student's lectures, so they neither extend nor break a run.
+    """
+    # نزق خانات "مافيش سجل" لأول الصف وسيب المحاضرات المسجلة بترتيبها في الآخر
+    order = np.argsort(statuses != 0, axis=1, kind='stable')
+    absent = np.take_along_axis(statuses, order, axis=1) == ABSENT
+    students, lectures = absent.shape
+    if lectures == 0:
+        # مقرر جديد من غير محاضرات: argmin على محور فاضي بيرمي ValueError
+        return np.zeros(students, dtype=np.int32), np.zeros(students, dtype=np.int32)
+    # بداية ونهاية كل run من الغياب: فرق المصفوفة بعد ما نحط صفر في الأول والآخر
+    edges = np.diff(np.pad(absent.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)
+    longest = np.zeros(students, dtype=np.int32)
+    np.maximum.at(longest, start_rows, end_cols - start_cols)
+
+    trailing = absent[:, ::-1]
+    current = np.where(trailing.all(axis=1), lectures, np.argmin(trailing, axis=1)).astype(np.int32)
+    return longest, current
+
+
+class CourseAnalytics:
+    """Per-student metrics of one course, as arrays aligned with ``matrix.students``."""
+
+    def __init__(self, matrix, threshold=WARNING_THRESHOLD):
+        self.matrix = matrix
+        self.threshold = threshold
+        statuses = matrix.statuses
+        self.absences = matrix.counts[:, ABSENT - 1]
+        self.lates = matrix.counts[:, LATE - 1]
+        attended = matrix.counts[:, PRESENT - 1] + self.lates
+        self.late_ratio = np.round(
+            np.divide(self.lates, attended, out=np.zeros(len(attended)), where=attended > 0), 3
+        )
+        self.longest_streak, self.current_streak = absence_streaks(statuses)
+        self.at_risk = is_at_risk(self.absences, threshold)
+        # رقم المحاضرة اللي الطالب وصل فيها لحد الإنذار (-1 = لسه)
+        if statuses.shape[1]:
+            crossed = np.cumsum(statuses == ABSENT, axis=1) >= threshold
+            self.crossed_at = np.where(crossed.any(axis=1), np.argmax(crossed, axis=1), -1)
+        else:
+            self.crossed_at = np.full(len(statuses), -1)
+
+    @classmethod
+    def for_course(cls, course, student_ids=None, threshold=WARNING_THRESHOLD):
+        return cls(AttendanceMatrix.for_course(course, student_ids=student_ids), threshold)
+
+    def crossed_on(self, i):
+        """Date of the lecture at which student ``i`` reached the threshold, or None."""
+        index = self.crossed_at[i]
+        return self.matrix.lectures[index][1] if index >= 0 else None
+
+    def by_student(self):
+        """{student pk: metrics dict}."""
+        return {
+            pk: {
+                'absences': int(self.absences[i]),
+                'lates': int(self.lates[i]),
+                'late_ratio': float(self.late_ratio[i]),
+                'longest_streak': int(self.longest_streak[i]),
+                'current_streak': int(self.current_streak[i]),
+                'at_risk': bool(self.at_risk[i]),
+                'crossed_on': self.crossed_on(i),
+            }
+            for i, (pk, _, _) in enumerate(self.matrix.students)
+        }
+
+
+def reference_metrics(rows, threshold=WARNING_THRESHOLD):
+    """
+    The same metrics with plain Python loops over lists of status codes, the
+    way the views used to compute them; used by the benchmark and the tests.
+    """
+    results = []
+    for row in rows:
+        absences = lates = present = longest = run = 0
+        crossed_at = -1
+        for j, code in enumerate(row):
+            if code == ABSENT:
+                absences += 1
+                run += 1
+                longest = max(longest, run)
+                if absences == threshold:
+                    crossed_at = j
+            elif code:
+                run = 0
+                if code == LATE:
+                    lates += 1
+                elif code == PRESENT:
+                    present += 1
+        attended = present + lates
+        results.append({
+            'absences': absences,
+            'lates': lates,
+            'late_ratio': round(lates / attended, 3) if attended else 0.0,
+            'longest_streak': longest,
+            'current_streak': run,
+            'at_risk': absences >= threshold,
+            'crossed_at': crossed_at,
+        })
+    return results
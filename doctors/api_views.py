@@ -1,18 +1,23 @@
 # doctors/api_views.py
 import os
+from django.conf import settings
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
 from django.db.models import Q, Count
-from .models import Student, DoctorProfile, Announcement, Course
+from django.utils.dateparse import parse_date
+from .models import Student, DoctorProfile, Announcement, Course, Group, AttendanceRecord
 from .serializers import (
     StudentProfileSerializer,
     AnnouncementSerializer,
     AttendanceRecordSerializer,
 )
 from .serializers import WARNING_THRESHOLD
+from .analytics import is_at_risk
+from .scan_sync import apply_scan_events
+from .trends import BUCKETS, attendance_series, series_payload
 
 class StudentProfileView(APIView):
     permission_classes = [permissions.AllowAny] 
@@ -120,43 +125,41 @@ class StudentStatisticsView(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        records = student.attendance_records.all()
-
-        # Overall counters
-        total = records.count()
-        present = records.filter(status='P').count()
-        absent = records.filter(status='A').count()
-        late = records.filter(status='L').count()
-        excused = records.filter(status='E').count()
-        attended = present + late
-        attendance_rate = round((attended / total) * 100, 2) if total else 0.0
+        # العدادات جاهزة في AttendanceSummary (صف لكل مقرر)، والإجمالي بيتحسب منها.
+        # الترتيب بالـ pk = ترتيب أول سجل للطالب في كل مقرر.
+        rows = (
+            student.attendance_summaries
+            .values('course__code', 'course__name', 'present', 'absent', 'late', 'excused')
+            .order_by('pk')
+        )
 
         # Per-course breakdown
         per_course = []
-        course_codes = records.values_list(
-            'lecture__course__code', flat=True
-        ).distinct()
-        for code in course_codes:
-            sub = records.filter(lecture__course__code=code)
-            sub_total = sub.count()
-            sub_present = sub.filter(status='P').count()
-            sub_absent = sub.filter(status='A').count()
-            sub_late = sub.filter(status='L').count()
-            sub_excused = sub.filter(status='E').count()
-            sub_attended = sub_present + sub_late
-            sub_rate = round((sub_attended / sub_total) * 100, 2) if sub_total else 0.0
-            course = sub.first().lecture.course
+        total = present = absent = late = excused = 0
+        for row in rows:
+            row['total'] = row['present'] + row['absent'] + row['late'] + row['excused']
+            sub_attended = row['present'] + row['late']
+            sub_rate = round((sub_attended / row['total']) * 100, 2) if row['total'] else 0.0
             per_course.append({
-                'course_code': code,
-                'course_name': course.name,
-                'total_lectures': sub_total,
-                'present': sub_present,
-                'absent': sub_absent,
-                'late': sub_late,
-                'excused': sub_excused,
+                'course_code': row['course__code'],
+                'course_name': row['course__name'],
+                'total_lectures': row['total'],
+                'present': row['present'],
+                'absent': row['absent'],
+                'late': row['late'],
+                'excused': row['excused'],
                 'attendance_rate': sub_rate,
-                'is_at_risk': sub_absent >= WARNING_THRESHOLD,
+                'is_at_risk': is_at_risk(row['absent']),
             })
+            total += row['total']
+            present += row['present']
+            absent += row['absent']
+            late += row['late']
+            excused += row['excused']
+
+        # Overall counters
+        attended = present + late
+        attendance_rate = round((attended / total) * 100, 2) if total else 0.0
 
         return Response({
             'university_id': university_id,
@@ -226,6 +229,106 @@ class StudentProfilePictureUploadView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class ScanEventSyncView(APIView):
+    """
+    Offline batch sync for kiosks / the Flutter app: uploads buffered scans in one call.
+    مسار الـ API: POST /api/attendance/scan-events/sync/
+
+    Body: {"device_id": "...", "events": [{"idempotency_key", "university_id",
+    "group_id", "scanned_at" (ISO 8601), "status" (P|L, default P)}, ...]}
+    Every event gets a result (applied, duplicate, invalid, unknown_student,
+    not_in_group, forbidden, no_lecture) in the same order, so the client can
+    drop what was accepted and safely retry the whole batch.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, format=None):
+        events = request.data.get('events')
+        if not isinstance(events, list):
+            return Response({"detail": "'events' must be a list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(events) > settings.SCAN_SYNC_MAX_EVENTS:
+            return Response(
+                {"detail": f"Too many events: send at most {settings.SCAN_SYNC_MAX_EVENTS} per call."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        results = apply_scan_events(events, request.user, device_id=str(request.data.get('device_id') or '')[:100])
+        summary = {}
+        for result in results:
+            summary[result['result']] = summary.get(result['result'], 0) + 1
+        return Response({
+            'received': len(events),
+            'summary': summary,
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+
+def _trend_params(request):
+    """(bucket, since, until) from the query string, or an error Response."""
+    bucket = request.query_params.get('bucket', 'week')
+    if bucket not in BUCKETS:
+        return None, Response({"detail": f"bucket must be one of {sorted(BUCKETS)}."}, status=status.HTTP_400_BAD_REQUEST)
+    dates = []
+    for name in ('since', 'until'):
+        value = request.query_params.get(name)
+        parsed = parse_date(value) if value else None
+        if value and parsed is None:
+            return None, Response({"detail": f"{name} must be a YYYY-MM-DD date."}, status=status.HTTP_400_BAD_REQUEST)
+        dates.append(parsed)
+    return (bucket, *dates), None
+
+
+class AttendanceTrendView(APIView):
+    """
+    Attendance counts and rate per week (or day) of a course or group, for the doctor's charts.
+    مسار الـ API: GET /api/attendance/trends/<course|group>/<id>/?bucket=week&since=2026-02-01&until=2026-06-30
+
+    The series are column-wise: {"buckets": [bucket start dates], "total": [...],
+    "present": [...], "absent": [...], "late": [...], "excused": [...], "rate": [...]}.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, scope, pk, format=None):
+        if scope not in ('course', 'group'):
+            return Response({"detail": "scope must be 'course' or 'group'."}, status=status.HTTP_404_NOT_FOUND)
+        params, error = _trend_params(request)
+        if error:
+            return error
+        if scope == 'course':
+            courses = Course.objects.all() if request.user.is_superuser else Course.objects.filter(doctor=request.user)
+            course = get_object_or_404(courses, pk=pk)
+            records, course_id = AttendanceRecord.objects.filter(lecture__course=course), course.pk
+        else:
+            groups = Group.objects.all() if request.user.is_superuser else Group.objects.filter(course__doctor=request.user)
+            group = get_object_or_404(groups, pk=pk)
+            records, course_id = AttendanceRecord.objects.filter(lecture__group=group), group.course_id
+
+        bucket, since, until = params
+        series = attendance_series(scope, pk, records, {course_id}, bucket=bucket, since=since, until=until)
+        return Response({'scope': scope, 'id': pk, 'bucket': bucket, **series_payload(series['buckets'])})
+
+
+class StudentAttendanceTrendView(APIView):
+    """
+    The same series for one student over all their courses (Flutter app).
+    مسار الـ API: GET /api/student/trends/<university_id>/?bucket=week
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, university_id, format=None):
+        params, error = _trend_params(request)
+        if error:
+            return error
+        student = get_object_or_404(Student, university_id=university_id)
+        bucket, since, until = params
+        records = AttendanceRecord.objects.filter(student=student)
+        # كورسات الجروبات الحالية + أي كورس ليه فيه سجلات قديمة
+        course_ids = set(student.groups.values_list('course_id', flat=True))
+        course_ids |= set(records.values_list('lecture__course_id', flat=True).distinct())
+        series = attendance_series('student', student.pk, records, course_ids, bucket=bucket, since=since, until=until)
+        return Response({'university_id': university_id, 'bucket': bucket, **series_payload(series['buckets'])})
+
+
 class ApiHealthCheckView(APIView):
     """Simple liveness probe for monitoring / Flutter offline detection."""
     permission_classes = [permissions.AllowAny]
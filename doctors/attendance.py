@@ -0,0 +1,360 @@
+# doctors/attendance.py
+"""
+Attendance sessions for the face endpoints.
+
+A doctor (or the first kiosk) opens an ``AttendanceSession`` for a group's
+lecture; any number of devices then scan into it. At most one session per
+group is open at a time (a partial unique constraint plus a row lock on the
+group), so two kiosks can no longer create two lectures, and a late scan
+does not re-open a session the doctor closed. Present marks are
+upserted as students are recognised and the absent rows for everybody else
+are inserted in one bulk insert when the session closes.
+
+``ActiveSession`` keeps what a scan needs in process memory (the session,
+the roster as university_id -> student and each student's status in the
+lecture), so a recognised student is resolved with no database reads and
+marked with one record write plus one ``F()`` delta on their summary.
+Every worker checks a per-group generation number in the Django cache on
+each scan; closing a session and the signals in ``signals.py`` bump it, and
+the next scan reloads.
+"""
+import threading
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from .models import AttendanceRecord, AttendanceSession, AttendanceStatus, Group, Lecture
+from .summaries import schedule_summary_refresh, shift_summaries
+from .trends import note_attendance_changes
+
+GENERATION_KEY = 'face-session-generation:{}'
+# مرات محاولة فتح الجلسة لو الجلسة اللي سبقتنا اتقفلت في نفس اللحظة
+OPEN_ATTEMPTS = 3
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class SessionConflict(Exception):
+    """The group already has an open session for a different lecture."""
+
+    def __init__(self, session):
+        super().__init__(f"Group {session.group_id} already has an open session for '{session.lecture.topic}'.")
+        self.session = session
+
+
+class SessionClosed(Exception):
+    """The session for this lecture was closed; scans may not open it again."""
+
+    def __init__(self, group_id, lecture_topic):
+        super().__init__(f"The session of group {group_id} for '{lecture_topic}' was closed.")
+        self.lecture_topic = lecture_topic
+
+
+class RosterEntry(NamedTuple):
+    pk: int
+    name: str
+    university_id: str
+    image_url: str
+
+
+# ==============================================
+# Opening / closing sessions
+# ==============================================
+
+def _open_session_for(group):
+    return (
+        AttendanceSession.objects.select_related('lecture')
+        .filter(group=group, closed_at__isnull=True).first()
+    )
+
+
+def _closed_today(group, lecture_topic, today):
+    return AttendanceSession.objects.filter(
+        group=group, lecture__topic=lecture_topic, lecture__date_time__date=today, closed_at__isnull=False
+    ).exists()
+
+
+def open_session(group, lecture_topic, user=None, reopen=True):
+    """
+    Return the group's open session for ``lecture_topic`` today, opening one
+    (and today's lecture for the topic) when there is none. A session left
+    open from a previous day is closed first; an open session for another
+    topic raises ``SessionConflict``. With ``reopen=False`` (scans) a lecture
+    whose session was already closed today raises ``SessionClosed`` instead
+    of being opened again.
+    """
+    # اليوم بتوقيت الجامعة، نفس التوقيت اللي date_time__date بيقارن بيه
+    today = timezone.localdate()
+    with transaction.atomic():
+        # قفل على صف المجموعة: جهازين بيفتحوا في نفس اللحظة بيستنوا بعض
+        Group.objects.select_for_update().filter(pk=group.pk).exists()
+        session = _open_session_for(group)
+        if session and timezone.localdate(session.lecture.date_time) < today:
+            close_session(session)
+            session = None
+        if session:
+            if session.lecture.topic != lecture_topic:
+                raise SessionConflict(session)
+            return session
+        if not reopen and _closed_today(group, lecture_topic, today):
+            # الدكتور قفل الجلسة: scan متأخر من الكشك مايفتحهاش تاني ويقفل المجموعة على باقي المحاضرات
+            raise SessionClosed(group.pk, lecture_topic)
+
+        lecture, _ = Lecture.objects.get_or_create(
+            group=group,
+            course=group.course,
+            date_time__date=today,
+            topic=lecture_topic,
+            defaults={
+                'date_time': timezone.now()
+            }
+        )
+        for attempt in range(1, OPEN_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    return AttendanceSession.objects.create(lecture=lecture, group=group, opened_by=user)
+            except IntegrityError:
+                # قاعدة بيانات من غير row locks (SQLite): جهاز تاني لحق يفتح الجلسة
+                session = _open_session_for(group)
+                if session is None:
+                    # واتقفلت قبل ما نقراها: نحاول نفتح تاني، ولو فضل الخطأ يبقى مش من الجلسة المفتوحة
+                    if attempt == OPEN_ATTEMPTS:
+                        raise
+                    if not reopen and _closed_today(group, lecture_topic, today):
+                        raise SessionClosed(group.pk, lecture_topic)
+                    continue
+                if session.lecture.topic != lecture_topic:
+                    raise SessionConflict(session)
+                return session
+
+
+def close_session(session):
+    """
+    Close ``session``: one bulk insert of ABSENT rows for the roster students
+    that were not marked. Returns ``(session, absent_count)``; closing an
+    already closed session is a no-op.
+    """
+    with transaction.atomic():
+        session = AttendanceSession.objects.select_for_update().select_related('lecture').get(pk=session.pk)
+        if session.closed_at:
+            return session, 0
+        marked = set(
+            AttendanceRecord.objects.filter(lecture_id=session.lecture_id).values_list('student_id', flat=True)
+        )
+        absent = [
+            AttendanceRecord(lecture_id=session.lecture_id, student_id=pk, status=AttendanceStatus.ABSENT)
+            for pk in Group.students.through.objects.filter(group_id=session.group_id).values_list('student_id', flat=True)
+            if pk not in marked
+        ]
+        AttendanceRecord.objects.bulk_create(absent, ignore_conflicts=True, batch_size=500)
+        schedule_summary_refresh((record.student_id, session.lecture.course_id) for record in absent)
+        if absent:
+            note_attendance_changes([(session.lecture.course_id, session.lecture.date_time)])
+        session.closed_at = timezone.now()
+        session.save(update_fields=['closed_at'])
+        group_id = session.group_id
+        transaction.on_commit(lambda: invalidate_group_sessions(group_id))
+    return session, len(absent)
+
+
+# ==============================================
+# Whole-lecture imports (scanner files)
+# ==============================================
+
+BULK_BATCH_SIZE = 500
+
+
+class LectureImport(NamedTuple):
+    lecture: Lecture
+    present_count: int
+    absent_count: int
+    unmatched_ids: list
+
+
+def record_lecture_attendance(group, lecture_topic, university_ids, date_time=None):
+    """
+    Create a lecture for ``group`` with one record per roster student:
+    present when their ID is in ``university_ids`` (any iterable, consumed
+    lazily), absent otherwise. The IDs are read before anything is written,
+    then the lecture and all its records go in one transaction with
+    ``bulk_create``. IDs that are not in the group are returned sorted.
+    """
+    roster = dict(group.students.values_list('university_id', 'pk'))
+    present, unmatched = set(), set()
+    for university_id in university_ids:
+        pk = roster.get(university_id)
+        if pk is None:
+            unmatched.add(university_id)
+        else:
+            present.add(pk)
+
+    with transaction.atomic():
+        lecture = Lecture.objects.create(
+            course=group.course,
+            group=group,
+            topic=lecture_topic,
+            date_time=date_time or timezone.now()
+        )
+        AttendanceRecord.objects.bulk_create(
+            [
+                AttendanceRecord(
+                    lecture=lecture,
+                    student_id=pk,
+                    status=AttendanceStatus.PRESENT if pk in present else AttendanceStatus.ABSENT
+                )
+                for pk in roster.values()
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        schedule_summary_refresh((pk, group.course_id) for pk in roster.values())
+        note_attendance_changes([(group.course_id, lecture.date_time)])
+    return LectureImport(lecture, len(present), len(roster) - len(present), sorted(unmatched))
+
+
+# ==============================================
+# In-memory session for the scan hot path
+# ==============================================
+
+class ActiveSession:
+    """Everything a scan into an open session needs, loaded once."""
+
+    def __init__(self, session, group, roster, statuses, generation):
+        self.session = session
+        self.lecture = session.lecture
+        self.group = group
+        self.roster = roster
+        # student pk -> status of their record in this lecture (manual edits reload the session)
+        self.statuses = statuses
+        self.present = {pk for pk, status in statuses.items() if status == AttendanceStatus.PRESENT}
+        self.generation = generation
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, group, lecture_topic, generation, user=None, reopen=False):
+        session = open_session(group, lecture_topic, user=user, reopen=reopen)
+        roster = {
+            s.university_id: RosterEntry(s.pk, s.name, s.university_id, s.image.url if s.image else '')
+            for s in group.students.only('pk', 'name', 'university_id', 'image')
+        }
+        statuses = dict(
+            AttendanceRecord.objects.filter(lecture_id=session.lecture_id).values_list('student_id', 'status')
+        )
+        return cls(session, group, roster, statuses, generation)
+
+    def mark_present(self, student_pk):
+        """Mark one student present; False (and no query) when they already are."""
+        return bool(self.mark_many_present([student_pk]))
+
+    def mark_many_present(self, student_pks):
+        """
+        Write every student in ``student_pks`` that is not present yet: one
+        insert (or status update) for the records and one ``F()`` delta
+        UPDATE for their summaries, in one transaction.
+        """
+        with self.lock:
+            new = set(student_pks) - self.present
+            self.present |= new
+            previous = {pk: self.statuses.get(pk) for pk in new}
+        if new:
+            try:
+                try:
+                    with transaction.atomic():
+                        self._write_present(previous)
+                except IntegrityError:
+                    # worker تاني سجل الطالب ده في نفس المحاضرة: upsert وإعادة حساب الملخص
+                    with transaction.atomic():
+                        self._upsert_present(new)
+            except Exception:
+                with self.lock:
+                    self.present -= new
+                raise
+            with self.lock:
+                self.statuses.update(dict.fromkeys(new, AttendanceStatus.PRESENT))
+            note_attendance_changes([(self.lecture.course_id, self.lecture.date_time)])
+        return new
+
+    def _write_present(self, previous):
+        """
+        Apply the status changes this worker expects. Raises ``IntegrityError``
+        when a record it thought missing exists; records whose status moved
+        under it go through ``_upsert_present``.
+        """
+        moves = {}
+        for pk, status in previous.items():
+            moves.setdefault(status, []).append(pk)
+        stale = []
+        for status, pks in list(moves.items()):
+            if status is None:
+                AttendanceRecord.objects.bulk_create(
+                    [AttendanceRecord(lecture_id=self.lecture.pk, student_id=pk, status=AttendanceStatus.PRESENT)
+                     for pk in pks]
+                )
+            elif AttendanceRecord.objects.filter(
+                lecture_id=self.lecture.pk, student_id__in=pks, status=status
+            ).update(status=AttendanceStatus.PRESENT) != len(pks):
+                stale.extend(moves.pop(status))
+        if stale:
+            self._upsert_present(stale)
+        shift_summaries(
+            self.lecture.course_id, self.group.course.doctor_id, moves, AttendanceStatus.PRESENT, self.lecture.date_time
+        )
+
+    def _upsert_present(self, student_pks):
+        AttendanceRecord.objects.bulk_create(
+            [AttendanceRecord(lecture_id=self.lecture.pk, student_id=pk, status=AttendanceStatus.PRESENT)
+             for pk in student_pks],
+            update_conflicts=True,
+            unique_fields=['lecture', 'student'],
+            update_fields=['status'],
+        )
+        schedule_summary_refresh((pk, self.lecture.course_id) for pk in student_pks)
+
+
+def _generation(group_id):
+    return cache.get(GENERATION_KEY.format(group_id), 0)
+
+
+def invalidate_group_sessions(*group_ids):
+    """Make every worker reload its sessions for these groups on the next scan."""
+    for group_id in group_ids:
+        key = GENERATION_KEY.format(group_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+
+def get_active_session(group_id, lecture_topic, group=None, user=None, reopen=False):
+    """
+    The cached open session of ``group_id`` for ``lecture_topic`` (opened if
+    needed, reloaded after invalidation). ``group`` may be passed when the
+    caller already fetched it, e.g. with an ownership check. Only an explicit
+    open (``reopen=True``) opens a lecture whose session was closed today;
+    scans get ``SessionClosed``.
+    """
+    group_id = int(group_id)
+    key = (group_id, lecture_topic, timezone.localdate())
+    generation = _generation(group_id)
+    session = _sessions.get(key)
+    if session is not None and session.generation == generation:
+        return session
+
+    if group is None:
+        group = get_object_or_404(Group.objects.select_related('course'), id=group_id)
+    session = ActiveSession.load(group, lecture_topic, generation, user=user, reopen=reopen)
+    with _sessions_lock:
+        # جلسات الأيام اللي فاتت مالهاش لازمة
+        for stale in [k for k in _sessions if k[2] != key[2]]:
+            del _sessions[stale]
+        _sessions[key] = session
+    return session
+
+
+def reset_sessions():
+    with _sessions_lock:
+        _sessions.clear()
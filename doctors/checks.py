@@ -0,0 +1,33 @@
+# doctors/checks.py
+"""
+System checks for settings the attendance features depend on.
+
+The face session generations (``attendance.py``), the per-doctor dashboard
+warnings version (``summaries.py``) and the trend change log (``trends.py``)
+are counters in the default Django cache that every worker must see. With a
+process-local cache each gunicorn worker keeps its own counters, so a worker
+goes on serving a closed session or stale warnings and trends.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f"The default cache ({backend}) is not shared between worker processes.",
+        hint=(
+            "Face sessions, dashboard warnings and attendance trends keep their invalidation "
+            "counters in the default cache. Set DJANGO_CACHE_BACKEND / DJANGO_CACHE_LOCATION "
+            "to Redis or Memcached."
+        ),
+        id='doctors.E001',
+    )]
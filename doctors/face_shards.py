@@ -0,0 +1,173 @@
+# doctors/face_shards.py
+"""
+Face collections sharded by course (or group).
+
+Besides the global collection, every student is indexed into one shard per
+course they are enrolled in (``FACE_SHARD_KEY``). A scan for a lecture only
+searches that course's shard, so the search space is the roster instead of
+the whole university. Only a shard that cannot be searched (not built yet)
+sends the scan to the global collection, and it is skipped for
+``SHARD_RETRY_SECONDS`` afterwards. Shards follow ``Student.groups`` through
+the m2m signal in ``signals.py``; sharding is off until ``sync_face_shards``
+has built them and ``FACE_SHARD_KEY`` is set.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Student, StudentFaceShard
+from .recognition import get_recognition_backend, RecognitionUnavailable
+
+logger = logging.getLogger(__name__)
+
+# مزامنة الـ shards بتتعمل في الخلفية عشان رفع شيت طلاب مايستناش AWS
+_sync_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='face-shards')
+
+# shard اتبحث فيه ومالقيناهوش: نستخدم الـ collection العام على طول لحد ما المدة دي تخلص
+SHARD_RETRY_SECONDS = 300
+_missing_shards = {}
+
+
+def shard_collection_id(group):
+    """Collection that holds the faces for ``group``'s roster, or None when sharding is off."""
+    key = settings.FACE_SHARD_KEY
+    if key == 'course':
+        return f'{settings.FACE_COLLECTION_ID}-course-{group.course_id}'
+    if key == 'group':
+        return f'{settings.FACE_COLLECTION_ID}-group-{group.pk}'
+    return None
+
+
+def search_for_group(image_bytes, group, max_faces=1, backend=None):
+    """Search the group's shard (the global collection when it cannot be searched)."""
+    return search_in_shard(image_bytes, shard_collection_id(group), max_faces=max_faces, backend=backend)
+
+
+def search_in_shard(image_bytes, shard, max_faces=1, backend=None):
+    """
+    ``search_for_group`` with the shard collection id already resolved (None =
+    global only). Touches no models, so it is safe to call from worker threads.
+    A shard that answers is trusted: no match there means the face is not on
+    the roster, so the global collection is not searched again.
+    """
+    backend = backend or get_recognition_backend()
+    if shard and _missing_shards.get(shard, 0) <= time.monotonic():
+        try:
+            return backend.search_faces(image_bytes, max_faces=max_faces, collection_id=shard)
+        except RecognitionUnavailable:
+            raise
+        except Exception:
+            # shard not built yet (e.g. ResourceNotFoundException) -> global search
+            logger.warning("Face shard %s unavailable, falling back to the global collection", shard, exc_info=True)
+            _missing_shards[shard] = time.monotonic() + SHARD_RETRY_SECONDS
+    return backend.search_faces(image_bytes, max_faces=max_faces)
+
+
+def forget_missing_shards():
+    """Search every shard again on the next scan (used by tests)."""
+    _missing_shards.clear()
+
+
+def plan_shard_sync(student, reindex=False):
+    """
+    What syncing the student's shards takes, read from their (prefetched)
+    groups and shard rows: ``(targets, existing, stale)`` = collections to
+    index the photo into, {collection_id: shard row} of the shards they keep
+    and the rows of shards they left. ``reindex`` also replaces existing
+    shard faces (after the student's photo changed).
+    """
+    wanted = {shard_collection_id(group) for group in student.groups.all()}
+    existing = {shard.collection_id: shard for shard in student.face_shards.all()}
+    stale = [existing.pop(collection_id) for collection_id in set(existing) - wanted]
+    targets = wanted if reindex else wanted - set(existing)
+    if not student.image:
+        targets = set()
+    return targets, existing, stale
+
+
+def sync_shard_faces(student, targets, existing, stale, backend, before_call=None, ensured=frozenset()):
+    """
+    The recognition calls of a shard sync: drop the faces of ``stale``
+    shards, index the photo into ``targets`` and delete the faces it
+    replaced. Touches no models, so it can run on worker threads;
+    ``before_call`` runs before every call (a rate limiter) and collections
+    in ``ensured`` (only read here) are taken as already created. Returns {collection_id: face_id}.
+    """
+    wait = before_call or (lambda: None)
+    for shard in stale:
+        wait()
+        backend.delete_faces([shard.face_id], collection_id=shard.collection_id)
+    if not targets:
+        return {}
+    with open(student.image.path, 'rb') as image_file:
+        image_bytes = image_file.read()
+    indexed = {}
+    for collection_id in targets:
+        if collection_id not in ensured:
+            wait()
+            backend.ensure_collection(collection_id)
+        wait()
+        face_id = backend.index_face(image_bytes, student.university_id, collection_id=collection_id)
+        if not face_id:
+            continue
+        previous = existing.get(collection_id)
+        if previous:
+            wait()
+            backend.delete_faces([previous.face_id], collection_id=collection_id)
+        indexed[collection_id] = face_id
+    return indexed
+
+
+def save_shard_faces(student, stale, indexed):
+    """Write the outcome of ``sync_shard_faces`` to ``StudentFaceShard``."""
+    if stale:
+        StudentFaceShard.objects.filter(pk__in=[shard.pk for shard in stale]).delete()
+    for collection_id, face_id in indexed.items():
+        StudentFaceShard.objects.update_or_create(
+            student=student, collection_id=collection_id, defaults={'face_id': face_id}
+        )
+
+
+def sync_student_shards(student, reindex=False, backend=None):
+    """
+    Make the student's shard faces match their current groups: index into new
+    shards, delete from shards they left. ``reindex`` also replaces existing
+    shard faces (after the student's photo changed).
+    """
+    if not settings.FACE_SHARD_KEY:
+        return
+    backend = backend or get_recognition_backend()
+    targets, existing, stale = plan_shard_sync(student, reindex=reindex)
+    save_shard_faces(student, stale, sync_shard_faces(student, targets, existing, stale, backend))
+
+
+def sync_students_shards(student_ids, reindex=False):
+    """Sync several students; one student's failure is logged and does not stop the rest."""
+    for student in Student.objects.filter(pk__in=student_ids).prefetch_related('groups', 'face_shards'):
+        try:
+            sync_student_shards(student, reindex=reindex)
+        except Exception:
+            logger.exception("Could not sync face shards for student %s", student.pk)
+
+
+def _sync_in_background(student_ids, reindex):
+    # الـ thread ده ليه اتصال داتابيز خاص بيه ومفيش request يقفله: نقفله بعد كل مهمة
+    close_old_connections()
+    try:
+        sync_students_shards(student_ids, reindex)
+    finally:
+        close_old_connections()
+
+
+def schedule_shard_sync(student_ids, reindex=False):
+    """Sync shards for these students once the current transaction commits."""
+    if not settings.FACE_SHARD_KEY or not student_ids:
+        return
+    student_ids = list(student_ids)
+    if settings.FACE_SHARD_SYNC_ASYNC:
+        transaction.on_commit(lambda: _sync_pool.submit(_sync_in_background, student_ids, reindex))
+    else:
+        transaction.on_commit(lambda: sync_students_shards(student_ids, reindex))
@@ -0,0 +1,206 @@
+# doctors/imaging.py
+"""Server-side image helpers for the face attendance flow (Pillow based)."""
+import io
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# هامش حوالين الوش عشان محرك التعرف يشوف الدقن والشعر
+CROP_MARGIN = 0.25
+MIN_CROP_EDGE = 80
+
+
+def open_frame(image_bytes):
+    """Decode a camera frame once, honouring its EXIF orientation."""
+    image = Image.open(io.BytesIO(image_bytes))
+    return ImageOps.exif_transpose(image).convert('RGB')
+
+
+def encode_jpeg(image, quality=90):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def crop_box(image, box, margin=CROP_MARGIN):
+    """The region of ``box`` (ratios of the frame size) widened by ``margin`` on each side."""
+    width, height = image.size
+    pad_x = box.width * width * margin
+    pad_y = box.height * height * margin
+    left = max(0, int(box.left * width - pad_x))
+    top = max(0, int(box.top * height - pad_y))
+    right = min(width, max(left + 1, int((box.left + box.width) * width + pad_x)))
+    bottom = min(height, max(top + 1, int((box.top + box.height) * height + pad_y)))
+    return image.crop((left, top, right, bottom))
+
+
+def crop_faces(image, boxes, margin=CROP_MARGIN):
+    """
+    Cut every detected face out of ``image`` (a decoded frame) and return the
+    crops as JPEG bytes, in the same order as ``boxes``. Boxes are ratios of
+    the frame size and are widened by ``margin`` on each side.
+    """
+    crops = []
+    for box in boxes:
+        crop = crop_box(image, box, margin)
+        if min(crop.size) < MIN_CROP_EDGE:
+            # Rekognition rejects tiny images, so upscale far-away faces
+            scale = MIN_CROP_EDGE / max(1, min(crop.size))
+            crop = crop.resize((max(1, int(crop.width * scale)), max(1, int(crop.height * scale))))
+        crops.append(encode_jpeg(crop))
+    return crops
+
+
+# ==============================================
+# Frame preprocessing before recognition
+# ==============================================
+
+FRAME_COUNTERS = (
+    'frames.count', 'frames.bytes_in', 'frames.bytes_out',
+    'frames.preprocess_us', 'frames.upload_us_saved',
+)
+
+
+class PreparedFrame:
+    """A decoded, upright, downscaled frame plus the bytes we send to recognition."""
+
+    def __init__(self, image, jpeg, stats):
+        self.image = image
+        self.jpeg = jpeg
+        self.stats = stats
+
+
+def prepare_frame(image_bytes, max_edge=None, quality=None):
+    """
+    Decode once with Pillow (``image_bytes`` may be any bytes-like object,
+    e.g. a view over a reused upload buffer), fix EXIF orientation, shrink so the longest edge
+    is at most ``max_edge`` and re-encode at ``quality``. The original bytes
+    are kept when re-encoding would not make them smaller; a frame that had
+    to be shrunk is always re-encoded, and counts as saving nothing when the
+    result is bigger. Sizes and timings are returned in ``stats`` and added
+    to the pipeline counters.
+    """
+    started = time.perf_counter()
+    max_edge = max_edge or settings.FACE_FRAME_MAX_EDGE
+    quality = quality or settings.FACE_FRAME_JPEG_QUALITY
+
+    image = open_frame(image_bytes)
+    resized = max(image.size) > max_edge
+    if resized:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    jpeg = encode_jpeg(image, quality=quality)
+    if not resized and len(jpeg) >= len(image_bytes):
+        jpeg = bytes(image_bytes)
+
+    preprocess_ms = (time.perf_counter() - started) * 1000
+    # صورة مضغوطة أوي وأكبر من max_edge ممكن تكبر بعد التصغير: ده مش توفير سالب
+    bytes_saved = max(len(image_bytes) - len(jpeg), 0)
+    # الوقت الموفّر في رفع الصورة لخدمة التعرف على سرعة الـ uplink المضبوطة
+    upload_ms_saved = bytes_saved * 8 / (settings.FACE_UPLINK_KBPS * 1000) * 1000
+    stats = {
+        'bytes_in': len(image_bytes),
+        'bytes_out': len(jpeg),
+        'width': image.width,
+        'height': image.height,
+        'preprocess_ms': round(preprocess_ms, 2),
+        'upload_ms_saved': round(upload_ms_saved, 2),
+    }
+    metrics.incr('frames.count')
+    metrics.incr('frames.bytes_in', len(image_bytes))
+    metrics.incr('frames.bytes_out', len(jpeg))
+    metrics.incr('frames.preprocess_us', preprocess_ms * 1000)
+    metrics.incr('frames.upload_us_saved', upload_ms_saved * 1000)
+    logger.debug("Frame %(bytes_in)d -> %(bytes_out)d bytes in %(preprocess_ms).1f ms "
+                 "(~%(upload_ms_saved).0f ms upload saved)", stats)
+    return PreparedFrame(image, jpeg, stats)
+
+
+# ==============================================
+# Local quality prefilter (no network call for hopeless frames)
+# ==============================================
+
+QUALITY_REASONS = {
+    'blurry': 'الصورة مهزوزة، ثبّت الكاميرا وحاول مرة أخرى',
+    'too_dark': 'الإضاءة ضعيفة جداً',
+    'too_bright': 'الإضاءة قوية جداً (الصورة محروقة)',
+    'no_face': 'لا يوجد وجه واضح في منتصف الكاميرا',
+}
+QUALITY_COUNTERS = ('quality.checked',) + tuple(f'quality.rejected.{reason}' for reason in QUALITY_REASONS)
+QUALITY_ANALYSIS_EDGE = 320
+
+
+def assess_frame_quality(image):
+    """
+    Score a decoded frame with NumPy on a small grayscale/YCbCr copy:
+
+    - sharpness: variance of the 4-neighbour Laplacian (low = motion blur / out of focus)
+    - brightness: mean luma, 0-255
+    - skin_ratio: share of skin-coloured pixels (YCbCr box) in the central
+      region, a rough "is anybody in front of the camera" check
+
+    Returns ``(reason, scores)``; ``reason`` is None when the frame is usable.
+    """
+    small = image.copy()
+    small.thumbnail((QUALITY_ANALYSIS_EDGE, QUALITY_ANALYSIS_EDGE))
+    ycbcr = np.asarray(small.convert('YCbCr'), dtype=np.float32)
+    luma = ycbcr[..., 0]
+
+    laplacian = (
+        luma[:-2, 1:-1] + luma[2:, 1:-1] + luma[1:-1, :-2] + luma[1:-1, 2:] - 4 * luma[1:-1, 1:-1]
+    )
+    h, w = luma.shape
+    center = ycbcr[h // 5:h - h // 5, w // 5:w - w // 5]
+    cb, cr = center[..., 1], center[..., 2]
+    skin = (cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173)
+    scores = {
+        'sharpness': round(float(laplacian.var()), 1),
+        'brightness': round(float(luma.mean()), 1),
+        'skin_ratio': round(float(skin.mean()), 3),
+    }
+
+    reason = None
+    if scores['brightness'] < settings.FACE_MIN_BRIGHTNESS:
+        reason = 'too_dark'
+    elif scores['brightness'] > settings.FACE_MAX_BRIGHTNESS:
+        reason = 'too_bright'
+    elif scores['sharpness'] < settings.FACE_MIN_SHARPNESS:
+        reason = 'blurry'
+    elif scores['skin_ratio'] < settings.FACE_MIN_SKIN_RATIO:
+        reason = 'no_face'
+
+    metrics.incr('quality.checked')
+    if reason:
+        metrics.incr(f'quality.rejected.{reason}')
+    return reason, scores
+
+
+# ==============================================
+# Near-duplicate frames (kiosk mode)
+# ==============================================
+
+def frame_dhash(image, box=None, size=8):
+    """
+    64-bit difference hash of the face at ``box`` (the central part of the
+    frame when no box is given): nearly identical faces differ in only a few
+    bits. Hashing the face crop keeps a fixed kiosk's background and lighting
+    from making two students look alike.
+    """
+    if box is None:
+        w, h = image.size
+        region = image.crop((w // 5, h // 5, w - w // 5, h - h // 5))
+    else:
+        region = crop_box(image, box, margin=0)
+    pixels = np.asarray(region.convert('L').resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
@@ -0,0 +1,160 @@
+# doctors/ingest.py
+"""
+Streaming readers for attendance files (scanner exports), and the lecture
+lookup used to map timestamped scans to lectures.
+
+Each reader yields student IDs one at a time straight from the upload, so a
+big file is never decoded into one string or loaded into a DataFrame.
+"""
+import bisect
+import csv
+import io
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+
+from .models import AttendanceRecord, AttendanceStatus, Lecture
+
+ID_COLUMN_HINT = 'id'
+
+
+class AttendanceFileError(ValueError):
+    """The file cannot be read as an attendance list."""
+
+
+def _clean_id(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Excel بيخزن الأرقام الجامعية كـ float (20231001.0)
+        value = int(value)
+    return str(value).strip()
+
+
+def _ids_from_rows(rows):
+    """Rows with a header: yield the values of the first column whose name contains 'id'."""
+    header = next(rows, None)
+    if header is None:
+        return
+    names = [_clean_id(name).lower() for name in header]
+    column = next((i for i, name in enumerate(names) if ID_COLUMN_HINT in name), None)
+    if column is None:
+        raise AttendanceFileError('No student ID column found (expected a header containing "ID").')
+    for row in rows:
+        if column < len(row):
+            value = _clean_id(row[column])
+            if value:
+                yield value
+
+
+def iter_csv_ids(binary_file):
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        yield from _ids_from_rows(csv.reader(text))
+    finally:
+        text.detach()
+
+
+def iter_txt_ids(binary_file):
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig')
+    try:
+        for line in text:
+            value = line.strip()
+            if value:
+                yield value
+    finally:
+        text.detach()
+
+
+def iter_xlsx_ids(binary_file):
+    from openpyxl import load_workbook
+
+    # read_only: الصفوف بتتقري واحد ورا التاني من غير ما الشيت كله يتحمل
+    workbook = load_workbook(binary_file, read_only=True, data_only=True)
+    try:
+        yield from _ids_from_rows(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+READERS = {
+    '.csv': iter_csv_ids,
+    '.txt': iter_txt_ids,
+    '.xlsx': iter_xlsx_ids,
+}
+
+
+def iter_attendance_ids(uploaded_file):
+    """Student IDs from an uploaded CSV / TXT / XLSX file (by extension; anything else is read as TXT)."""
+    name = uploaded_file.name.lower()
+    reader = next((reader for ext, reader in READERS.items() if name.endswith(ext)), iter_txt_ids)
+    uploaded_file.seek(0)
+    return reader(uploaded_file.file)
+
+
+# ==============================================
+# Timestamped scans -> lectures
+# ==============================================
+
+class LectureIntervalIndex:
+    """
+    Lectures of some groups, sorted by start time per group. ``find`` maps a
+    scan time to the lecture whose window ``[start - early, start + duration)``
+    contains it (the latest one if windows overlap) with a binary search, so
+    mapping N scans costs one query plus N bisects.
+    """
+
+    def __init__(self, lectures, early=None, duration=None):
+        self.early = early if early is not None else timedelta(minutes=settings.ATTENDANCE_EARLY_MINUTES)
+        self.duration = duration if duration is not None else timedelta(minutes=settings.LECTURE_DURATION_MINUTES)
+        by_group = defaultdict(list)
+        for pk, group_id, start in lectures:
+            by_group[group_id].append((start, pk))
+        self._starts, self._ids = {}, {}
+        for group_id, items in by_group.items():
+            items.sort()
+            self._starts[group_id] = [start for start, _ in items]
+            self._ids[group_id] = [pk for _, pk in items]
+
+    @classmethod
+    def for_groups(cls, group_ids, since, until, early=None, duration=None):
+        """Index the lectures of ``group_ids`` that can hold a scan between ``since`` and ``until``."""
+        index = cls([], early, duration)
+        lectures = Lecture.objects.filter(
+            group_id__in=group_ids,
+            date_time__gt=since - index.duration,
+            date_time__lte=until + index.early,
+        ).values_list('pk', 'group_id', 'date_time')
+        return cls(lectures, index.early, index.duration)
+
+    def find(self, group_id, at):
+        starts = self._starts.get(group_id)
+        if not starts:
+            return None
+        i = bisect.bisect_right(starts, at + self.early) - 1
+        if i >= 0 and at < starts[i] + self.duration:
+            return self._ids[group_id][i]
+        return None
+
+
+def apply_scan_statuses(statuses, batch_size=1000):
+    """
+    Write ``{(lecture_id, student_id): status}`` from timestamped scans:
+    missing records are inserted and ABSENT ones upgraded; any other status
+    (EXCUSED, a manual correction, an earlier scan) is left as it is.
+    """
+    AttendanceRecord.objects.bulk_create(
+        [AttendanceRecord(lecture_id=lecture_id, student_id=student_id, status=status)
+         for (lecture_id, student_id), status in statuses.items()],
+        ignore_conflicts=True,
+        batch_size=batch_size,
+    )
+    upgrades = defaultdict(list)
+    for (lecture_id, student_id), status in statuses.items():
+        upgrades[(lecture_id, status)].append(student_id)
+    for (lecture_id, status), student_ids in upgrades.items():
+        for i in range(0, len(student_ids), batch_size):
+            AttendanceRecord.objects.filter(
+                lecture_id=lecture_id, student_id__in=student_ids[i:i + batch_size], status=AttendanceStatus.ABSENT
+            ).update(status=status)
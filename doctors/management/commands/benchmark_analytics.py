@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from doctors.analytics import WARNING_THRESHOLD, CourseAnalytics, reference_metrics
+from doctors.exports import STATUS_CODES, AttendanceMatrix
+from doctors.models import Course
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the NumPy analytics engine against the equivalent per-student Python loops on one course '
+        '(--course) or on a random students x lectures matrix, and checks that both give the same results.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', help='Course code or id to load from the database.')
+        parser.add_argument('--students', type=int, default=2000, help='Rows of the random matrix (default: 2000).')
+        parser.add_argument('--lectures', type=int, default=60, help='Columns of the random matrix (default: 60).')
+        parser.add_argument('--absent-rate', type=float, default=0.15, help='Share of absences in the random matrix.')
+        parser.add_argument('--repeat', type=int, default=5, help='Best of N runs (default: 5).')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['course']:
+            value = options['course']
+            course = Course.objects.filter(code=value).first() or (
+                Course.objects.filter(pk=int(value)).first() if value.isdigit() else None
+            )
+            if course is None:
+                raise CommandError(f"Course {value!r} not found.")
+            started = time.perf_counter()
+            matrix = AttendanceMatrix.for_course(course)
+            self.stdout.write(f"Loaded {course.code}: {matrix.statuses.shape} in {time.perf_counter() - started:.3f}s")
+        else:
+            matrix = self._random_matrix(options)
+
+        rows = matrix.statuses.tolist()
+        # المصفوفة بتتبني من جديد عشان عدّ الحالات (counts) يدخل في الوقت
+        vectorized, analytics = self._best_of(
+            options['repeat'], lambda: CourseAnalytics(AttendanceMatrix(matrix.students, matrix.lectures, matrix.statuses))
+        )
+        loops, reference = self._best_of(options['repeat'], lambda: reference_metrics(rows, WARNING_THRESHOLD))
+
+        for field, values in (
+            ('absences', analytics.absences), ('lates', analytics.lates), ('late_ratio', analytics.late_ratio),
+            ('longest_streak', analytics.longest_streak), ('current_streak', analytics.current_streak),
+            ('at_risk', analytics.at_risk), ('crossed_at', analytics.crossed_at),
+        ):
+            if [r[field] for r in reference] != values.tolist():
+                raise CommandError(f"Results differ for {field}.")
+
+        students, lectures = matrix.statuses.shape
+        self.stdout.write(self.style.SUCCESS(
+            f"{students} students x {lectures} lectures: NumPy {vectorized * 1000:.2f} ms, "
+            f"Python loops {loops * 1000:.2f} ms (speedup {loops / vectorized if vectorized else 0:.1f}x), "
+            f"{int(analytics.at_risk.sum())} at risk."
+        ))
+
+    def _random_matrix(self, options):
+        rng = np.random.default_rng(options['seed'])
+        absent = options['absent_rate']
+        rest = (1 - absent) / 3
+        # الاحتمالات بترتيب STATUS_CODES: حضور، غياب، تأخير، عذر (الحضور ضعف التأخير+العذر)
+        probabilities = [rest * 2, absent, rest / 2, rest / 2]
+        statuses = rng.choice(
+            np.arange(1, len(STATUS_CODES) + 1, dtype=np.int8),
+            size=(options['students'], options['lectures']),
+            p=probabilities,
+        )
+        students = [(i, str(i), '') for i in range(options['students'])]
+        lectures = [(j, None, '') for j in range(options['lectures'])]
+        return AttendanceMatrix(students, lectures, statuses)
+
+    def _best_of(self, repeat, func):
+        best, result = None, None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from doctors.attendance import close_session
+from doctors.models import AttendanceSession
+
+
+class Command(BaseCommand):
+    help = (
+        'Closes face attendance sessions that were left open (e.g. the browser was closed), '
+        'writing the absent rows for students who were not scanned.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=6, help='Close sessions opened more than this many hours ago (default: 6).')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = AttendanceSession.objects.filter(closed_at__isnull=True, opened_at__lt=cutoff).select_related('group', 'lecture')
+        closed = 0
+        for session in stale:
+            _, absent = close_session(session)
+            closed += 1
+            self.stdout.write(f"🔒 {session.group} - {session.lecture.topic}: {absent} marked absent")
+        self.stdout.write(self.style.SUCCESS(f"Closed {closed} stale session(s)."))
@@ -0,0 +1,64 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from doctors.models import Course, Lecture
+from doctors.reports import write_zip_bundle
+
+
+class Command(BaseCommand):
+    help = (
+        'Renders the attendance PDF of every lecture of the given courses (or of every course of the given '
+        'doctors, or of all courses) on a process pool and writes them into one ZIP. Lectures whose PDF is '
+        'already cached and unchanged are not rendered again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='ZIP file to write ("-" for stdout).')
+        parser.add_argument('--course', action='append', dest='courses', help='Course code or id (repeatable).')
+        parser.add_argument('--doctor', action='append', dest='doctors', help='All courses of this doctor username (repeatable).')
+        parser.add_argument('--all', action='store_true', help='Every course.')
+        parser.add_argument('--workers', type=int, help='Rendering processes (default: REPORT_PDF_WORKERS).')
+
+    def handle(self, *args, **options):
+        if not (options['courses'] or options['doctors'] or options['all']):
+            raise CommandError('Give --course, --doctor or --all.')
+        courses = Course.objects.all()
+        if not options['all']:
+            wanted = Q()
+            for value in options['courses'] or []:
+                wanted |= Q(code=value) | (Q(pk=int(value)) if value.isdigit() else Q())
+            if options['doctors']:
+                wanted |= Q(doctor__username__in=options['doctors'])
+            courses = courses.filter(wanted)
+        lectures = (
+            Lecture.objects.filter(course__in=courses)
+            .select_related('course', 'group')
+            .order_by('course__code', 'date_time', 'pk')
+        )
+        total = lectures.count()
+        if not total:
+            raise CommandError('No lectures found.')
+
+        # التقدم بيتكتب على stderr لو الـ ZIP نفسه رايح على stdout
+        log = self.stderr if options['output'] == '-' else self.stdout
+
+        def progress(stats):
+            log.write(
+                f"\r{stats.done}/{stats.total} lectures, {stats.pages} pages, "
+                f"{stats.pages_per_second:.1f} pages/s", ending=''
+            )
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            stats = write_zip_bundle(
+                lectures.iterator(chunk_size=200), output, workers=options['workers'], progress=progress, total=total
+            )
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        log.write('')
+        log.write(self.style.SUCCESS(
+            f"{stats.done} lectures ({stats.rendered} rendered, {stats.cached} from cache), {stats.pages} pages "
+            f"in {stats.elapsed:.1f}s ({stats.pages_per_second:.1f} pages/s)."
+        ))
@@ -1,58 +1,188 @@
-import environ
-import boto3
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 from doctors.models import Student
+from doctors.face_shards import plan_shard_sync, save_shard_faces, sync_shard_faces
+from doctors.recognition import get_recognition_backend
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads (``rate`` calls per second)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
-# تهيئة مكتبة environ لقراءة المتغيرات
-env = environ.Env()
-environ.Env.read_env() # تقرأ ملف .env تلقائياً
 
 class Command(BaseCommand):
-    help = 'Indexes student faces using AWS Rekognition'
+    help = (
+        'Indexes student faces with the configured recognition backend (FACE_RECOGNITION_BACKEND). '
+        'Unchanged photos are skipped, work runs on a rate-limited pool and an interrupted run resumes '
+        'from its checkpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Parallel index calls (default: 8).')
+        parser.add_argument('--rate', type=float, default=20, help='Max index calls per second, 0 = unlimited (default: 20).')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Students per checkpoint / bulk update (default: 200).')
+        parser.add_argument('--force', action='store_true', help='Re-index every photo even if it did not change.')
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, '.index_students_faces.checkpoint.json'),
+            help='Progress file used to resume an interrupted run.'
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over.')
 
     def handle(self, *args, **options):
-        # استدعاء المتغيرات بأمان
-        client = boto3.client(
-            'rekognition',
-            aws_access_key_id=env('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=env('AWS_SECRET_ACCESS_KEY'),
-            region_name=env('AWS_REGION_NAME', default='eu-west-1')
+        # المحرك (AWS / local / stub) بيتحدد من الإعدادات
+        self.backend = get_recognition_backend()
+        self.force = options['force']
+        self.limiter = RateLimiter(options['rate'])
+        # shard collections already created in this run
+        self.ensured = set()
+        checkpoint_path = options['checkpoint']
+
+        if self.backend.ensure_collection():
+            self.stdout.write(self.style.SUCCESS(f"Collection '{self.backend.collection_id}' created."))
+
+        last_pk = 0
+        if not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as fh:
+                last_pk = json.load(fh)['last_pk']
+            self.stdout.write(f"↻ Resuming after student #{last_pk}")
+
+        students = (
+            Student.objects.filter(pk__gt=last_pk)
+            .exclude(image='').exclude(image__isnull=True)
+            .only('pk', 'name', 'university_id', 'image', 'face_id', 'image_hash', 'indexed_at')
+            .order_by('pk')
         )
+        totals = {'indexed': 0, 'skipped': 0, 'no_face': 0, 'failed': 0}
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool, self.backend.batch() as self.batch:
+            chunk = []
+            for student in students.iterator(chunk_size=options['chunk_size']):
+                chunk.append(student)
+                if len(chunk) >= options['chunk_size']:
+                    self._process_chunk(pool, chunk, totals, checkpoint_path)
+                    chunk = []
+            if chunk:
+                self._process_chunk(pool, chunk, totals, checkpoint_path)
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s: {totals['indexed']} indexed, {totals['skipped']} unchanged, "
+            f"{totals['no_face']} without a detectable face, {totals['failed']} failed."
+        ))
+
+    def _process_chunk(self, pool, chunk, totals, checkpoint_path):
+        to_update, replaced_faces = [], []
+        for student, status, detail in pool.map(self._index_student, chunk):
+            totals[status] += 1
+            if status == 'indexed':
+                to_update.append(student)
+                if detail:
+                    replaced_faces.append(detail)
+                self.stdout.write(self.style.SUCCESS(f"✅ {student.name} - FaceId: {student.face_id}"))
+            elif status == 'no_face':
+                self.stdout.write(self.style.WARNING(f"⚠️ {student.name}: No face detected in image."))
+            elif status == 'failed':
+                self.stdout.write(self.style.ERROR(f"❌ {student.name} : {detail}"))
 
-        collection_id = 'smart_attendance_collection'
+        # الوشوش الجديدة تتكتب في الـ index قبل ما الداتابيز والـ checkpoint يشاوروا عليها
+        self.batch.flush()
+        Student.objects.bulk_update(to_update, ['face_id', 'image_hash', 'indexed_at'])
+        # الصورة اتغيرت: نحدّث نسخة الوش في shards المقررات كمان
+        self._sync_shards(pool, to_update)
+        if replaced_faces:
+            # الوش القديم للصورة اللي اتغيرت مالوش لازمة في الـ collection
+            try:
+                self.backend.delete_faces(replaced_faces)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"⚠️ Could not delete {len(replaced_faces)} replaced faces: {e}"))
+        # الـ checkpoint بيتكتب بعد ما الدفعة تتحفظ في الداتابيز بس
+        with open(checkpoint_path, 'w') as fh:
+            json.dump({'last_pk': chunk[-1].pk}, fh)
+        self.stdout.write(f"… up to student #{chunk[-1].pk}: {sum(totals.values())} processed")
 
+    def _sync_shards(self, pool, students):
+        """
+        Re-index the students' shard faces: the plan, creating the target
+        collections and the writes run here, the index / delete calls on the
+        pool behind the same rate limiter.
+        """
+        if not settings.FACE_SHARD_KEY or not students:
+            return
+        plans = [
+            (student, *plan_shard_sync(student, reindex=True))
+            for student in Student.objects.filter(pk__in=[s.pk for s in students]).prefetch_related('groups', 'face_shards')
+        ]
+        # الـ collections بتتعمل هنا مرة واحدة قبل الـ pool: الـ threads بتقرا self.ensured بس
+        for collection_id in sorted(set().union(*(targets for _, targets, _, _ in plans)) - self.ensured):
+            self.limiter.wait()
+            try:
+                self.backend.ensure_collection(collection_id)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"⚠️ Could not create shard collection {collection_id}: {e}"))
+                continue
+            self.ensured.add(collection_id)
+        for (student, _, _, stale), indexed in zip(plans, pool.map(self._sync_student_shards, plans)):
+            if isinstance(indexed, Exception):
+                self.stdout.write(self.style.WARNING(f"⚠️ {student.name}: could not sync face shards: {indexed}"))
+                continue
+            save_shard_faces(student, stale, indexed)
+
+    def _sync_student_shards(self, plan):
+        student, targets, existing, stale = plan
+        try:
+            return sync_shard_faces(
+                student, targets, existing, stale, self.backend, before_call=self.limiter.wait, ensured=self.ensured
+            )
+        except Exception as e:
+            return e
+
+    def _index_student(self, student):
         try:
-            client.create_collection(CollectionId=collection_id)
-            self.stdout.write(self.style.SUCCESS(f"Collection '{collection_id}' created."))
-        except client.exceptions.ResourceAlreadyExistsException:
-            pass
-
-        all_students = Student.objects.all()
-        batch_size = 10
-
-        for i in range(0, len(all_students), batch_size):
-            batch = all_students[i:i + batch_size]
-            for student in batch:
-                if student.image and hasattr(student.image, 'path'):
-                    try:
-                        with open(student.image.path, 'rb') as image_file:
-                            response = client.index_faces(
-                                CollectionId=collection_id,
-                                Image={'Bytes': image_file.read()},
-                                ExternalImageId=str(student.university_id),
-                                MaxFaces=1,
-                                QualityFilter="AUTO"
-                            )
-                            
-                            if response['FaceRecords']:
-                                aws_face_id = response['FaceRecords'][0]['Face']['FaceId']
-                                student.face_id = aws_face_id
-                                student.save()
-                                self.stdout.write(self.style.SUCCESS(f"✅ {student.name} - FaceId: {aws_face_id}"))
-                            else:
-                                self.stdout.write(self.style.WARNING(f"⚠️ {student.name}: No face detected in image."))
-                                
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"❌ {student.name} : {e}"))
-                else:
-                    self.stdout.write(f"⏩ {student.name}: No Image Found")
\ No newline at end of file
+            path = student.image.path
+            if not self.force and student.face_id and student.image_hash and student.indexed_at:
+                # الصورة ما اتعدلتش بعد آخر فهرسة؟ يبقى مش محتاجين نقراها أصلاً
+                if os.path.getmtime(path) <= student.indexed_at.timestamp():
+                    return student, 'skipped', None
+            with open(path, 'rb') as image_file:
+                image_bytes = image_file.read()
+            digest = hashlib.sha256(image_bytes).hexdigest()
+            if not self.force and student.face_id and digest == student.image_hash:
+                return student, 'skipped', None
+
+            self.limiter.wait()
+            face_id = self.batch.index_face(image_bytes, student.university_id)
+            if not face_id:
+                return student, 'no_face', None
+            replaced_face = student.face_id
+            student.face_id = face_id
+            student.image_hash = digest
+            student.indexed_at = timezone.now()
+            return student, 'indexed', replaced_face
+        except Exception as e:
+            return student, 'failed', e
@@ -0,0 +1,178 @@
+import gzip
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from doctors.attendance import invalidate_group_sessions
+from doctors.ingest import LectureIntervalIndex, apply_scan_statuses
+from doctors.models import AttendanceRecord, AttendanceStatus, Lecture, Student
+from doctors.summaries import schedule_record_refresh
+
+
+def parse_swipe(line, tz):
+    """
+    ``"<student id>,<timestamp>"`` (comma, tab or semicolon) or
+    ``"<student id> <timestamp>"``; returns ``(university_id, aware datetime)``
+    or None for blank / malformed lines.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    for sep in (',', '\t', ';', ' '):
+        university_id, found, stamp = line.partition(sep)
+        if found:
+            break
+    else:
+        return None
+    try:
+        at = datetime.fromisoformat(stamp.strip())
+    except ValueError:
+        return None
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=tz)
+    return university_id.strip(), at
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams RFID / turnstile logs (one "student id, timestamp" per line, .gz supported), assigns every '
+        'swipe to the lecture running in one of the student\'s groups at that time and writes the attendance '
+        'in chunks (missing or absent records only). Reports throughput in rows per second.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Log files to ingest.')
+        parser.add_argument('--group', type=int, action='append', dest='groups', help='Only lectures of this group (repeatable).')
+        parser.add_argument('--course', type=int, action='append', dest='courses', help='Only lectures of this course (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Swipes per bulk write (default: 5000).')
+        parser.add_argument('--status', default=AttendanceStatus.PRESENT, choices=[AttendanceStatus.PRESENT, AttendanceStatus.LATE],
+                            help='Status written for a swipe (default: P).')
+        parser.add_argument('--mark-absent', action='store_true',
+                            help='Afterwards, mark students of every touched lecture that have no record as absent.')
+        parser.add_argument('--dry-run', action='store_true', help='Parse and map the swipes without writing.')
+
+    def handle(self, *args, **options):
+        self.status = options['status']
+        self.dry_run = options['dry_run']
+        self.chunk_size = max(1, options['chunk_size'])
+        self.tz = timezone.get_current_timezone()
+
+        # كل الطلاب ومجموعاتهم في الذاكرة (استعلامين) بدل استعلام لكل سطر
+        memberships = Student.groups.through.objects.all()
+        if options['groups']:
+            memberships = memberships.filter(group_id__in=options['groups'])
+        if options['courses']:
+            memberships = memberships.filter(group__course_id__in=options['courses'])
+        self.student_groups = {}
+        for student_id, group_id in memberships.values_list('student_id', 'group_id').iterator(chunk_size=10000):
+            self.student_groups.setdefault(student_id, []).append(group_id)
+        self.student_ids = {
+            university_id: pk
+            for university_id, pk in Student.objects.values_list('university_id', 'pk').iterator(chunk_size=10000)
+            if pk in self.student_groups
+        }
+        self.group_ids = {g for groups in self.student_groups.values() for g in groups}
+        self.indexes = {}
+
+        self.totals = {'lines': 0, 'applied': 0, 'malformed': 0, 'unknown_student': 0, 'no_lecture': 0}
+        self.touched_lectures = set()
+        self.started = time.monotonic()
+        for path in options['paths']:
+            self._ingest(path)
+
+        if options['mark_absent'] and self.touched_lectures and not self.dry_run:
+            absent = self._mark_absent()
+            self.stdout.write(f"Marked {absent} students absent in {len(self.touched_lectures)} lectures.")
+        if not self.dry_run and self.touched_lectures:
+            groups = Lecture.objects.filter(pk__in=self.touched_lectures).values_list('group_id', flat=True).distinct()
+            invalidate_group_sessions(*groups)
+
+        elapsed = time.monotonic() - self.started
+        t = self.totals
+        self.stdout.write(self.style.SUCCESS(
+            f"{'[dry run] ' if self.dry_run else ''}{t['lines']} lines in {elapsed:.1f}s "
+            f"({t['lines'] / elapsed if elapsed else 0:,.0f} rows/s): {t['applied']} swipes applied to "
+            f"{len(self.touched_lectures)} lectures, {t['no_lecture']} outside any lecture, "
+            f"{t['unknown_student']} unknown cards, {t['malformed']} malformed lines."
+        ))
+
+    def _open(self, path):
+        try:
+            if path.endswith('.gz'):
+                return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+            return open(path, encoding='utf-8', errors='replace', buffering=1024 * 1024)
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+    def _index_for(self, day):
+        """Interval index for the lectures of one day, built the first time a swipe from that day is seen."""
+        index = self.indexes.get(day)
+        if index is None:
+            start = datetime.combine(day, datetime.min.time(), tzinfo=self.tz)
+            index = LectureIntervalIndex.for_groups(self.group_ids, since=start, until=start + timedelta(days=1))
+            self.indexes[day] = index
+        return index
+
+    def _ingest(self, path):
+        chunk = {}
+        pending = 0
+        with self._open(path) as log:
+            for line in log:
+                self.totals['lines'] += 1
+                swipe = parse_swipe(line, self.tz)
+                if swipe is None:
+                    self.totals['malformed'] += 1
+                    continue
+                university_id, at = swipe
+                student_id = self.student_ids.get(university_id)
+                if student_id is None:
+                    self.totals['unknown_student'] += 1
+                    continue
+                index = self._index_for((at if at.tzinfo is self.tz else at.astimezone(self.tz)).date())
+                lecture_id = None
+                for group_id in self.student_groups[student_id]:
+                    lecture_id = index.find(group_id, at)
+                    if lecture_id:
+                        break
+                if lecture_id is None:
+                    self.totals['no_lecture'] += 1
+                    continue
+                chunk[(lecture_id, student_id)] = True
+                self.totals['applied'] += 1
+                pending += 1
+                if pending >= self.chunk_size:
+                    self._flush(chunk)
+                    chunk, pending = {}, 0
+        self._flush(chunk)
+
+    def _flush(self, chunk):
+        if not chunk:
+            return
+        self.touched_lectures.update(lecture_id for lecture_id, _ in chunk)
+        if not self.dry_run:
+            # الغايب أو اللي مالوش سجل بس: العذر أو التعديل اليدوي بيفضل زي ما هو
+            apply_scan_statuses(dict.fromkeys(chunk, self.status), batch_size=1000)
+            schedule_record_refresh(chunk)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f"… {self.totals['lines']:,} lines, {self.totals['applied']:,} applied "
+            f"({self.totals['lines'] / elapsed if elapsed else 0:,.0f} rows/s)"
+        )
+
+    def _mark_absent(self):
+        absent = 0
+        lectures = Lecture.objects.filter(pk__in=self.touched_lectures).values_list('pk', 'group_id')
+        with transaction.atomic():
+            for lecture_id, group_id in lectures:
+                marked = set(AttendanceRecord.objects.filter(lecture_id=lecture_id).values_list('student_id', flat=True))
+                rows = [
+                    AttendanceRecord(lecture_id=lecture_id, student_id=pk, status=AttendanceStatus.ABSENT)
+                    for pk in Student.groups.through.objects.filter(group_id=group_id).values_list('student_id', flat=True)
+                    if pk not in marked
+                ]
+                AttendanceRecord.objects.bulk_create(rows, ignore_conflicts=True, batch_size=1000)
+                schedule_record_refresh((lecture_id, row.student_id) for row in rows)
+                absent += len(rows)
+        return absent
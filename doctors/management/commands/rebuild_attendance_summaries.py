@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from doctors.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the AttendanceSummary table from AttendanceRecord (all courses, or only the given ones).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses', help='Only rebuild this course (repeatable).')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows = rebuild_summaries(course_ids=options['courses'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} attendance summaries in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from doctors.search import fts_enabled, rebuild_student_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Refills the full-text student search index (SQLite FTS5) from the students table, '
+        'e.g. after students were written with raw SQL or a bulk import.'
+    )
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write('This database has no full-text index; search uses icontains.')
+            return
+        started = time.monotonic()
+        count = rebuild_student_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} students in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand
+from doctors.models import Student, StudentFaceShard, FaceCollectionSnapshot
+from doctors.recognition import get_recognition_backend
+
+
+class Command(BaseCommand):
+    help = (
+        'Pages through the face collection and its per-course / per-group shards, diffs them against '
+        'Student.face_id and StudentFaceShard and deletes duplicate and orphan faces in batches. Each '
+        'collection\'s run is recorded as a FaceCollectionSnapshot.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Face ids per delete call (max 4096).')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting.')
+        parser.add_argument(
+            '--clear-missing', action='store_true',
+            help='Reset face_id for students whose face is no longer in the collection (and drop their '
+                 'missing shard rows) so the next index_students_faces / sync_face_shards run re-indexes them.'
+        )
+        parser.add_argument('--history', type=int, default=5, help='How many previous snapshots to print.')
+
+    def handle(self, *args, **options):
+        self.backend = get_recognition_backend()
+        self.batch_size = max(1, min(options['batch_size'], 4096))
+        self.options = options
+        self.known_ids = set(Student.objects.values_list('university_id', flat=True))
+
+        global_id = self.backend.collection_id
+        self._reconcile(
+            global_id, Student.objects.exclude(face_id__isnull=True).exclude(face_id=''),
+            clear=lambda students: students.update(face_id=None, image_hash='', indexed_at=None),
+        )
+
+        # shards of courses / groups that were deleted have no rows left, so every face in them is stale
+        prefixes = (f'{global_id}-course-', f'{global_id}-group-')
+        shards = set(StudentFaceShard.objects.values_list('collection_id', flat=True).distinct())
+        shards |= {collection_id for collection_id in self.backend.list_collections() if collection_id.startswith(prefixes)}
+        for collection_id in sorted(shards):
+            self._reconcile(
+                collection_id, StudentFaceShard.objects.filter(collection_id=collection_id),
+                clear=lambda shards: shards.delete(),
+            )
+
+    def _reconcile(self, collection_id, owners, clear):
+        """
+        Diff one collection against ``owners`` (rows whose ``face_id`` must
+        stay) and delete the rest; ``clear`` resets the owners whose face is gone.
+        """
+        dry_run = self.options['dry_run']
+        # الـ face_id الحالي لكل طالب هو الوحيد اللي المفروض يفضل في الـ collection
+        current = set(owners.values_list('face_id', flat=True))
+
+        faces_before = 0
+        seen = set()
+        duplicates, orphans = [], []
+        for face_id, external_id in self.backend.list_faces(collection_id=collection_id):
+            faces_before += 1
+            if face_id in current:
+                seen.add(face_id)
+            elif external_id in self.known_ids:
+                duplicates.append(face_id)
+            else:
+                orphans.append(face_id)
+
+        deleted = set()
+        if not dry_run:
+            stale = duplicates + orphans
+            for i in range(0, len(stale), self.batch_size):
+                batch = stale[i:i + self.batch_size]
+                # وش اتفهرس واتحفظ وإحنا بنقرا الـ collection مش مكرر: نراجع الداتابيز قبل الحذف مباشرة
+                indexed_meanwhile = set(owners.filter(face_id__in=batch).values_list('face_id', flat=True))
+                if indexed_meanwhile:
+                    seen |= indexed_meanwhile
+                    batch = [face_id for face_id in batch if face_id not in indexed_meanwhile]
+                if batch:
+                    # اللي المحرك قال إنه اتمسح فعلاً بس هو اللي بيتحسب
+                    deleted.update(self.backend.delete_faces(batch, collection_id=collection_id))
+                self.stdout.write(f"🗑 {collection_id}: deleted {len(deleted)}/{len(stale)} stale faces")
+
+        missing = [face_id for face_id in current if face_id not in seen]
+        if missing and self.options['clear_missing'] and not dry_run:
+            clear(owners.filter(face_id__in=missing))
+
+        snapshot = FaceCollectionSnapshot.objects.create(
+            collection_id=collection_id,
+            faces_before=faces_before,
+            faces_after=faces_before - len(deleted),
+            duplicates_deleted=len(deleted.intersection(duplicates)),
+            orphans_deleted=len(deleted.intersection(orphans)),
+            missing_faces=len(missing),
+            dry_run=dry_run,
+        )
+
+        prefix = '[dry run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}'{collection_id}': {faces_before} faces -> {snapshot.faces_after}. "
+            f"Duplicates: {len(duplicates)} ({snapshot.duplicates_deleted} deleted), "
+            f"orphans: {len(orphans)} ({snapshot.orphans_deleted} deleted), "
+            f"students missing from the collection: {len(missing)}."
+        ))
+
+        history = FaceCollectionSnapshot.objects.filter(collection_id=collection_id).exclude(
+            pk=snapshot.pk)[:self.options['history']]
+        for previous in history:
+            self.stdout.write(
+                f"   {previous.created_at:%Y-%m-%d %H:%M}  {previous.faces_before} -> {previous.faces_after} faces"
+                f"{' (dry run)' if previous.dry_run else ''}"
+            )
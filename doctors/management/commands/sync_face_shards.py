@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from doctors.face_shards import sync_students_shards
+from doctors.models import Student
+
+
+class Command(BaseCommand):
+    help = 'Builds / repairs the per-course face shard collections (FACE_SHARD_KEY) for every student.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reindex', action='store_true', help='Replace shard faces that already exist.')
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if not settings.FACE_SHARD_KEY:
+            self.stdout.write(self.style.WARNING(
+                'FACE_SHARD_KEY is empty: sharding is disabled. Run with FACE_SHARD_KEY=course (or group) to build the shards.'
+            ))
+            return
+        student_ids = list(
+            Student.objects.exclude(image='').exclude(image__isnull=True).order_by('pk').values_list('pk', flat=True)
+        )
+        size = options['chunk_size']
+        for i in range(0, len(student_ids), size):
+            sync_students_shards(student_ids[i:i + size], reindex=options['reindex'])
+            self.stdout.write(f"… {min(i + size, len(student_ids))}/{len(student_ids)} students synced")
+        self.stdout.write(self.style.SUCCESS(f"Face shards ({settings.FACE_SHARD_KEY}) are in sync."))
@@ -0,0 +1,29 @@
+# doctors/metrics.py
+"""
+Tiny counters for the face attendance pipeline, stored in the Django cache so
+that every worker adds to the same numbers when a shared cache (Redis /
+Memcached) is configured through ``CACHES``. The ``face_metrics`` view reads them.
+"""
+from django.core.cache import cache
+
+PREFIX = 'metrics:'
+
+
+def incr(name, amount=1):
+    key = PREFIX + name
+    amount = int(round(amount))
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # first hit (or evicted): add() keeps a concurrent creator from being overwritten
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+def read(names):
+    values = cache.get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
+
+
+def reset(names):
+    cache.delete_many([PREFIX + name for name in names])
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-16 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0002_student_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Indexed Image Hash'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='indexed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Face Indexed At'),
+        ),
+    ]
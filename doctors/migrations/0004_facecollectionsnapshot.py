@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-16 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0003_student_image_hash_indexed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceCollectionSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection_id', models.CharField(max_length=255, verbose_name='Collection')),
+                ('faces_before', models.PositiveIntegerField(default=0, verbose_name='Faces Before')),
+                ('faces_after', models.PositiveIntegerField(default=0, verbose_name='Faces After')),
+                ('duplicates_deleted', models.PositiveIntegerField(default=0, verbose_name='Duplicate Faces Deleted')),
+                ('orphans_deleted', models.PositiveIntegerField(default=0, verbose_name='Orphan Faces Deleted')),
+                ('missing_faces', models.PositiveIntegerField(default=0, verbose_name='Students Missing From Collection')),
+                ('dry_run', models.BooleanField(default=False, verbose_name='Dry Run')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Taken At')),
+            ],
+            options={
+                'verbose_name': 'Face Collection Snapshot',
+                'verbose_name_plural': 'Face Collection Snapshots',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
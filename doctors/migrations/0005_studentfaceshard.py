@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-16 20:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_facecollectionsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentFaceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection_id', models.CharField(max_length=255, verbose_name='Shard Collection')),
+                ('face_id', models.CharField(max_length=255, verbose_name='Face ID')),
+                ('indexed_at', models.DateTimeField(auto_now=True, verbose_name='Indexed At')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_shards', to='doctors.student', verbose_name='Student')),
+            ],
+            options={
+                'verbose_name': 'Student Face Shard',
+                'verbose_name_plural': 'Student Face Shards',
+                'unique_together': {('student', 'collection_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-16 20:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0006_attendancesession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64, unique=True, verbose_name='Idempotency Key')),
+                ('university_id', models.CharField(max_length=50, verbose_name='University ID')),
+                ('status', models.CharField(choices=[('P', 'Present'), ('A', 'Absent'), ('L', 'Late'), ('E', 'Excused')], default='P', max_length=1, verbose_name='Status')),
+                ('scanned_at', models.DateTimeField(verbose_name='Scanned At')),
+                ('device_id', models.CharField(blank=True, default='', max_length=100, verbose_name='Device')),
+                ('result', models.CharField(max_length=20, verbose_name='Result')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Received At')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scan_events', to='doctors.group', verbose_name='Group')),
+                ('lecture', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scan_events', to='doctors.lecture', verbose_name='Lecture')),
+            ],
+            options={
+                'verbose_name': 'Scan Event',
+                'verbose_name_plural': 'Scan Events',
+                'ordering': ['-scanned_at'],
+            },
+        ),
+    ]
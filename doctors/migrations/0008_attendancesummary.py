@@ -0,0 +1,62 @@
+# Generated by Django 5.1.2 on 2026-10-16 21:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q
+
+
+def build_summaries(apps, schema_editor):
+    AttendanceRecord = apps.get_model('doctors', 'AttendanceRecord')
+    AttendanceSummary = apps.get_model('doctors', 'AttendanceSummary')
+    fields = {'P': 'present', 'A': 'absent', 'L': 'late', 'E': 'excused'}
+    rows = (
+        AttendanceRecord.objects.values('student_id', 'lecture__course_id')
+        .annotate(
+            last_lecture_at=Max('lecture__date_time'),
+            first_record=Min('pk'),
+            **{field: Count('pk', filter=Q(status=status)) for status, field in fields.items()},
+        )
+        .order_by('first_record')
+    )
+    AttendanceSummary.objects.bulk_create(
+        [
+            AttendanceSummary(
+                student_id=row['student_id'],
+                course_id=row['lecture__course_id'],
+                last_lecture_at=row['last_lecture_at'],
+                **{field: row[field] for field in fields.values()},
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0007_scanevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('present', models.PositiveIntegerField(default=0, verbose_name='Present')),
+                ('absent', models.PositiveIntegerField(default=0, verbose_name='Absent')),
+                ('late', models.PositiveIntegerField(default=0, verbose_name='Late')),
+                ('excused', models.PositiveIntegerField(default=0, verbose_name='Excused')),
+                ('last_lecture_at', models.DateTimeField(blank=True, null=True, verbose_name='Last Lecture')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_summaries', to='doctors.course', verbose_name='Course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_summaries', to='doctors.student', verbose_name='Student')),
+            ],
+            options={
+                'verbose_name': 'Attendance Summary',
+                'verbose_name_plural': 'Attendance Summaries',
+                'indexes': [models.Index(fields=['course', 'absent'], name='summary_course_absent_idx')],
+                'unique_together': {('student', 'course')},
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
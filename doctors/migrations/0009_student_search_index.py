@@ -0,0 +1,31 @@
+from django.db import migrations
+
+FTS_TABLE = 'doctors_student_fts'
+
+
+def create_index(apps, schema_editor):
+    # FTS5 موجود في SQLite بس؛ باقي قواعد البيانات بتستخدم icontains (doctors/search.py)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(name, university_id, tokenize='trigram')"
+    )
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, name, university_id) SELECT id, name, university_id FROM doctors_student'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0008_attendancesummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -104,6 +104,9 @@ class Student(models.Model):
     # الحقول الجديدة المطلوبة للبصمة 👇
     image = models.ImageField(upload_to='student_faces/', null=True, blank=True, verbose_name="Student Photo")
     face_id = models.CharField(max_length=255, null=True, blank=True, verbose_name="AWS Face ID")
+    # بصمة محتوى الصورة ووقت آخر فهرسة عشان نتخطى الصور اللي ماتغيرتش
+    image_hash = models.CharField(max_length=64, blank=True, default='', verbose_name="Indexed Image Hash")
+    indexed_at = models.DateTimeField(null=True, blank=True, verbose_name="Face Indexed At")
     # صورة البروفايل اللي الطالب نفسه بيرفعها من تطبيق الفلاتر (منفصلة عن صورة البصمة)
     profile_picture = models.ImageField(upload_to='student_profile_pics/', null=True, blank=True, verbose_name="Profile Picture (Student Upload)")
     
@@ -166,4 +169,124 @@ class Announcement(models.Model):
         verbose_name_plural = 'Announcements'
 
     def __str__(self):
-        return f"{self.title} - Dr. {self.doctor.username}"
\ No newline at end of file
+        return f"{self.title} - Dr. {self.doctor.username}"
+
+class FaceCollectionSnapshot(models.Model):
+    """One row per reconciliation run, so the collection size can be followed over time."""
+    collection_id = models.CharField(max_length=255, verbose_name="Collection")
+    faces_before = models.PositiveIntegerField(default=0, verbose_name="Faces Before")
+    faces_after = models.PositiveIntegerField(default=0, verbose_name="Faces After")
+    duplicates_deleted = models.PositiveIntegerField(default=0, verbose_name="Duplicate Faces Deleted")
+    orphans_deleted = models.PositiveIntegerField(default=0, verbose_name="Orphan Faces Deleted")
+    missing_faces = models.PositiveIntegerField(default=0, verbose_name="Students Missing From Collection")
+    dry_run = models.BooleanField(default=False, verbose_name="Dry Run")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Taken At")
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Face Collection Snapshot'
+        verbose_name_plural = 'Face Collection Snapshots'
+
+    def __str__(self):
+        return f"{self.collection_id}: {self.faces_after} faces ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class StudentFaceShard(models.Model):
+    """A student's face indexed into a per-course (or per-group) shard collection."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='face_shards', verbose_name="Student")
+    collection_id = models.CharField(max_length=255, verbose_name="Shard Collection")
+    face_id = models.CharField(max_length=255, verbose_name="Face ID")
+    indexed_at = models.DateTimeField(auto_now=True, verbose_name="Indexed At")
+
+    class Meta:
+        verbose_name = 'Student Face Shard'
+        verbose_name_plural = 'Student Face Shards'
+        unique_together = ('student', 'collection_id')
+
+    def __str__(self):
+        return f"{self.student.university_id} @ {self.collection_id}"
+
+
+class AttendanceSession(models.Model):
+    """
+    An open face-attendance session for a group's lecture. Any number of
+    kiosks scan into the same open session; present marks are written as they
+    come and the absent rows are inserted in one go when the session closes.
+    """
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE, related_name='attendance_sessions', verbose_name="Lecture")
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='attendance_sessions', verbose_name="Group")
+    opened_by = models.ForeignKey(DoctorProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='attendance_sessions', verbose_name="Opened By")
+    opened_at = models.DateTimeField(auto_now_add=True, verbose_name="Opened At")
+    closed_at = models.DateTimeField(null=True, blank=True, verbose_name="Closed At")
+
+    class Meta:
+        verbose_name = 'Attendance Session'
+        verbose_name_plural = 'Attendance Sessions'
+        ordering = ['-opened_at']
+        constraints = [
+            # جلسة مفتوحة واحدة بس لكل مجموعة مهما كان عدد الأجهزة
+            models.UniqueConstraint(
+                fields=['group'], condition=models.Q(closed_at__isnull=True), name='one_open_session_per_group'
+            ),
+        ]
+
+    @property
+    def is_open(self):
+        return self.closed_at is None
+
+    def __str__(self):
+        state = 'open' if self.is_open else f"closed {self.closed_at:%H:%M}"
+        return f"{self.group} - {self.lecture.topic} ({state})"
+
+
+class ScanEvent(models.Model):
+    """
+    A scan uploaded by a kiosk / the mobile app through the batch sync API,
+    kept by its client-generated idempotency key so a retried upload returns
+    the first result instead of being applied twice.
+    """
+    idempotency_key = models.CharField(max_length=64, unique=True, verbose_name="Idempotency Key")
+    university_id = models.CharField(max_length=50, verbose_name="University ID")
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, blank=True, related_name='scan_events', verbose_name="Group")
+    lecture = models.ForeignKey(Lecture, on_delete=models.SET_NULL, null=True, blank=True, related_name='scan_events', verbose_name="Lecture")
+    status = models.CharField(max_length=1, choices=AttendanceStatus.choices, default=AttendanceStatus.PRESENT, verbose_name="Status")
+    scanned_at = models.DateTimeField(verbose_name="Scanned At")
+    device_id = models.CharField(max_length=100, blank=True, default='', verbose_name="Device")
+    result = models.CharField(max_length=20, verbose_name="Result")
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Received At")
+
+    class Meta:
+        verbose_name = 'Scan Event'
+        verbose_name_plural = 'Scan Events'
+        ordering = ['-scanned_at']
+
+    def __str__(self):
+        return f"{self.university_id} @ {self.scanned_at:%Y-%m-%d %H:%M} ({self.result})"
+
+
+class AttendanceSummary(models.Model):
+    """
+    Per-student, per-course attendance counters, kept up to date from every
+    attendance write (see ``summaries.py``) so warning / report pages read
+    one indexed row instead of counting ``AttendanceRecord`` rows.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='attendance_summaries', verbose_name="Student")
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='attendance_summaries', verbose_name="Course")
+    present = models.PositiveIntegerField(default=0, verbose_name="Present")
+    absent = models.PositiveIntegerField(default=0, verbose_name="Absent")
+    late = models.PositiveIntegerField(default=0, verbose_name="Late")
+    excused = models.PositiveIntegerField(default=0, verbose_name="Excused")
+    last_lecture_at = models.DateTimeField(null=True, blank=True, verbose_name="Last Lecture")
+
+    class Meta:
+        verbose_name = 'Attendance Summary'
+        verbose_name_plural = 'Attendance Summaries'
+        unique_together = ('student', 'course')
+        indexes = [models.Index(fields=['course', 'absent'], name='summary_course_absent_idx')]
+
+    @property
+    def total(self):
+        return self.present + self.absent + self.late + self.excused
+
+    def __str__(self):
+        return f"{self.student.university_id} / {self.course.code}: {self.absent} absences"
@@ -0,0 +1,727 @@
+# doctors/recognition.py
+"""
+Face recognition backends.
+
+Every place that indexes or searches faces (the face attendance view, the
+"sync" button and the ``index_students_faces`` command) goes through
+``get_recognition_backend()`` instead of talking to AWS directly, so the
+engine can be switched with the ``FACE_RECOGNITION_BACKEND`` setting:
+
+    rekognition -> AWS Rekognition collections (default)
+    local       -> NumPy cosine search over a memory-mapped embedding matrix
+    stub        -> deterministic in-process matcher for offline load tests
+"""
+import fcntl
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+import boto3
+import numpy as np
+from botocore import exceptions as botocore_exceptions
+from botocore.config import Config as BotoConfig
+from django.conf import settings
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps
+
+# ExternalImageId في Rekognition = university_id للطالب
+# box = the searched face in the query image, for engines that report it
+FaceMatch = namedtuple('FaceMatch', ['external_id', 'face_id', 'similarity', 'box'], defaults=(None,))
+# Bounding box as ratios of the frame size (same convention as Rekognition)
+FaceBox = namedtuple('FaceBox', ['left', 'top', 'width', 'height', 'confidence'])
+WHOLE_FRAME = FaceBox(0.0, 0.0, 1.0, 1.0, 100.0)
+
+
+class RecognitionError(Exception):
+    """Raised when a backend cannot complete an index/search call."""
+
+
+class FaceBatch:
+    """Index calls of one ``batch()``; the default one writes straight through."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def index_face(self, image_bytes, external_id, collection_id=None):
+        return self.backend.index_face(image_bytes, external_id, collection_id=collection_id)
+
+    def flush(self):
+        pass
+
+
+class BaseRecognitionBackend:
+    """Interface shared by all engines. Similarities are on a 0-100 scale."""
+
+    def __init__(self, collection_id=None):
+        self.collection_id = collection_id or settings.FACE_COLLECTION_ID
+
+    def ensure_collection(self, collection_id=None):
+        """Create the collection if it does not exist yet. Returns True if created."""
+        return False
+
+    def index_face(self, image_bytes, external_id, collection_id=None):
+        """Index the single face in ``image_bytes``. Returns the new face id or None."""
+        raise NotImplementedError
+
+    def search_faces(self, image_bytes, max_faces=1, threshold=None, collection_id=None):
+        """Return a list of ``FaceMatch`` ordered by similarity (best first)."""
+        raise NotImplementedError
+
+    def detect_faces(self, image_bytes):
+        """
+        Return a ``FaceBox`` per face found in the frame. Engines without a
+        detector treat the whole frame as a single face.
+        """
+        return [WHOLE_FRAME]
+
+    def list_faces(self, collection_id=None):
+        """Yield ``(face_id, external_id)`` for every face in the collection, page by page."""
+        raise NotImplementedError
+
+    def list_collections(self):
+        """Yield the id of every collection of this engine."""
+        raise NotImplementedError
+
+    def delete_faces(self, face_ids, collection_id=None):
+        """Remove faces from the collection. Returns the ids that were deleted."""
+        raise NotImplementedError
+
+    batch_class = FaceBatch
+
+    @contextmanager
+    def batch(self):
+        """
+        Group several index calls: call ``index_face`` on the yielded batch.
+        Engines that persist to disk write on ``flush()`` and on a clean exit;
+        faces still pending when the block raises are dropped, since nothing
+        refers to their ids. Every batch has its own buffer, so overlapping
+        batches do not interfere.
+        """
+        batch = self.batch_class(self)
+        yield batch
+        batch.flush()
+
+
+# ==============================================
+# 1. AWS Rekognition (pooled client, retries, circuit breaker)
+# ==============================================
+
+class RecognitionUnavailable(RecognitionError):
+    """The backend is degraded and the circuit breaker is failing fast."""
+
+
+# أخطاء مؤقتة تستاهل إعادة المحاولة (شبكة / ضغط على الخدمة)
+TRANSIENT_ERROR_CODES = {
+    'ThrottlingException', 'ProvisionedThroughputExceededException',
+    'InternalServerError', 'ServiceUnavailableException', 'LimitExceededException',
+}
+
+
+# انقطاع أو بطء في الشبكة: ReadTimeoutError مثلاً HTTPClientError مش ConnectionError
+TRANSIENT_EXCEPTIONS = (
+    botocore_exceptions.ConnectionError, botocore_exceptions.EndpointConnectionError,
+    botocore_exceptions.ConnectTimeoutError, botocore_exceptions.ReadTimeoutError,
+    botocore_exceptions.HTTPClientError,
+)
+
+
+def is_transient_error(exc):
+    if isinstance(exc, TRANSIENT_EXCEPTIONS):
+        return True
+    if isinstance(exc, botocore_exceptions.ClientError):
+        error = exc.response.get('Error', {})
+        status_code = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return error.get('Code') in TRANSIENT_ERROR_CODES or status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive transient failures and
+    rejects calls for ``reset_timeout`` seconds; then lets one trial call
+    through (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial_in_flight):
+                raise RecognitionUnavailable('Face recognition backend is temporarily unavailable.')
+            if state == 'half-open':
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """End a call that says nothing about the backend's health."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+def build_rekognition_client():
+    """
+    One pooled client per process: keep-alive connections, bounded timeouts
+    and botocore's own retries disabled (``RekognitionBackend`` retries with
+    jitter and feeds the circuit breaker instead). ``AWS_REKOGNITION_ENDPOINT_URL``
+    points it at a local stub endpoint for tests.
+    """
+    session = boto3.session.Session(
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_REGION_NAME
+    )
+    config = BotoConfig(
+        connect_timeout=settings.AWS_REKOGNITION_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_REKOGNITION_READ_TIMEOUT,
+        max_pool_connections=settings.AWS_REKOGNITION_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={'total_max_attempts': 1},
+    )
+    return session.client('rekognition', endpoint_url=settings.AWS_REKOGNITION_ENDPOINT_URL, config=config)
+
+
+class RekognitionBackend(BaseRecognitionBackend):
+
+    def __init__(self, collection_id=None, client=None, breaker=None):
+        super().__init__(collection_id)
+        self.client = client or build_rekognition_client()
+        self.breaker = breaker or CircuitBreaker(
+            settings.FACE_BREAKER_FAILURE_THRESHOLD,
+            settings.FACE_BREAKER_RESET_SECONDS
+        )
+        self.max_attempts = settings.FACE_RETRY_ATTEMPTS
+        self.base_delay = settings.FACE_RETRY_BASE_DELAY
+        self.max_delay = settings.FACE_RETRY_MAX_DELAY
+
+    def _call(self, operation, **params):
+        """Run one API call with jittered exponential backoff behind the breaker."""
+        self.breaker.before_call()
+        method = getattr(self.client, operation)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = method(**params)
+            except Exception as exc:
+                if not is_transient_error(exc):
+                    # طلب غلط (مثلاً مفيش وش في الصورة) مش عطل في الخدمة
+                    self.breaker.release()
+                    raise
+                if attempt == self.max_attempts:
+                    self.breaker.record_failure()
+                    raise
+                # "full jitter": sleep a random slice of the exponential window
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))))
+            else:
+                self.breaker.record_success()
+                return response
+
+    def ensure_collection(self, collection_id=None):
+        try:
+            self._call('create_collection', CollectionId=collection_id or self.collection_id)
+            return True
+        except self.client.exceptions.ResourceAlreadyExistsException:
+            return False
+
+    def index_face(self, image_bytes, external_id, collection_id=None):
+        response = self._call(
+            'index_faces',
+            CollectionId=collection_id or self.collection_id,
+            Image={'Bytes': image_bytes},
+            ExternalImageId=str(external_id),
+            MaxFaces=1,
+            QualityFilter="AUTO"
+        )
+        if response['FaceRecords']:
+            return response['FaceRecords'][0]['Face']['FaceId']
+        return None
+
+    def search_faces(self, image_bytes, max_faces=1, threshold=None, collection_id=None):
+        response = self._call(
+            'search_faces_by_image',
+            CollectionId=collection_id or self.collection_id,
+            Image={'Bytes': image_bytes},
+            MaxFaces=max_faces,
+            FaceMatchThreshold=threshold if threshold is not None else settings.FACE_MATCH_THRESHOLD
+        )
+        searched = response.get('SearchedFaceBoundingBox')
+        box = searched and FaceBox(
+            searched['Left'], searched['Top'], searched['Width'], searched['Height'],
+            response.get('SearchedFaceConfidence', 0.0)
+        )
+        return [
+            FaceMatch(m['Face']['ExternalImageId'], m['Face']['FaceId'], m['Similarity'], box)
+            for m in response['FaceMatches']
+        ]
+
+    def detect_faces(self, image_bytes):
+        response = self._call('detect_faces', Image={'Bytes': image_bytes}, Attributes=['DEFAULT'])
+        return [
+            FaceBox(d['BoundingBox']['Left'], d['BoundingBox']['Top'],
+                    d['BoundingBox']['Width'], d['BoundingBox']['Height'], d['Confidence'])
+            for d in response['FaceDetails']
+        ]
+
+    # حدود Rekognition: 4096 وش في الصفحة الواحدة وفي كل طلب حذف
+    PAGE_SIZE = 4096
+
+    def list_faces(self, collection_id=None):
+        params = {'CollectionId': collection_id or self.collection_id, 'MaxResults': self.PAGE_SIZE}
+        while True:
+            response = self._call('list_faces', **params)
+            for face in response['Faces']:
+                yield face['FaceId'], face.get('ExternalImageId', '')
+            if not response.get('NextToken'):
+                break
+            params['NextToken'] = response['NextToken']
+
+    def list_collections(self):
+        params = {}
+        while True:
+            response = self._call('list_collections', **params)
+            yield from response['CollectionIds']
+            if not response.get('NextToken'):
+                break
+            params['NextToken'] = response['NextToken']
+
+    def delete_faces(self, face_ids, collection_id=None):
+        face_ids = list(face_ids)
+        deleted = []
+        for i in range(0, len(face_ids), self.PAGE_SIZE):
+            response = self._call(
+                'delete_faces',
+                CollectionId=collection_id or self.collection_id,
+                FaceIds=face_ids[i:i + self.PAGE_SIZE]
+            )
+            deleted.extend(response['DeletedFaces'])
+        return deleted
+
+
+# ==============================================
+# 2. Local engine (NumPy + shared memory-mapped index)
+# ==============================================
+
+def pixel_embedding(image_bytes, size=32):
+    """
+    Default local embedder: an aligned, mean-centred grayscale thumbnail,
+    L2-normalised so that a dot product is the cosine similarity.
+    Swap it for a real face model via the ``FACE_EMBEDDER`` setting.
+    """
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert('L')
+    image = ImageOps.fit(image, (size, size))
+    vector = np.asarray(image, dtype=np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_IndexState = namedtuple('_IndexState', ['stamp', 'matrix', 'labels', 'header'])
+_NO_INDEX = _IndexState(None, None, [], None)
+
+
+class _MappedIndex:
+    """
+    One collection on disk: ``<name>.labels.json`` is a small header naming
+    the current version and how many rows of it are published; the version's
+    rows live in ``<name>.<version>.f32`` (raw float32, row-major (N, D)) and
+    its ``[face_id, external_id]`` labels in ``<name>.<version>.labels`` (one
+    JSON array per line).
+
+    Readers map the first N rows with ``np.memmap`` so every gunicorn worker
+    shares the same page-cache copy, and publish the (matrix, labels, header)
+    they loaded as one immutable tuple, so a search never pairs labels with
+    the wrong matrix. Writers work under an exclusive ``flock``: adding faces
+    appends to both files and then swaps the header with ``os.replace``
+    (readers still mapping N rows are unaffected), so a flush costs the new
+    rows only. Deleting faces writes a new version.
+    """
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.labels_path = os.path.join(directory, f'{name}.labels.json')
+        self.lock_path = os.path.join(directory, f'{name}.lock')
+        self._state = _NO_INDEX
+        self._reload_lock = threading.Lock()
+
+    def _current_stamp(self):
+        try:
+            stat = os.stat(self.labels_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _path(self, version, suffix):
+        return os.path.join(self.directory, f'{self.name}.{version}.{suffix}')
+
+    def _read_header(self):
+        try:
+            with open(self.labels_path) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def _read(self):
+        header = self._read_header()
+        if header is None:
+            raise FileNotFoundError(self.labels_path)
+        if 'version' not in header:
+            # older single-file layout: <name>.<uuid>.npy + the labels inline; the next write converts it
+            matrix = np.load(os.path.join(self.directory, header['matrix']), mmap_mode='r') if header['labels'] else None
+            return header, matrix, header['labels']
+        if not header['count']:
+            return header, None, []
+        matrix = np.memmap(self._path(header['version'], 'f32'), dtype=np.float32, mode='r',
+                           shape=(header['count'], header['dim']))
+        with open(self._path(header['version'], 'labels'), 'rb') as fh:
+            labels = [json.loads(line) for line in fh.read(header['labels_size']).splitlines()]
+        return header, matrix, labels
+
+    def load(self):
+        state = self._state
+        stamp = self._current_stamp()
+        if stamp != state.stamp:
+            with self._reload_lock:
+                state = self._state
+                if stamp != state.stamp:
+                    if stamp is None:
+                        state = _NO_INDEX
+                    else:
+                        try:
+                            header, matrix, labels = self._read()
+                        except FileNotFoundError:
+                            # a writer published a newer version between the two reads
+                            stamp = self._current_stamp()
+                            header, matrix, labels = self._read()
+                        state = _IndexState(stamp, matrix, labels, header)
+                    # one assignment: other threads see the old tuple or the new one, never a mix
+                    self._state = state
+        return state.matrix, state.labels
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _publish(self, header):
+        tmp_labels = self.labels_path + '.tmp'
+        with open(tmp_labels, 'w') as fh:
+            json.dump(header, fh)
+        os.replace(tmp_labels, self.labels_path)
+
+    def read_for_write(self):
+        """Load a private, writable copy of the current rows (call while locked)."""
+        if self._current_stamp() is None:
+            return [], []
+        header, matrix, labels = self._read()
+        rows = [] if matrix is None else list(np.array(matrix))
+        return rows, list(labels)
+
+    def append(self, items):
+        """Add ``(face_id, external_id, vector)`` items to the published version (call while locked)."""
+        header = self._read_header()
+        vectors = np.vstack([vector for _, _, vector in items]).astype(np.float32)
+        if header is None or 'version' not in header or (header['count'] and header['dim'] != vectors.shape[1]):
+            rows, labels = self.read_for_write()
+            self.write(rows + list(vectors), labels + [[face_id, external_id] for face_id, external_id, _ in items])
+            return
+        count, dim = header['count'], vectors.shape[1]
+        lines = ''.join(json.dumps([face_id, external_id]) + '\n' for face_id, external_id, _ in items).encode()
+        with open(self._path(header['version'], 'f32'), 'r+b') as fh:
+            # ما بعد الصفوف المنشورة بقايا append وقع قبل ما ينشر الـ header
+            fh.truncate(count * dim * 4)
+            fh.seek(0, os.SEEK_END)
+            fh.write(vectors.tobytes())
+        with open(self._path(header['version'], 'labels'), 'r+b') as fh:
+            fh.truncate(header['labels_size'])
+            fh.seek(0, os.SEEK_END)
+            fh.write(lines)
+        self._publish({
+            'version': header['version'], 'dim': dim, 'count': count + len(items),
+            'labels_size': header['labels_size'] + len(lines),
+        })
+
+    def write(self, rows, labels):
+        """Publish a new version of the index holding exactly ``rows`` (call while locked)."""
+        previous = self._read_header()
+        version = uuid.uuid4().hex
+        matrix = np.vstack(rows).astype(np.float32) if rows else np.zeros((0, 0), np.float32)
+        lines = ''.join(json.dumps(label) + '\n' for label in labels).encode()
+        with open(self._path(version, 'f32'), 'wb') as fh:
+            fh.write(matrix.tobytes())
+        with open(self._path(version, 'labels'), 'wb') as fh:
+            fh.write(lines)
+        self._publish({'version': version, 'dim': matrix.shape[1], 'count': len(labels), 'labels_size': len(lines)})
+        if previous:
+            # workers that still map the old file keep it alive until they remap
+            if 'version' in previous:
+                stale = [self._path(previous['version'], 'f32'), self._path(previous['version'], 'labels')]
+            else:
+                stale = [os.path.join(self.directory, previous['matrix'])]
+            for path in stale:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+class BufferedFaceBatch(FaceBatch):
+    """
+    Keeps the embeddings in memory and appends them to the index file once
+    per ``flush()``. Thread-safe: worker threads of one batch share it.
+    """
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def index_face(self, image_bytes, external_id, collection_id=None):
+        item = self.backend._embed(image_bytes, external_id)
+        with self._lock:
+            self._pending.setdefault(collection_id or self.backend.collection_id, []).append(item)
+        return item[0]
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for collection_id, items in pending.items():
+            self.backend._append(collection_id, items)
+
+
+class LocalEmbeddingBackend(BaseRecognitionBackend):
+    batch_class = BufferedFaceBatch
+
+    def __init__(self, collection_id=None, index_dir=None, embedder=None):
+        super().__init__(collection_id)
+        self.index_dir = index_dir or settings.FACE_INDEX_DIR
+        self.embedder = embedder or import_string(settings.FACE_EMBEDDER)
+        self._indexes = {}
+
+    def _index(self, collection_id=None):
+        name = collection_id or self.collection_id
+        if name not in self._indexes:
+            self._indexes[name] = _MappedIndex(self.index_dir, name)
+        return self._indexes[name]
+
+    def ensure_collection(self, collection_id=None):
+        index = self._index(collection_id)
+        if os.path.exists(index.labels_path):
+            return False
+        with index.locked():
+            index.write([], [])
+        return True
+
+    def _embed(self, image_bytes, external_id):
+        return str(uuid.uuid4()), str(external_id), self.embedder(image_bytes)
+
+    def index_face(self, image_bytes, external_id, collection_id=None):
+        item = self._embed(image_bytes, external_id)
+        self._append(collection_id or self.collection_id, [item])
+        return item[0]
+
+    def _append(self, collection_id, items):
+        index = self._index(collection_id)
+        with index.locked():
+            index.append(items)
+
+    def list_faces(self, collection_id=None):
+        for face_id, external_id in list(self._index(collection_id).load()[1]):
+            yield face_id, external_id
+
+    def list_collections(self):
+        suffix = '.labels.json'
+        if os.path.isdir(self.index_dir):
+            for name in sorted(os.listdir(self.index_dir)):
+                if name.endswith(suffix):
+                    yield name[:-len(suffix)]
+
+    def delete_faces(self, face_ids, collection_id=None):
+        face_ids = set(face_ids)
+        index = self._index(collection_id)
+        with index.locked():
+            rows, labels = index.read_for_write()
+            keep = [i for i, (face_id, _) in enumerate(labels) if face_id not in face_ids]
+            deleted = [face_id for face_id, _ in labels if face_id in face_ids]
+            if deleted:
+                index.write([rows[i] for i in keep], [labels[i] for i in keep])
+        return deleted
+
+    def search_faces(self, image_bytes, max_faces=1, threshold=None, collection_id=None):
+        matrix, labels = self._index(collection_id).load()
+        if matrix is None or not labels:
+            return []
+        threshold = settings.FACE_MATCH_THRESHOLD if threshold is None else threshold
+        query = self.embedder(image_bytes).astype(np.float32)
+        scores = np.asarray(matrix, dtype=np.float32) @ query * 100.0
+        k = min(max_faces, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            FaceMatch(labels[i][1], labels[i][0], float(scores[i]))
+            for i in top if scores[i] >= threshold
+        ]
+
+
+# ==============================================
+# 3. Deterministic stub (offline / load testing)
+# ==============================================
+
+class StubRecognitionBackend(BaseRecognitionBackend):
+    """
+    Never leaves the process. A frame whose bytes were indexed matches that
+    student exactly; any other frame is mapped onto a known student by its
+    hash, so replaying the same frames always yields the same results.
+    Known students are seeded from ``Student.face_id`` (or the shard table)
+    so separate worker processes agree without sharing memory.
+    """
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, collection_id=None, latency_ms=None):
+        super().__init__(collection_id)
+        self.latency = (settings.FACE_STUB_LATENCY_MS if latency_ms is None else latency_ms) / 1000.0
+
+    @staticmethod
+    def _digest(image_bytes):
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def _collection(self, collection_id=None):
+        name = collection_id or self.collection_id
+        with self._registry_lock:
+            if name not in self._registry:
+                from .models import Student, StudentFaceShard
+                if name == settings.FACE_COLLECTION_ID:
+                    known = Student.objects.exclude(face_id__isnull=True).exclude(
+                        face_id='').values_list('university_id', 'face_id')
+                else:
+                    known = StudentFaceShard.objects.filter(collection_id=name).values_list(
+                        'student__university_id', 'face_id')
+                faces = {}
+                for university_id, face_id in known:
+                    faces[face_id] = {'external_id': university_id, 'digest': None}
+                self._registry[name] = faces
+            return self._registry[name]
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def ensure_collection(self, collection_id=None):
+        self._collection(collection_id)
+        return False
+
+    def index_face(self, image_bytes, external_id, collection_id=None):
+        self._sleep()
+        digest = self._digest(image_bytes)
+        face_id = str(uuid.uuid5(uuid.NAMESPACE_OID, f'{external_id}:{digest}'))
+        faces = self._collection(collection_id)
+        with self._registry_lock:
+            faces[face_id] = {'external_id': str(external_id), 'digest': digest}
+        return face_id
+
+    def search_faces(self, image_bytes, max_faces=1, threshold=None, collection_id=None):
+        self._sleep()
+        faces = self._collection(collection_id)
+        if not faces:
+            return []
+        digest = self._digest(image_bytes)
+        with self._registry_lock:
+            ordered = sorted(faces.items())
+        for face_id, face in ordered:
+            if face['digest'] == digest:
+                return [FaceMatch(face['external_id'], face_id, 100.0)]
+        face_id, face = ordered[int(digest, 16) % len(ordered)]
+        return [FaceMatch(face['external_id'], face_id, 99.0)]
+
+    def list_faces(self, collection_id=None):
+        faces = self._collection(collection_id)
+        with self._registry_lock:
+            items = sorted(faces.items())
+        for face_id, face in items:
+            yield face_id, face['external_id']
+
+    def list_collections(self):
+        with self._registry_lock:
+            return sorted(self._registry)
+
+    def delete_faces(self, face_ids, collection_id=None):
+        faces = self._collection(collection_id)
+        with self._registry_lock:
+            return [face_id for face_id in face_ids if faces.pop(face_id, None) is not None]
+
+    @classmethod
+    def reset(cls):
+        with cls._registry_lock:
+            cls._registry.clear()
+
+
+# ==============================================
+# 4. Factory
+# ==============================================
+
+BACKENDS = {
+    'rekognition': RekognitionBackend,
+    'local': LocalEmbeddingBackend,
+    'stub': StubRecognitionBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_recognition_backend():
+    """Process-wide backend selected by ``settings.FACE_RECOGNITION_BACKEND``."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = settings.FACE_RECOGNITION_BACKEND
+                backend_class = BACKENDS.get(name) or import_string(name)
+                _backend = backend_class()
+    return _backend
+
+
+def reset_recognition_backend():
+    """Drop the cached backend (used by tests and after settings changes)."""
+    global _backend
+    with _backend_lock:
+        _backend = None
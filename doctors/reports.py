@@ -0,0 +1,246 @@
+# doctors/reports.py
+"""
+Lecture attendance PDFs (xhtml2pdf).
+
+The HTML comes from ``doctors/pdf/lecture_attendance.html`` (compiled once by
+the template loader) with the records and students in one query. The PDF is
+stored under ``REPORT_PDF_CACHE_DIR`` as ``lecture-<id>-<sha256 of the
+HTML>.pdf``: the hash is the lecture's data version, so once any record,
+student name or lecture field changes the HTML (and the file name) changes
+and the PDF is rendered again; a lecture that did not change is served from
+disk without calling xhtml2pdf. Older files of the lecture are removed when
+a new one is written.
+
+``iter_lecture_pdfs`` does the same for many lectures at once (end of term
+bundles): the HTML is built in this process, the CPU-bound xhtml2pdf calls
+run on a process pool and the results come back as they finish;
+``iter_zip_bundle`` streams them into a ZIP.
+"""
+import glob
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils import timezone
+from xhtml2pdf import pisa
+
+TEMPLATE_NAME = 'doctors/pdf/lecture_attendance.html'
+
+
+class PdfRenderError(Exception):
+    """xhtml2pdf reported errors for the document."""
+
+
+def lecture_html(lecture):
+    """The report HTML of ``lecture`` (which should have ``course`` and ``group`` loaded)."""
+    records = lecture.attendance_records.select_related('student').order_by('pk')
+    return get_template(TEMPLATE_NAME).render({'lecture': lecture, 'records': records})
+
+
+def render_pdf(html):
+    result = io.BytesIO()
+    pdf = pisa.pisaDocument(io.BytesIO(html.encode('UTF-8')), result)
+    if pdf.err:
+        raise PdfRenderError(f"{pdf.err} error(s) while rendering the PDF")
+    return result.getvalue()
+
+
+def _cache_path(lecture_id, html):
+    digest = hashlib.sha256(html.encode('UTF-8')).hexdigest()
+    return os.path.join(settings.REPORT_PDF_CACHE_DIR, f'lecture-{lecture_id}-{digest}.pdf')
+
+
+def _store(path, pdf, lecture_id):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # ملف مؤقت + os.replace: اللي بيقرا في نفس اللحظة يا يلاقي الملف كامل يا مايلاقيهوش
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(pdf)
+    os.replace(tmp_path, path)
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f'lecture-{lecture_id}-*.pdf')):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def open_lecture_pdf(lecture):
+    """
+    The up-to-date PDF of ``lecture`` as a binary file object, rendering it
+    only when its data changed.
+    """
+    html = lecture_html(lecture)
+    path = _cache_path(lecture.pk, html)
+    # open من غير exists الأول: طلب تاني ممكن يمسح الملف ده بين الاتنين وهو بيكتب نسخة أحدث
+    try:
+        return open(path, 'rb')
+    except FileNotFoundError:
+        pdf = render_pdf(html)
+        _store(path, pdf, lecture.pk)
+        return io.BytesIO(pdf)
+
+
+# ==============================================
+# Bundles (many lectures on a process pool)
+# ==============================================
+
+PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+
+
+def count_pages(pdf):
+    return len(PAGE_PATTERN.findall(pdf))
+
+
+def _render_job(lecture_id, html, path):
+    """Runs in a pool process: render, store, return ``(lecture_id, path, pages)``."""
+    pdf = render_pdf(html)
+    _store(path, pdf, lecture_id)
+    return lecture_id, path, count_pages(pdf)
+
+
+class RenderedLecture:
+
+    def __init__(self, lecture, path, pages, cached):
+        self.lecture = lecture
+        self.path = path
+        self.pages = pages
+        self.cached = cached
+
+    @property
+    def arcname(self):
+        lecture = self.lecture
+        group = lecture.group.name.replace('/', '-')
+        return f"{lecture.course.code}/{timezone.localtime(lecture.date_time):%Y-%m-%d_%H%M}_{group}_{lecture.pk}.pdf"
+
+
+def iter_lecture_pdfs(lectures, workers=None):
+    """
+    Yield a ``RenderedLecture`` for every lecture in ``lectures`` (course and
+    group loaded), in completion order. Lectures whose PDF is cached are
+    yielded straight away; the rest are rendered on ``workers`` processes
+    (``REPORT_PDF_WORKERS``), at most two jobs per worker in flight so the
+    HTML of a whole faculty is never held at once. ``workers=1`` renders in
+    this process.
+    """
+    workers = workers or settings.REPORT_PDF_WORKERS
+    pending = {}  # lecture_id -> lecture
+    jobs = ((lecture, lecture_html(lecture)) for lecture in lectures)
+
+    def next_job():
+        for lecture, html in jobs:
+            path = _cache_path(lecture.pk, html)
+            try:
+                with open(path, 'rb') as f:
+                    return RenderedLecture(lecture, path, count_pages(f.read()), cached=True), None
+            except FileNotFoundError:
+                return None, (lecture, html, path)
+        return None, None
+
+    if workers <= 1:
+        while True:
+            done, job = next_job()
+            if done:
+                yield done
+            elif job:
+                lecture, html, path = job
+                pdf = render_pdf(html)
+                _store(path, pdf, lecture.pk)
+                yield RenderedLecture(lecture, path, count_pages(pdf), cached=False)
+            else:
+                return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = set()
+        exhausted = False
+        while futures or not exhausted:
+            while not exhausted and len(futures) < workers * 2:
+                done, job = next_job()
+                if done:
+                    yield done
+                elif job:
+                    lecture, html, path = job
+                    pending[lecture.pk] = lecture
+                    futures.add(pool.submit(_render_job, lecture.pk, html, path))
+                else:
+                    exhausted = True
+            if not futures:
+                continue
+            finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                lecture_id, path, pages = future.result()
+                yield RenderedLecture(pending.pop(lecture_id), path, pages, cached=False)
+
+
+class BundleStats:
+    """Running totals of a bundle, for progress output."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = self.rendered = self.cached = self.pages = 0
+        self.started = time.monotonic()
+
+    def add(self, item):
+        self.done += 1
+        self.pages += item.pages
+        if item.cached:
+            self.cached += 1
+        else:
+            self.rendered += 1
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def pages_per_second(self):
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+
+class _ZipChunks:
+    """Write-only file object collecting what ``ZipFile`` writes, drained by ``iter_zip_bundle``."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def write_zip_bundle(lectures, output, workers=None, progress=None, total=None):
+    """Write the PDFs of ``lectures`` into a ZIP on the file object ``output``; returns the ``BundleStats``."""
+    stats = BundleStats(total if total is not None else len(lectures))
+    # الـ PDF مضغوط أصلاً: ZIP_STORED أسرع ومش بيكبر الحجم
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        for item in iter_lecture_pdfs(lectures, workers=workers):
+            bundle.write(item.path, item.arcname)
+            stats.add(item)
+            if progress:
+                progress(stats)
+    return stats
+
+
+def iter_zip_bundle(lectures, workers=None):
+    """The same ZIP as bytes chunks (one per lecture), for ``StreamingHttpResponse``."""
+    output = _ZipChunks()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        for item in iter_lecture_pdfs(lectures, workers=workers):
+            bundle.write(item.path, item.arcname)
+            yield output.drain()
+    yield output.drain()
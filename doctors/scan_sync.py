@@ -0,0 +1,155 @@
+# doctors/scan_sync.py
+"""
+Batch sync of offline scan events (kiosks that lost Wi-Fi, the mobile app).
+
+A call carries up to ``SCAN_SYNC_MAX_EVENTS`` events, each with a
+client-generated idempotency key. Keys seen before (in this batch or an
+earlier one) are answered with their first result; the rest are validated
+and mapped to lectures with a handful of set-based queries, then applied to
+``AttendanceRecord`` (missing rows inserted, ABSENT ones upgraded, any other
+status kept) and recorded as ``ScanEvent`` rows, all in one transaction.
+"""
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .attendance import invalidate_group_sessions
+from .ingest import LectureIntervalIndex, apply_scan_statuses
+from .models import AttendanceStatus, Group, ScanEvent, Student
+from .summaries import schedule_record_refresh
+
+BULK_BATCH_SIZE = 500
+# حالات الحضور اللي ممكن تيجي من جهاز تحضير (الغياب بيتسجل عند قفل الجلسة)
+SCAN_STATUSES = {AttendanceStatus.PRESENT, AttendanceStatus.LATE}
+
+APPLIED = 'applied'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+UNKNOWN_STUDENT = 'unknown_student'
+NOT_IN_GROUP = 'not_in_group'
+FORBIDDEN = 'forbidden'
+NO_LECTURE = 'no_lecture'
+
+
+def _parse_event(raw):
+    """``(event_dict, None)`` or ``(None, error message)``."""
+    if not isinstance(raw, dict):
+        return None, 'Event must be an object.'
+    key = str(raw.get('idempotency_key') or '').strip()
+    if not key or len(key) > 64:
+        return None, 'idempotency_key is required (max 64 characters).'
+    university_id = str(raw.get('university_id') or '').strip()
+    if not university_id:
+        return None, 'university_id is required.'
+    try:
+        group_id = int(raw.get('group_id'))
+    except (TypeError, ValueError):
+        return None, 'group_id must be an integer.'
+    scanned_at = parse_datetime(str(raw.get('scanned_at') or ''))
+    if scanned_at is None:
+        return None, 'scanned_at must be an ISO 8601 datetime.'
+    if timezone.is_naive(scanned_at):
+        scanned_at = timezone.make_aware(scanned_at)
+    status = str(raw.get('status') or AttendanceStatus.PRESENT).upper()
+    if status not in SCAN_STATUSES:
+        return None, f"status must be one of {sorted(SCAN_STATUSES)}."
+    return {
+        'idempotency_key': key,
+        'university_id': university_id,
+        'group_id': group_id,
+        'scanned_at': scanned_at,
+        'status': status,
+    }, None
+
+
+def apply_scan_events(raw_events, user, device_id=''):
+    """
+    Validate, dedupe and apply a batch of scan events for ``user`` (who must
+    teach the events' groups unless they are a superuser). Returns one result
+    dict per input event, in input order.
+    """
+    results = [None] * len(raw_events)
+    events = {}  # idempotency_key -> (position, event)
+    for position, raw in enumerate(raw_events):
+        event, error = _parse_event(raw)
+        if error:
+            key = raw.get('idempotency_key') if isinstance(raw, dict) else None
+            results[position] = {'idempotency_key': key, 'result': INVALID, 'detail': error}
+        elif event['idempotency_key'] in events:
+            results[position] = {'idempotency_key': event['idempotency_key'], 'result': DUPLICATE}
+        else:
+            events[event['idempotency_key']] = (position, event)
+
+    # مفاتيح اتبعتت قبل كده: نرجّع نفس النتيجة الأولى من غير ما نطبقها تاني
+    for key, result, lecture_id in ScanEvent.objects.filter(
+        idempotency_key__in=list(events)
+    ).values_list('idempotency_key', 'result', 'lecture_id'):
+        position, _ = events.pop(key)
+        results[position] = {'idempotency_key': key, 'result': DUPLICATE, 'first_result': result, 'lecture_id': lecture_id}
+
+    if events:
+        _apply(events, results, user, device_id)
+    return results
+
+
+def _apply(events, results, user, device_id):
+    pending = [event for _, event in events.values()]
+    student_ids = dict(
+        Student.objects.filter(university_id__in={e['university_id'] for e in pending})
+        .values_list('university_id', 'pk')
+    )
+    group_ids = {e['group_id'] for e in pending}
+    allowed_groups = Group.objects.filter(pk__in=group_ids)
+    if not user.is_superuser:
+        allowed_groups = allowed_groups.filter(course__doctor=user)
+    allowed_groups = set(allowed_groups.values_list('pk', flat=True))
+    memberships = set(
+        Student.groups.through.objects.filter(student_id__in=student_ids.values(), group_id__in=allowed_groups)
+        .values_list('student_id', 'group_id')
+    )
+    lectures = LectureIntervalIndex.for_groups(
+        allowed_groups,
+        since=min(e['scanned_at'] for e in pending),
+        until=max(e['scanned_at'] for e in pending),
+    )
+
+    records = {}  # (lecture_id, student_id) -> event; آخر scan للطالب في المحاضرة هو اللي بيتسجل
+    scan_rows = []
+    for position, event in events.values():
+        student_id = student_ids.get(event['university_id'])
+        lecture_id = None
+        if event['group_id'] not in allowed_groups:
+            result = FORBIDDEN
+        elif student_id is None:
+            result = UNKNOWN_STUDENT
+        elif (student_id, event['group_id']) not in memberships:
+            result = NOT_IN_GROUP
+        else:
+            lecture_id = lectures.find(event['group_id'], event['scanned_at'])
+            result = APPLIED if lecture_id else NO_LECTURE
+        if result == APPLIED:
+            previous = records.get((lecture_id, student_id))
+            if previous is None or previous['scanned_at'] <= event['scanned_at']:
+                records[(lecture_id, student_id)] = event
+        results[position] = {'idempotency_key': event['idempotency_key'], 'result': result, 'lecture_id': lecture_id}
+        scan_rows.append(ScanEvent(
+            idempotency_key=event['idempotency_key'],
+            university_id=event['university_id'],
+            group_id=event['group_id'] if event['group_id'] in allowed_groups else None,
+            lecture_id=lecture_id,
+            status=event['status'],
+            scanned_at=event['scanned_at'],
+            device_id=device_id,
+            result=result,
+        ))
+
+    with transaction.atomic():
+        # الـ scan بيسجل الطالب الناقص أو الغايب بس: العذر أو التعديل اليدوي مايتكتبش فوقه
+        apply_scan_statuses(
+            {key: event['status'] for key, event in records.items()}, batch_size=BULK_BATCH_SIZE
+        )
+        # ignore_conflicts: نفس المفتاح جه في طلبين في نفس اللحظة -> التطبيق idempotent أصلاً
+        ScanEvent.objects.bulk_create(scan_rows, ignore_conflicts=True, batch_size=BULK_BATCH_SIZE)
+        schedule_record_refresh((lecture_id, student_id) for lecture_id, student_id in records)
+        touched_groups = {event['group_id'] for event in records.values()}
+        transaction.on_commit(lambda: invalidate_group_sessions(*touched_groups))
@@ -0,0 +1,70 @@
+# doctors/search.py
+"""
+Student search (the search page and ``StudentAutocomplete``).
+
+On SQLite, names and university IDs are copied into an FTS5 table with the
+trigram tokenizer (migration 0009), so "any part of the name or ID" is an
+index lookup instead of two ``LIKE '%...%'`` scans of ``doctors_student``.
+The signals in ``signals.py`` keep the copy in sync and
+``rebuild_student_search_index`` refills it. Queries shorter than a trigram,
+and other database backends, fall back to prefix / ``icontains`` filters.
+"""
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'doctors_student_fts'
+MIN_FTS_QUERY = 3
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _fts_phrase(query):
+    # عبارة واحدة بين علامتين تنصيص = بحث عن جزء من النص زي icontains
+    return '"{}"'.format(query.replace('"', '""'))
+
+
+def search_students(queryset, query):
+    """Filter a ``Student`` queryset to names / university IDs containing ``query``."""
+    query = query.strip()
+    if not query:
+        return queryset
+    if not fts_enabled():
+        return queryset.filter(Q(name__icontains=query) | Q(university_id__icontains=query))
+    if len(query) < MIN_FTS_QUERY:
+        return queryset.filter(Q(name__istartswith=query) | Q(university_id__startswith=query))
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [_fts_phrase(query)]
+    ))
+
+
+def index_students(students):
+    """(Re)index these students (objects with ``pk``, ``name`` and ``university_id``)."""
+    rows = [(s.pk, s.name, s.university_id) for s in students]
+    if not rows or not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk, _, _ in rows])
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, university_id) VALUES (%s, %s, %s)', rows)
+
+
+def unindex_students(student_ids):
+    if not student_ids or not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in student_ids])
+
+
+def rebuild_student_index():
+    """Refill the index from ``doctors_student``; returns the number of indexed students."""
+    if not fts_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, university_id) SELECT id, name, university_id FROM doctors_student'
+        )
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
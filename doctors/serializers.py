@@ -1,11 +1,10 @@
 # doctors/serializers.py
 
 from rest_framework import serializers
-from django.db.models import Count, Q 
 from .models import Student, AttendanceRecord, Course, Lecture, Group, AttendanceStatus
 from .models import Announcement
-# --- ثابت حد الإنذار (WARNING_THRESHOLD)
-WARNING_THRESHOLD = 3 # حد الإنذار: 3 غيابات
+# --- ثابت حد الإنذار (WARNING_THRESHOLD): متعرف في analytics.py ومشترك مع الصفحات
+from .analytics import WARNING_THRESHOLD
 
 # --- 1. AttendanceRecord Serializer
 class AttendanceRecordSerializer(serializers.ModelSerializer):
@@ -52,25 +51,18 @@ class StudentProfileSerializer(serializers.ModelSerializer):
         """حساب الغيابات في كل مقرر ومقارنتها بحد الإنذار."""
         warning_details = []
         
-        # تجميع الغيابات حسب المقرر. يفترض أن رمز الغياب هو 'A' (Absent)
-        absence_counts = obj.attendance_records.filter(
-            Q(status='A')
-        ).values(
-            'lecture__course__code', 
-            'lecture__course__name'
-        ).annotate(
-            absences_count=Count('lecture__course__code')
-        )
+        # عدد الغياب لكل مقرر جاهز في AttendanceSummary
+        absence_counts = obj.attendance_summaries.filter(
+            absent__gte=WARNING_THRESHOLD
+        ).values('course__code', 'course__name', 'absent').order_by('pk')
         
-        # مقارنة كل مقرر بحد الإنذار
         for item in absence_counts:
-            if item['absences_count'] >= WARNING_THRESHOLD:
-                warning_details.append({
-                    'course_code': item['lecture__course__code'],
-                    'course_name': item['lecture__course__name'],
-                    'absences_count': item['absences_count'],
-                    'threshold': WARNING_THRESHOLD,
-                })
+            warning_details.append({
+                'course_code': item['course__code'],
+                'course_name': item['course__name'],
+                'absences_count': item['absent'],
+                'threshold': WARNING_THRESHOLD,
+            })
         
         return warning_details
 
@@ -0,0 +1,143 @@
+# doctors/signals.py
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .attendance import invalidate_group_sessions
+from .face_shards import schedule_shard_sync
+from .models import AttendanceRecord, Course, Group, Lecture, Student
+from .search import index_students, unindex_students
+from .summaries import invalidate_doctor_warnings, schedule_summary_refresh
+from .trends import note_attendance_changes
+
+
+@receiver(m2m_changed, sender=Student.groups.through)
+def student_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep the per-course face shards and the active sessions in sync with Student.groups."""
+    if action == 'pre_clear':
+        # group.students.clear() / student.groups.clear(): نحفظ الطرف التاني قبل ما العلاقة تتمسح
+        related = instance.students if reverse else instance.groups
+        instance._cleared_ids = list(related.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    changed = pk_set if action != 'post_clear' else getattr(instance, '_cleared_ids', [])
+    if reverse:
+        student_ids, group_ids = changed, [instance.pk]
+    else:
+        student_ids, group_ids = [instance.pk], changed
+    invalidate_group_sessions(*group_ids)
+    invalidate_doctor_warnings(*_doctors_of_groups(group_ids))
+    schedule_shard_sync(student_ids)
+
+
+# ==============================================
+# Active face sessions (attendance.py)
+# ==============================================
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, created, **kwargs):
+    # الاسم / الصورة / الرقم الجامعي بيتعرضوا من الـ roster المحفوظ
+    if not created:
+        group_ids = list(instance.groups.values_list('pk', flat=True))
+        invalidate_group_sessions(*group_ids)
+        invalidate_doctor_warnings(*_doctors_of_groups(group_ids))
+
+
+@receiver(pre_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    group_ids = list(instance.groups.values_list('pk', flat=True))
+    invalidate_group_sessions(*group_ids)
+    invalidate_doctor_warnings(*_doctors_of_groups(group_ids))
+
+
+@receiver(post_save, sender=Lecture)
+def lecture_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_group_sessions(instance.group_id)
+
+
+@receiver(post_delete, sender=Lecture)
+def lecture_deleted(sender, instance, **kwargs):
+    invalidate_group_sessions(instance.group_id)
+
+
+@receiver(post_save, sender=AttendanceRecord)
+@receiver(post_delete, sender=AttendanceRecord)
+def attendance_record_changed(sender, instance, **kwargs):
+    # تعديل يدوي للحضور (الأدمن / الشيت) -> قائمة الحاضرين في الذاكرة لازم تتقري تاني
+    try:
+        lecture = instance.lecture
+    except Lecture.DoesNotExist:
+        return
+    invalidate_group_sessions(lecture.group_id)
+    schedule_summary_refresh([(instance.student_id, lecture.course_id)])
+    note_attendance_changes([(lecture.course_id, lecture.date_time)])
+
+
+# ==============================================
+# Attendance summaries (summaries.py); bulk writers schedule their own refresh
+# ==============================================
+
+@receiver(pre_save, sender=Lecture)
+def lecture_course_before_save(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_course_id, instance._previous_date_time = (
+            Lecture.objects.filter(pk=instance.pk).values_list('course_id', 'date_time').first() or (None, None)
+        )
+
+
+@receiver(post_save, sender=Lecture)
+def lecture_summaries_after_save(sender, instance, created, **kwargs):
+    # المحاضرة اتنقلت لمقرر تاني أو اتغير ميعادها (last_lecture_at)
+    if created:
+        return
+    student_ids = list(instance.attendance_records.values_list('student_id', flat=True))
+    course_ids = {instance.course_id, getattr(instance, '_previous_course_id', None)} - {None}
+    schedule_summary_refresh((student_id, course_id) for student_id in student_ids for course_id in course_ids)
+    if student_ids:
+        previous = getattr(instance, '_previous_course_id', None), getattr(instance, '_previous_date_time', None)
+        note_attendance_changes([(instance.course_id, instance.date_time)] + ([previous] if previous[1] else []))
+
+
+# ==============================================
+# Dashboard warnings cache (summaries.doctor_warnings)
+# ==============================================
+
+def _doctors_of_groups(group_ids):
+    return set(Group.objects.filter(pk__in=group_ids).values_list('course__doctor_id', flat=True))
+
+
+@receiver(pre_save, sender=Course)
+def course_doctor_before_save(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_doctor_id = (
+            Course.objects.filter(pk=instance.pk).values_list('doctor_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    invalidate_doctor_warnings(*{instance.doctor_id, getattr(instance, '_previous_doctor_id', None)} - {None})
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # التسجيل في المجموعة بيتمسح معاها من غير m2m_changed
+    doctor_id = Course.objects.filter(pk=instance.course_id).values_list('doctor_id', flat=True).first()
+    if doctor_id:
+        invalidate_doctor_warnings(doctor_id)
+
+
+# ==============================================
+# Student search index (search.py)
+# ==============================================
+
+@receiver(post_save, sender=Student)
+def student_search_index_saved(sender, instance, **kwargs):
+    index_students([instance])
+
+
+@receiver(post_delete, sender=Student)
+def student_search_index_deleted(sender, instance, **kwargs):
+    unindex_students([instance.pk])
@@ -0,0 +1,242 @@
+# doctors/summaries.py
+"""
+Maintenance of ``AttendanceSummary`` (present / absent / late / excused
+counters per student and course).
+
+Every attendance write path reports the (student, course) pairs it touched
+through ``schedule_summary_refresh``; the pairs of one transaction are
+collected and, once it commits, recomputed from ``AttendanceRecord`` with one
+grouped query and upserted. Recomputing (instead of adding deltas) keeps the
+counters right for upserts that change an existing status. The face scan hot
+path knows each student's previous status and calls ``shift_summaries``
+instead, which moves the counters with ``F()`` deltas in one UPDATE.
+Single-row saves and deletes (admin edits, cascades) come in through the
+signals in ``signals.py``; ``rebuild_attendance_summaries`` rebuilds
+everything.
+
+``doctor_warnings`` reads the dashboard's absence warnings from the table
+with one query and caches them per doctor until that doctor's summaries,
+courses or enrollments change.
+"""
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateTimeField, F, Max, Min, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AttendanceRecord, AttendanceStatus, AttendanceSummary, Course, Lecture, Student
+from .trends import note_attendance_changes
+
+BULK_BATCH_SIZE = 500
+STATUS_FIELDS = {
+    AttendanceStatus.PRESENT: 'present',
+    AttendanceStatus.ABSENT: 'absent',
+    AttendanceStatus.LATE: 'late',
+    AttendanceStatus.EXCUSED: 'excused',
+}
+
+_pending = threading.local()
+
+
+def _aggregate(records):
+    """Grouped conditional counts of ``records`` per (student, course), in first-record order."""
+    return (
+        records.values('student_id', 'lecture__course_id')
+        .annotate(
+            last_lecture_at=Max('lecture__date_time'),
+            first_record=Min('pk'),
+            **{field: Count('pk', filter=Q(status=status)) for status, field in STATUS_FIELDS.items()},
+        )
+        .order_by('first_record')
+    )
+
+
+def _upsert(rows):
+    AttendanceSummary.objects.bulk_create(
+        [
+            AttendanceSummary(
+                student_id=row['student_id'],
+                course_id=row['lecture__course_id'],
+                last_lecture_at=row['last_lecture_at'],
+                **{field: row[field] for field in STATUS_FIELDS.values()},
+            )
+            for row in rows
+        ],
+        update_conflicts=True,
+        unique_fields=['student', 'course'],
+        update_fields=list(STATUS_FIELDS.values()) + ['last_lecture_at'],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def refresh_summaries(pairs):
+    """Recompute the summaries of the given (student_id, course_id) pairs now."""
+    pairs = set(pairs)
+    if not pairs:
+        return
+    student_ids = {student_id for student_id, _ in pairs}
+    course_ids = {course_id for _, course_id in pairs}
+    rows = [
+        row for row in _aggregate(
+            AttendanceRecord.objects.filter(student_id__in=student_ids, lecture__course_id__in=course_ids)
+        )
+        if (row['student_id'], row['lecture__course_id']) in pairs
+    ]
+    _upsert(rows)
+    invalidate_doctor_warnings(*Course.objects.filter(pk__in=course_ids).values_list('doctor_id', flat=True).distinct())
+    # الأزواج اللي مابقاش ليها ولا سجل (اتمسحت) -> نمسح الملخص بتاعها
+    gone = pairs - {(row['student_id'], row['lecture__course_id']) for row in rows}
+    if gone:
+        stale = Q()
+        for student_id, course_id in gone:
+            stale |= Q(student_id=student_id, course_id=course_id)
+        AttendanceSummary.objects.filter(stale).delete()
+
+
+def _flush_pending():
+    pairs = getattr(_pending, 'pairs', None)
+    _pending.pairs = None
+    if pairs:
+        refresh_summaries(pairs)
+
+
+def schedule_summary_refresh(pairs):
+    """
+    Refresh these (student_id, course_id) pairs once the current transaction
+    commits. Pairs are collected per thread and the first commit callback
+    refreshes all of them in one go (the other callbacks find nothing left);
+    pairs left over from a rolled-back transaction are just recomputed too.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    if getattr(_pending, 'pairs', None) is None:
+        _pending.pairs = set()
+    _pending.pairs |= pairs
+    transaction.on_commit(_flush_pending)
+
+
+def shift_summaries(course_id, doctor_id, moves, new_status, lecture_at):
+    """
+    Move students of one lecture of ``course_id`` to ``new_status`` in their
+    summaries with ``F()`` deltas, without reading anything. ``moves`` maps
+    each previous status (None for a new record) to the student ids that had
+    it. Students with no summary row yet are recomputed on commit instead.
+    """
+    new_field = STATUS_FIELDS[new_status]
+    lecture_at = Value(lecture_at, output_field=DateTimeField())
+    missing = set()
+    for old_status, student_ids in moves.items():
+        if old_status == new_status or not student_ids:
+            continue
+        changes = {
+            new_field: F(new_field) + 1,
+            'last_lecture_at': Greatest(Coalesce('last_lecture_at', lecture_at), lecture_at),
+        }
+        if old_status is not None:
+            old_field = STATUS_FIELDS[old_status]
+            changes[old_field] = F(old_field) - 1
+        updated = AttendanceSummary.objects.filter(course_id=course_id, student_id__in=student_ids).update(**changes)
+        if updated != len(student_ids):
+            # أول محاضرة للطالب في المقرر: مفيش صف نزود عليه
+            missing.update(student_ids)
+    schedule_summary_refresh((student_id, course_id) for student_id in missing)
+    # الإنذارات بتتحسب من الغياب بس
+    if AttendanceStatus.ABSENT in moves or new_status == AttendanceStatus.ABSENT:
+        invalidate_doctor_warnings(doctor_id)
+
+
+def schedule_record_refresh(lecture_student_pairs):
+    """
+    Same, for writers that know the (lecture_id, student_id) of the records
+    they wrote; the lectures are also reported to the trend series.
+    """
+    pairs = set(lecture_student_pairs)
+    if not pairs:
+        return
+    lectures = {
+        pk: (course_id, date_time)
+        for pk, course_id, date_time in Lecture.objects.filter(pk__in={lecture_id for lecture_id, _ in pairs})
+        .values_list('pk', 'course_id', 'date_time')
+    }
+    schedule_summary_refresh(
+        (student_id, lectures[lecture_id][0]) for lecture_id, student_id in pairs if lecture_id in lectures
+    )
+    note_attendance_changes(lectures.values())
+
+
+def rebuild_summaries(course_ids=None):
+    """Recompute every summary (optionally only for some courses) from scratch. Returns the row count."""
+    records = AttendanceRecord.objects.all()
+    summaries = AttendanceSummary.objects.all()
+    if course_ids:
+        records = records.filter(lecture__course_id__in=course_ids)
+        summaries = summaries.filter(course_id__in=course_ids)
+    courses = Course.objects.filter(pk__in=course_ids) if course_ids else Course.objects.all()
+    with transaction.atomic():
+        summaries.delete()
+        rows = list(_aggregate(records))
+        _upsert(rows)
+    invalidate_doctor_warnings(*courses.values_list('doctor_id', flat=True).distinct())
+    return len(rows)
+
+
+# ==============================================
+# Dashboard warnings, cached per doctor
+# ==============================================
+
+WARNINGS_VERSION_KEY = 'doctor-warnings-version:{}'
+WARNINGS_KEY = 'doctor-warnings:{}:{}:{}'
+WARNINGS_TIMEOUT = 60 * 60
+
+
+def invalidate_doctor_warnings(*doctor_ids):
+    """Bump the warnings version of these doctors; their next dashboard recomputes."""
+    for doctor_id in doctor_ids:
+        key = WARNINGS_VERSION_KEY.format(doctor_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+
+def _compute_doctor_warnings(doctor_id, threshold):
+    enrolled = Student.objects.filter(groups__course__doctor_id=doctor_id).values('pk')
+    flagged = AttendanceSummary.objects.filter(course__doctor_id=doctor_id, absent__gte=threshold).values('student_id')
+    # استعلام واحد: كل مقررات الدكتور للطلاب اللي عندهم إنذار في مقرر واحد على الأقل
+    rows = (
+        AttendanceSummary.objects
+        .filter(course__doctor_id=doctor_id, student_id__in=enrolled, absent__gt=0)
+        .filter(student_id__in=flagged)
+        .values_list('student_id', 'student__name', 'student__university_id', 'course__name', 'course__code', 'absent')
+        .order_by('student_id', 'course_id')
+    )
+    warnings = {}
+    for student_id, name, university_id, course_name, course_code, absent in rows:
+        entry = warnings.setdefault(student_id, {
+            'name': name,
+            'university_id': university_id,
+            'total_absences': 0,
+            'warning_courses': [],
+        })
+        entry['total_absences'] += absent
+        if absent >= threshold:
+            entry['warning_courses'].append({'course_name': course_name, 'course_code': course_code, 'absences': absent})
+    return list(warnings.values())
+
+
+def doctor_warnings(doctor_id, threshold):
+    """
+    Students of the doctor's courses with at least ``threshold`` absences in
+    one of them, as the dashboard shows them: name, university ID, absences
+    over all the doctor's courses and the courses over the threshold.
+    """
+    version = cache.get(WARNINGS_VERSION_KEY.format(doctor_id), 0)
+    key = WARNINGS_KEY.format(doctor_id, version, threshold)
+    warnings = cache.get(key)
+    if warnings is None:
+        warnings = _compute_doctor_warnings(doctor_id, threshold)
+        cache.set(key, warnings, WARNINGS_TIMEOUT)
+    return warnings
@@ -1,3 +1,1286 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from botocore import exceptions as botocore_exceptions
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import numpy as np
+from openpyxl import Workbook, load_workbook
+from PIL import Image, ImageDraw, ImageFilter
+
+from . import recognition, reports
+from .management.commands.index_students_faces import Command as IndexStudentsFacesCommand
+from .analytics import CourseAnalytics, reference_metrics
+from .exports import AttendanceMatrix
+from .checks import check_shared_cache
+from .attendance import close_session, get_active_session, open_session, record_lecture_attendance, reset_sessions
+from .face_shards import forget_missing_shards, search_for_group, search_in_shard, shard_collection_id
+from .imaging import assess_frame_quality, open_frame, prepare_frame
+from .models import AttendanceRecord, AttendanceSession, AttendanceStatus, AttendanceSummary, Course, DoctorProfile, FaceCollectionSnapshot, Group, Lecture, ScanEvent, Student, StudentFaceShard, UserRole
+from .search import search_students
+from .summaries import doctor_warnings, rebuild_summaries
+from .trends import MAX_CHANGES, _log_changes, attendance_series, note_attendance_changes
+from .recognition import (
+    CircuitBreaker, FaceBox, FaceMatch, LocalEmbeddingBackend, RecognitionUnavailable, RekognitionBackend,
+    StubRecognitionBackend, build_rekognition_client,
+)
+
+
+def make_image(seed, size=(120, 120)):
+    """Small synthetic JPEG; different seeds give clearly different pictures."""
+    image = Image.new('RGB', size, (40 + seed * 13 % 200, 90, 140))
+    draw = ImageDraw.Draw(image)
+    for i in range(6):
+        offset = (seed * 17 + i * 29) % 90
+        draw.ellipse((offset, 10 + i * 15, offset + 30, 40 + i * 15), fill=(255, 220 - i * 20, seed * 31 % 255))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def kiosk_frame(seed):
+    """A face drawn in the same spot of the same striped background; seeds change the face only."""
+    image = Image.new('RGB', (320, 240), (70, 90, 120))
+    draw = ImageDraw.Draw(image)
+    for x in range(0, 320, 16):
+        draw.rectangle((x, 0, x + 7, 240), fill=(200, 200, 190))
+    draw.rectangle((128, 72, 192, 156), fill=(60, 60, 60))
+    draw.ellipse((132, 76, 188, 152), fill=(225, 175, 140))
+    for i in range(4):
+        y = 84 + (seed * 7 + i * 17) % 60
+        x = 138 + (seed * 13 + i * 11) % 40
+        draw.rectangle((x, y, x + 10 + seed * 3, y + 4), fill=(40, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class LocalEmbeddingBackendTests(TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir)
+
+    def test_search_returns_best_match_first(self):
+        backend = LocalEmbeddingBackend(collection_id='test', index_dir=self.index_dir)
+        with backend.batch() as batch:
+            for seed in range(5):
+                batch.index_face(make_image(seed), f'2200{seed}')
+
+        # a second instance (another worker) sees the same memory-mapped index
+        reader = LocalEmbeddingBackend(collection_id='test', index_dir=self.index_dir)
+        matches = reader.search_faces(make_image(3), max_faces=3, threshold=0)
+        self.assertEqual(matches[0].external_id, '22003')
+        self.assertAlmostEqual(matches[0].similarity, 100.0, places=3)
+        self.assertEqual(len(matches), 3)
+
+    def test_overlapping_batches_keep_every_face(self):
+        backend = LocalEmbeddingBackend(collection_id='test', index_dir=self.index_dir)
+        with backend.batch() as outer:
+            outer.index_face(make_image(1), '22001')
+            with backend.batch() as inner:
+                inner.index_face(make_image(2), '22002')
+            outer.index_face(make_image(3), '22003')
+            backend.index_face(make_image(4), '22004')
+
+        self.assertCountEqual([external_id for _, external_id in backend.list_faces()], ['22001', '22002', '22003', '22004'])
+
+    def test_flushes_append_to_the_published_version_and_deletes_rewrite_it(self):
+        backend = LocalEmbeddingBackend(collection_id='test', index_dir=self.index_dir)
+        reader = LocalEmbeddingBackend(collection_id='test', index_dir=self.index_dir)
+
+        def header():
+            with open(os.path.join(self.index_dir, 'test.labels.json')) as fh:
+                return json.load(fh)
+
+        backend.index_face(make_image(1), '22001')
+        matrix_before, labels_before = reader._index().load()
+        version = header()['version']
+
+        face_id = backend.index_face(make_image(2), '22002')
+        backend.index_face(make_image(3), '22003')
+        self.assertEqual((header()['version'], header()['count']), (version, 3))
+        # the rows mapped before the appends are still a consistent pair
+        self.assertEqual((len(matrix_before), len(labels_before)), (1, 1))
+        self.assertEqual(reader.search_faces(make_image(3), threshold=0)[0].external_id, '22003')
+
+        self.assertEqual(backend.delete_faces([face_id]), [face_id])
+        self.assertNotEqual(header()['version'], version)
+        self.assertFalse(os.path.exists(os.path.join(self.index_dir, f'test.{version}.f32')))
+        self.assertEqual([external_id for _, external_id in reader.list_faces()], ['22001', '22003'])
+
+
+class IndexStudentsFacesCommandTests(TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        local = override_settings(
+            FACE_RECOGNITION_BACKEND='local', MEDIA_ROOT=os.path.join(self.work_dir, 'media'),
+            FACE_INDEX_DIR=os.path.join(self.work_dir, 'index'),
+        )
+        local.enable()
+        self.addCleanup(local.disable)
+        recognition.reset_recognition_backend()
+        self.addCleanup(recognition.reset_recognition_backend)
+        for seed in range(6):
+            student = Student(name=f'Student {seed}', university_id=f'300{seed}')
+            student.image.save(f'{seed}.jpg', ContentFile(make_image(seed)), save=True)
+        self.checkpoint = os.path.join(self.work_dir, 'checkpoint.json')
+
+    def indexed_ids(self):
+        return sorted(external_id for _, external_id in LocalEmbeddingBackend().list_faces())
+
+    def test_interrupted_run_has_flushed_every_saved_chunk_and_resumes(self):
+        on_disk = []
+
+        def interrupt_second_chunk(command, pool, students):
+            if on_disk:
+                raise KeyboardInterrupt
+            on_disk.append(self.indexed_ids())
+
+        options = {'chunk_size': 2, 'rate': 0, 'workers': 2, 'checkpoint': self.checkpoint, 'stdout': io.StringIO()}
+        with mock.patch.object(IndexStudentsFacesCommand, '_sync_shards', interrupt_second_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('index_students_faces', **options)
+
+        # chunk 1 was in the index before its checkpoint was written
+        self.assertEqual(on_disk, [['3000', '3001']])
+        with open(self.checkpoint) as fh:
+            self.assertEqual(json.load(fh)['last_pk'], Student.objects.get(university_id='3001').pk)
+        saved = set(Student.objects.exclude(face_id__isnull=True).exclude(face_id='').values_list('face_id', flat=True))
+        self.assertEqual({face_id for face_id, _ in LocalEmbeddingBackend().list_faces()}, saved)
+
+        with mock.patch.object(IndexStudentsFacesCommand, '_sync_shards'):
+            call_command('index_students_faces', **options)
+        self.assertEqual(self.indexed_ids(), [f'300{seed}' for seed in range(6)])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    @override_settings(FACE_SHARD_KEY='course', FACE_SHARD_SYNC_ASYNC=False)
+    def test_shard_faces_are_indexed_on_the_pool_behind_the_rate_limit(self):
+        course = Course.objects.create(name='AI', code='CS101', doctor=DoctorProfile.objects.create_user(username='dr', password='pw'))
+        group = Group.objects.create(name='G1', course=course)
+        with mock.patch('doctors.signals.schedule_shard_sync'):
+            group.students.add(*Student.objects.all())
+
+        with mock.patch('doctors.management.commands.index_students_faces.RateLimiter.wait') as wait:
+            call_command('index_students_faces', chunk_size=4, rate=5, workers=2, checkpoint=self.checkpoint, stdout=io.StringIO())
+        # one index call per student into each collection, and the shard created once
+        self.assertEqual(wait.call_count, 6 + 6 + 1)
+        shard = shard_collection_id(group)
+        self.assertEqual(sorted(external_id for _, external_id in LocalEmbeddingBackend().list_faces(collection_id=shard)), self.indexed_ids())
+        self.assertEqual(
+            set(StudentFaceShard.objects.values_list('face_id', flat=True)),
+            {face_id for face_id, _ in LocalEmbeddingBackend().list_faces(collection_id=shard)},
+        )
+
+
+@override_settings(FACE_STUB_LATENCY_MS=0)
+class StubRecognitionBackendTests(TestCase):
+
+    def setUp(self):
+        StubRecognitionBackend.reset()
+        self.addCleanup(StubRecognitionBackend.reset)
+
+    def test_indexed_frame_matches_exactly_and_others_are_deterministic(self):
+        backend = StubRecognitionBackend(collection_id='test')
+        backend.index_face(make_image(1), '1001')
+        backend.index_face(make_image(2), '1002')
+
+        self.assertEqual(backend.search_faces(make_image(2))[0].external_id, '1002')
+        unknown = make_image(9)
+        self.assertEqual(backend.search_faces(unknown), backend.search_faces(unknown))
+
+
+@override_settings(FACE_RECOGNITION_BACKEND='stub', FACE_STUB_LATENCY_MS=0)
+class ClassroomPhotoTests(TestCase):
+
+    def setUp(self):
+        StubRecognitionBackend.reset()
+        recognition.reset_recognition_backend()
+        self.addCleanup(StubRecognitionBackend.reset)
+        self.addCleanup(recognition.reset_recognition_backend)
+        self.doctor = DoctorProfile.objects.create_user(username='dr', password='pw')
+        course = Course.objects.create(name='AI', code='CS101', doctor=self.doctor)
+        self.group = Group.objects.create(name='G1', course=course)
+        self.student = Student.objects.create(name='Mona', university_id='1001')
+        self.student.groups.add(self.group)
+        self.client.force_login(self.doctor)
+        cache.clear()
+        reset_sessions()
+
+    def test_matched_faces_are_marked_present_in_one_request(self):
+        frame = make_image(4)
+        recognition.get_recognition_backend().index_face(frame, '1001')
+
+        response = self.client.post(
+            reverse('face_attendance_batch_check'),
+            data=json.dumps({
+                'image': 'data:image/jpeg;base64,' + base64.b64encode(frame).decode(),
+                'group_id': self.group.id,
+                'lecture_topic': 'Intro',
+            }),
+            content_type='application/json',
+        )
+
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['marked_count'], 1)
+        self.assertEqual(data['faces'][0]['university_id'], '1001')
+        record = AttendanceRecord.objects.get(student=self.student)
+        self.assertEqual(record.status, AttendanceStatus.PRESENT)
+
+    def test_unavailable_recognition_returns_503_for_classroom_photo(self):
+        frame = make_image(4)
+        with mock.patch.object(StubRecognitionBackend, 'search_faces', side_effect=RecognitionUnavailable('down')):
+            response = self.client.post(
+                reverse('face_attendance_batch_check'), data=frame, content_type='image/jpeg',
+                headers={'X-Group-Id': str(self.group.id), 'X-Lecture-Topic': 'Intro'},
+            )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(AttendanceRecord.objects.filter(status=AttendanceStatus.PRESENT).exists())
+
+    def test_binary_frame_upload_marks_student(self):
+        frame = make_image(4)
+        recognition.get_recognition_backend().index_face(frame, '1001')
+
+        response = self.client.post(
+            reverse('face_attendance_frame_check'), data=frame, content_type='image/jpeg',
+            headers={'X-Group-Id': str(self.group.id), 'X-Lecture-Topic': '%D9%85%D9%82%D8%AF%D9%85%D8%A9'},
+        )
+
+        self.assertEqual(response.json()['university_id'], '1001')
+        record = AttendanceRecord.objects.get(student=self.student)
+        self.assertEqual((record.status, record.lecture.topic), (AttendanceStatus.PRESENT, 'مقدمة'))
+
+    def test_repeated_kiosk_frame_skips_recognition(self):
+        frame = make_image(4)
+        recognition.get_recognition_backend().index_face(frame, '1001')
+        post = lambda: self.client.post(
+            reverse('face_attendance_frame_check'), data=frame, content_type='image/jpeg',
+            headers={'X-Group-Id': str(self.group.id), 'X-Lecture-Topic': 'Intro'},
+        ).json()
+
+        self.assertFalse(post()['already_marked'])
+        with mock.patch.object(StubRecognitionBackend, 'search_faces') as search:
+            second = post()
+        search.assert_not_called()
+        self.assertEqual((second['university_id'], second['already_marked']), ('1001', True))
+        self.assertEqual(AttendanceRecord.objects.get(student=self.student).status, AttendanceStatus.PRESENT)
+
+    def test_next_student_on_the_same_background_is_not_taken_for_the_previous_one(self):
+        other = Student.objects.create(name='Omar', university_id='1002')
+        other.groups.add(self.group)
+        box = FaceBox(0.4, 0.3, 0.2, 0.35, 99.0)
+        in_front = ['1001']
+        post = lambda frame: self.client.post(
+            reverse('face_attendance_frame_check'), data=frame, content_type='image/jpeg',
+            headers={'X-Group-Id': str(self.group.id), 'X-Lecture-Topic': 'Intro'},
+        ).json()
+
+        # the engine reports where the searched face is, as Rekognition does
+        with mock.patch.object(StubRecognitionBackend, 'search_faces',
+                               side_effect=lambda *args, **kwargs: [FaceMatch(in_front[0], 'f', 99.0, box)]) as search:
+            self.assertEqual(post(kiosk_frame(1))['university_id'], '1001')
+            self.assertTrue(post(kiosk_frame(1))['already_marked'])
+            calls = search.call_count
+            in_front[0] = '1002'
+            second = post(kiosk_frame(2))
+        self.assertGreater(search.call_count, calls)
+        self.assertEqual((second['university_id'], second['already_marked']), ('1002', False))
+        self.assertEqual(AttendanceRecord.objects.get(student=other).status, AttendanceStatus.PRESENT)
+
+    def test_warm_session_marks_a_student_without_reads(self):
+        other = Student.objects.create(name='Omar', university_id='1002')
+        other.groups.add(self.group)
+        with self.captureOnCommitCallbacks(execute=True):
+            record_lecture_attendance(self.group, 'Week 1', ['1001', '1002'])
+        backend = recognition.get_recognition_backend()
+        backend.index_face(make_image(4), '1001')
+        backend.index_face(make_image(9), '1002')
+        post = lambda frame: self.client.post(
+            reverse('face_attendance_frame_check'), data=frame, content_type='image/jpeg',
+            headers={'X-Group-Id': str(self.group.id), 'X-Lecture-Topic': 'Intro'},
+        ).json()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(post(make_image(4))['university_id'], '1001')
+
+        # commit callbacks run, as they do in autocommit: the budget covers the summary and trend upkeep
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(post(make_image(9))['university_id'], '1002')
+        sql = [q['sql'] for q in queries]
+        # session + user lookups, then the record insert and the summary delta in one transaction
+        # (a savepoint inside TestCase)
+        self.assertEqual(len(sql), 6, sql)
+        self.assertEqual([q.split()[0] for q in sql[2:]], ['SAVEPOINT', 'INSERT', 'UPDATE', 'RELEASE'])
+        self.assertIn('"doctors_attendancerecord"', sql[3])
+        self.assertIn('"doctors_attendancesummary"', sql[4])
+        self.assertEqual(AttendanceRecord.objects.get(student=other, lecture__topic='Intro').status, AttendanceStatus.PRESENT)
+        self.assertEqual(AttendanceSummary.objects.get(student=other).present, 2)
+
+        # roster changes reach the cached session through the signals
+        other.name = 'Omar Ali'
+        other.save()
+        self.assertEqual(post(make_image(9))['student_name'], 'Omar Ali')
+
+    def test_rejected_frame_does_not_open_a_session(self):
+        dark = io.BytesIO()
+        Image.new('RGB', (640, 480), (5, 5, 5)).save(dark, format='JPEG')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('face_attendance_frame_check'), data=dark.getvalue(), content_type='image/jpeg',
+                headers={'X-Group-Id': str(self.group.id), 'X-Lecture-Topic': 'Intro'},
+            ).json()
+        self.assertEqual(response['reason'], 'too_dark')
+        self.assertFalse([q['sql'] for q in queries if 'doctors_' in q['sql'] and 'doctors_doctorprofile' not in q['sql']])
+        self.assertFalse(AttendanceSession.objects.exists())
+
+
+class AttendanceSessionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reset_sessions()
+        self.doctor = DoctorProfile.objects.create_user(username='dr', password='pw')
+        course = Course.objects.create(name='AI', code='CS101', doctor=self.doctor)
+        self.group = Group.objects.create(name='G1', course=course)
+        self.students = [Student.objects.create(name=f'S{i}', university_id=f'200{i}') for i in range(3)]
+        self.group.students.add(*self.students)
+        self.client.force_login(self.doctor)
+
+    def open(self, topic):
+        return self.client.post(
+            reverse('face_attendance_session_open'),
+            data=json.dumps({'group_id': self.group.id, 'lecture_topic': topic}), content_type='application/json',
+        )
+
+    def test_devices_join_one_open_session_and_close_writes_absentees(self):
+        first, second = self.open('Intro').json(), self.open('Intro').json()
+        self.assertEqual(first['session_id'], second['session_id'])
+        self.assertEqual(self.open('Other topic').status_code, 409)
+        self.assertEqual(Lecture.objects.count(), 1)
+
+        get_active_session(self.group.id, 'Intro').mark_present(self.students[0].pk)
+        self.assertEqual(AttendanceRecord.objects.count(), 1)
+
+        response = self.client.post(
+            reverse('face_attendance_session_close'),
+            data=json.dumps({'session_id': first['session_id']}), content_type='application/json',
+        ).json()
+        self.assertEqual((response['present_count'], response['absent_count']), (1, 2))
+        self.assertEqual(
+            sorted(AttendanceRecord.objects.values_list('student__university_id', 'status')),
+            [('2000', AttendanceStatus.PRESENT), ('2001', AttendanceStatus.ABSENT), ('2002', AttendanceStatus.ABSENT)],
+        )
+        self.assertFalse(AttendanceSession.objects.filter(closed_at__isnull=True).exists())
+
+    @override_settings(FACE_RECOGNITION_BACKEND='stub', FACE_STUB_LATENCY_MS=0, FACE_QUALITY_PREFILTER=False)
+    def test_late_scans_do_not_reopen_a_closed_session(self):
+        session_id = self.open('Intro').json()['session_id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('face_attendance_session_close'),
+                data=json.dumps({'session_id': session_id}), content_type='application/json',
+            )
+
+        response = self.client.post(
+            reverse('face_attendance_frame_check'), data=make_image(1), content_type='image/jpeg',
+            headers={'X-Group-Id': str(self.group.id), 'X-Lecture-Topic': 'Intro'},
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(response.json()['session_closed'])
+        self.assertFalse(AttendanceSession.objects.filter(closed_at__isnull=True).exists())
+
+        # the group is free for the next lecture, and the doctor can still re-open this one
+        self.assertEqual(self.open('Lab').status_code, 200)
+        close_session(AttendanceSession.objects.get(closed_at__isnull=True))
+        self.assertNotEqual(self.open('Intro').json()['session_id'], session_id)
+
+    def test_open_retries_when_the_competing_session_is_already_closed(self):
+        create = AttendanceSession.objects.create
+        failures = [IntegrityError('open session exists')]
+
+        def racing_create(**kwargs):
+            # another device opened a session and closed it before we could read it
+            if failures:
+                raise failures.pop()
+            return create(**kwargs)
+
+        with mock.patch.object(AttendanceSession.objects, 'create', side_effect=racing_create):
+            session = open_session(self.group, 'Intro')
+        self.assertEqual((session.group, session.lecture.topic), (self.group, 'Intro'))
+
+        session.closed_at = session.opened_at
+        session.save()
+        with mock.patch.object(AttendanceSession.objects, 'create', side_effect=IntegrityError('broken')):
+            with self.assertRaises(IntegrityError):
+                open_session(self.group, 'Intro')
+
+
+    def test_late_evening_scans_join_the_lecture_of_the_local_day(self):
+        # 23:30 UTC is already the next day in Cairo
+        with mock.patch('django.utils.timezone.now', return_value=datetime(2026, 3, 1, 23, 30, tzinfo=dt_timezone.utc)):
+            first = open_session(self.group, 'Intro')
+            close_session(first)
+            second = open_session(self.group, 'Intro')
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(second.lecture, first.lecture)
+
+
+class SharedCacheCheckTests(TestCase):
+
+    def test_deploy_check_rejects_a_process_local_cache(self):
+        self.assertEqual([e.id for e in check_shared_cache(None)], ['doctors.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class AttendanceFileImportTests(TestCase):
+
+    def setUp(self):
+        self.doctor = DoctorProfile.objects.create_user(username='dr', password='pw', role=UserRole.DOCTOR)
+        course = Course.objects.create(name='AI', code='CS101', doctor=self.doctor)
+        self.group = Group.objects.create(name='G1', course=course)
+        self.group.students.add(*[Student.objects.create(name=f'S{i}', university_id=f'300{i}') for i in range(4)])
+        self.client.force_login(self.doctor)
+
+    def upload(self, name, content):
+        return self.client.post(
+            reverse('take_attendance', args=[self.group.id]),
+            {'lecture_topic': 'Week 1', 'attendance_file': SimpleUploadedFile(name, content)},
+            follow=True,
+        )
+
+    def test_csv_and_xlsx_rows_are_written_in_bulk_with_unmatched_ids_reported(self):
+        response = self.upload('scan.csv', '\ufeffStudent ID,Time\n3000,08:01\n3002,08:03\n9999,08:04\n'.encode())
+        statuses = dict(AttendanceRecord.objects.values_list('student__university_id', 'status'))
+        self.assertEqual(statuses, {'3000': 'P', '3001': 'A', '3002': 'P', '3003': 'A'})
+        self.assertIn('9999', ' '.join(str(m) for m in response.context['messages']))
+
+        workbook = Workbook()
+        workbook.active.append(['ID'])
+        workbook.active.append([3001.0])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        self.upload('scan.xlsx', buffer.getvalue())
+        lecture = Lecture.objects.latest('pk')
+        self.assertEqual(
+            list(lecture.attendance_records.filter(status='P').values_list('student__university_id', flat=True)),
+            ['3001'],
+        )
+
+
+class ScanEventSyncTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = DoctorProfile.objects.create_user(username='dr', password='pw')
+        course = Course.objects.create(name='AI', code='CS101', doctor=self.doctor)
+        self.group = Group.objects.create(name='G1', course=course)
+        self.student = Student.objects.create(name='Mona', university_id='1001')
+        self.student.groups.add(self.group)
+        self.lecture = Lecture.objects.create(
+            course=course, group=self.group, topic='Intro', date_time=datetime(2026, 3, 1, 10, 0, tzinfo=dt_timezone.utc)
+        )
+        self.client.force_login(self.doctor)
+
+    def sync(self, events):
+        return self.client.post(
+            reverse('api_scan_events_sync'), data=json.dumps({'device_id': 'kiosk-1', 'events': events}),
+            content_type='application/json',
+        ).json()
+
+    def test_events_are_mapped_deduped_and_idempotent(self):
+        event = {'idempotency_key': 'k1', 'university_id': '1001', 'group_id': self.group.id, 'scanned_at': '2026-03-01T10:05:00Z'}
+        data = self.sync([
+            event,
+            dict(event),
+            dict(event, idempotency_key='k2', university_id='404'),
+            dict(event, idempotency_key='k3', scanned_at='2026-03-01T20:00:00Z'),
+            {'idempotency_key': 'k4'},
+        ])
+        self.assertEqual(
+            [r['result'] for r in data['results']],
+            ['applied', 'duplicate', 'unknown_student', 'no_lecture', 'invalid'],
+        )
+        self.assertEqual(data['results'][0]['lecture_id'], self.lecture.id)
+        self.assertEqual(AttendanceRecord.objects.get().status, AttendanceStatus.PRESENT)
+
+        retry = self.sync([event])['results'][0]
+        self.assertEqual((retry['result'], retry['first_result']), ('duplicate', 'applied'))
+        self.assertEqual(ScanEvent.objects.count(), 3)
+
+    def test_synced_scans_only_upgrade_missing_and_absent_records(self):
+        others = [Student.objects.create(name=f'S{i}', university_id=f'200{i}') for i in range(2)]
+        self.group.students.add(*others)
+        AttendanceRecord.objects.create(lecture=self.lecture, student=self.student, status=AttendanceStatus.EXCUSED)
+        AttendanceRecord.objects.create(lecture=self.lecture, student=others[0], status=AttendanceStatus.ABSENT)
+
+        self.sync([
+            {'idempotency_key': f'k{university_id}', 'university_id': university_id, 'group_id': self.group.id,
+             'scanned_at': '2026-03-01T10:20:00Z', 'status': 'L'}
+            for university_id in ('1001', '2000', '2001')
+        ])
+        self.assertEqual(
+            dict(AttendanceRecord.objects.values_list('student__university_id', 'status')),
+            {'1001': AttendanceStatus.EXCUSED, '2000': AttendanceStatus.LATE, '2001': AttendanceStatus.LATE},
+        )
+
+
+class RfidLogIngestTests(TestCase):
+
+    def test_swipes_are_assigned_to_the_running_lecture(self):
+        doctor = DoctorProfile.objects.create_user(username='dr', password='pw')
+        course = Course.objects.create(name='AI', code='CS101', doctor=doctor)
+        group = Group.objects.create(name='G1', course=course)
+        students = [Student.objects.create(name=f'S{i}', university_id=f'400{i}') for i in range(3)]
+        group.students.add(*students)
+        cairo = ZoneInfo('Africa/Cairo')
+        morning = Lecture.objects.create(course=course, group=group, topic='AM', date_time=datetime(2026, 3, 1, 9, 0, tzinfo=cairo))
+        noon = Lecture.objects.create(course=course, group=group, topic='PM', date_time=datetime(2026, 3, 1, 12, 0, tzinfo=cairo))
+        # an excused record is not overwritten by a swipe
+        AttendanceRecord.objects.create(lecture=morning, student=students[1], status=AttendanceStatus.EXCUSED)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as log:
+            log.write('4000,2026-03-01 08:50:00\n4001 2026-03-01T11:55:00\n4000,2026-03-01 12:10:00\n'
+                      '4001,2026-03-01 09:05:00\n4002,2026-03-01 18:00:00\n9999,2026-03-01 09:00:00\ngarbage\n')
+        self.addCleanup(os.remove, log.name)
+        out = io.StringIO()
+        call_command('ingest_rfid_log', log.name, '--chunk-size', '2', '--mark-absent', stdout=out)
+
+        statuses = lambda lecture: dict(lecture.attendance_records.values_list('student__university_id', 'status'))
+        self.assertEqual(statuses(morning), {'4000': 'P', '4001': 'E', '4002': 'A'})
+        self.assertEqual(statuses(noon), {'4000': 'P', '4001': 'P', '4002': 'A'})
+        self.assertIn('rows/s', out.getvalue())
+
+
+# Response of the original per-course count() implementation for the fixture below
+STATISTICS_BASELINE_JSON = (
+    b'{"university_id":"1001","overall":{"total_lectures":14,"attended":6,"present":4,"absent":6,"late":2,'
+    b'"excused":2,"attendance_rate":42.86},"warning_threshold":3,"per_course":[{"course_code":"ZZ9",'
+    b'"course_name":"Zoology","total_lectures":7,"present":2,"absent":3,"late":1,"excused":1,'
+    b'"attendance_rate":42.86,"is_at_risk":true},{"course_code":"AA1","course_name":"Algebra",'
+    b'"total_lectures":7,"present":2,"absent":3,"late":1,"excused":1,"attendance_rate":42.86,"is_at_risk":true}]}'
+)
+
+
+class StudentStatisticsTests(TestCase):
+
+    def setUp(self):
+        DoctorProfile.objects.create_user(username='dr', password='pw')
+        self.student = Student.objects.create(name='Mona', university_id='1001')
+        self.statuses = ['P', 'A', 'L', 'E', 'A', 'P', 'A']
+
+    def add_course(self, code, name):
+        course = Course.objects.create(name=name, code=code, doctor=DoctorProfile.objects.get())
+        group = Group.objects.create(name=f'{code}-G1', course=course)
+        # the summaries are refreshed on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for day, status in enumerate(self.statuses):
+                lecture = Lecture.objects.create(
+                    course=course, group=group, topic=f'L{day}', date_time=datetime(2026, 3, day + 1, 10, tzinfo=dt_timezone.utc)
+                )
+                AttendanceRecord.objects.create(lecture=lecture, student=self.student, status=status)
+        self.statuses = self.statuses[1:] + self.statuses[:1]
+
+    def get(self):
+        return self.client.get(reverse('api_student_statistics', args=['1001']))
+
+    def test_response_is_unchanged_and_query_count_is_constant(self):
+        self.add_course('ZZ9', 'Zoology')
+        self.add_course('AA1', 'Algebra')
+        with self.assertNumQueries(2):
+            response = self.get()
+        self.assertEqual(response.content, STATISTICS_BASELINE_JSON)
+
+        for i in range(5):
+            self.add_course(f'C{i}', f'Course {i}')
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.get().json()['per_course']), 7)
+
+
+class AttendanceSummaryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = doctor = DoctorProfile.objects.create_user(username='dr', password='pw')
+        self.course = Course.objects.create(name='Algebra', code='AA1', doctor=doctor)
+        self.group = Group.objects.create(name='G1', course=self.course)
+        self.students = [Student.objects.create(name=f'S{i}', university_id=f'10{i}') for i in range(3)]
+        self.group.students.add(*self.students)
+
+    def counts(self):
+        return {
+            s.student.university_id: (s.present, s.absent, s.late, s.excused)
+            for s in AttendanceSummary.objects.select_related('student')
+        }
+
+    def test_write_paths_keep_summaries_in_step_with_records(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_lecture_attendance(self.group, 'L1', ['100', '101'])
+        with self.captureOnCommitCallbacks(execute=True):
+            lecture = record_lecture_attendance(self.group, 'L2', ['100']).lecture
+        self.assertEqual(self.counts(), {'100': (2, 0, 0, 0), '101': (1, 1, 0, 0), '102': (0, 2, 0, 0)})
+
+        record = AttendanceRecord.objects.get(lecture=lecture, student__university_id='101')
+        with self.captureOnCommitCallbacks(execute=True):
+            record.status = AttendanceStatus.EXCUSED
+            record.save()
+        self.assertEqual(self.counts()['101'], (1, 0, 0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Lecture.objects.all().delete()
+        self.assertEqual(self.counts(), {})
+
+    def test_scans_move_the_counters_of_the_previous_status(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_lecture_attendance(self.group, 'L1', ['100'])
+            session = get_active_session(self.group.id, 'L2')
+            session.mark_present(self.students[0].pk)
+            close_session(session.session)
+        self.assertEqual(self.counts(), {'100': (2, 0, 0, 0), '101': (0, 2, 0, 0), '102': (0, 2, 0, 0)})
+
+        # the doctor re-opens the lecture and two workers join; the second one has not seen the first one's scans
+        first = get_active_session(self.group.id, 'L2', reopen=True)
+        reset_sessions()
+        second = get_active_session(self.group.id, 'L2')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.mark_many_present([s.pk for s in self.students[1:]])
+        with self.captureOnCommitCallbacks(execute=True):
+            second.mark_present(self.students[1].pk)
+        expected = {'100': (2, 0, 0, 0), '101': (1, 1, 0, 0), '102': (1, 1, 0, 0)}
+        self.assertEqual(self.counts(), expected)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            close_session(first.session)
+        third = get_active_session(self.group.id, 'L3')
+        # another worker's scan, written after this one loaded the session
+        AttendanceRecord.objects.bulk_create([
+            AttendanceRecord(lecture=third.lecture, student=self.students[0], status=AttendanceStatus.PRESENT)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            third.mark_present(self.students[0].pk)
+        expected['100'] = (3, 0, 0, 0)
+        self.assertEqual(self.counts(), expected)
+        rebuild_summaries()
+        self.assertEqual(self.counts(), expected)
+
+    def test_rebuild_matches_incremental_maintenance(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_lecture_attendance(self.group, 'L1', ['100'])
+            record_lecture_attendance(self.group, 'L2', ['101', '102'])
+        incremental = self.counts()
+        AttendanceSummary.objects.all().delete()
+        self.assertEqual(rebuild_summaries(), 3)
+        self.assertEqual(self.counts(), incremental)
+
+    def test_dashboard_warnings_are_cached_until_the_doctors_data_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for topic in ('L1', 'L2', 'L3'):
+                record_lecture_attendance(self.group, topic, ['100', '101'])
+        with self.assertNumQueries(1):
+            self.assertEqual(doctor_warnings(self.doctor.pk, 3), [
+                {'name': 'S2', 'university_id': '102', 'total_absences': 3,
+                 'warning_courses': [{'course_name': 'Algebra', 'course_code': 'AA1', 'absences': 3}]},
+            ])
+        with self.assertNumQueries(0):
+            doctor_warnings(self.doctor.pk, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for topic in ('L4', 'L5', 'L6'):
+                record_lecture_attendance(self.group, topic, ['100'])
+        self.assertEqual(
+            [(w['university_id'], w['total_absences']) for w in doctor_warnings(self.doctor.pk, 3)],
+            [('101', 3), ('102', 6)],
+        )
+
+
+class CourseReportTests(TestCase):
+
+    def setUp(self):
+        doctor = DoctorProfile.objects.create_user(username='dr', password='pw', role=UserRole.DOCTOR)
+        self.client.force_login(doctor)
+        self.course = Course.objects.create(name='Algebra', code='AA1', doctor=doctor)
+        self.group = group = Group.objects.create(name='G1', course=self.course)
+        students = [Student.objects.create(name=f'S{i:02}', university_id=f'2{i:03}') for i in range(60)]
+        group.students.add(*students)
+        with self.captureOnCommitCallbacks(execute=True):
+            for lecture in range(4):
+                # S00-S04 miss every lecture, S05-S09 miss the first two
+                present = [s.university_id for i, s in enumerate(students) if i >= 10 or (5 <= i and lecture >= 2)]
+                record_lecture_attendance(group, f'L{lecture}', present)
+
+    def get(self, **params):
+        return self.client.get(reverse('course_report', args=[self.course.pk]), params)
+
+    def test_pages_are_ordered_in_sql_with_a_fixed_query_count(self):
+        with CaptureQueriesContext(connection) as first:
+            response = self.get()
+        rows = response.context['student_data']
+        self.assertEqual(len(rows), 50)
+        self.assertEqual([r['id'] for r in rows[:6]], ['2000', '2001', '2002', '2003', '2004', '2005'])
+        self.assertEqual((rows[0]['absent_count'], rows[0]['attendance_percentage']), (4, '0.0'))
+        self.assertEqual(response.context['at_risk_count'], 5)
+
+        with CaptureQueriesContext(connection) as second:
+            response = self.get(page=2)
+        self.assertEqual(len(response.context['student_data']), 10)
+        self.assertEqual(len(first), len(second))
+
+        response = self.get(risk='at_risk')
+        self.assertEqual([r['absent_count'] for r in response.context['student_data']], [4] * 5)
+
+    def test_group_list_counts_absences_of_the_groups_course_only(self):
+        other = Group.objects.create(name='G1', course=Course.objects.create(name='Physics', code='PH1', doctor=self.course.doctor))
+        other.students.add(Student.objects.get(university_id='2005'))
+        with self.captureOnCommitCallbacks(execute=True):
+            record_lecture_attendance(other, 'L0', [])
+            record_lecture_attendance(other, 'L1', [])
+
+        response = self.client.get(reverse('group_student_list', args=[self.group.pk]))
+        students = {s.university_id: s for s in response.context['students']}
+        self.assertEqual((students['2005'].total_absences, students['2005'].has_warning), (2, False))
+        self.assertEqual(students['2000'].warning_status_text, 'High Risk (4 Absences in AA1)')
+        self.assertEqual(sum(s.has_warning for s in students.values()), 5)
+
+
+class AttendanceMatrixExportTests(TestCase):
+
+    def setUp(self):
+        doctor = DoctorProfile.objects.create_user(username='dr', password='pw', role=UserRole.DOCTOR)
+        self.client.force_login(doctor)
+        self.course = Course.objects.create(name='Algebra', code='AA1', doctor=doctor)
+        group = Group.objects.create(name='G1', course=self.course)
+        self.students = [Student.objects.create(name=f'S{i}', university_id=f'10{i}') for i in range(3)]
+        group.students.add(*self.students)
+        for day, present in enumerate([['100', '101'], ['100']]):
+            record_lecture_attendance(group, f'L{day}', present, date_time=datetime(2026, 3, day + 1, 10, tzinfo=dt_timezone.utc))
+        AttendanceRecord.objects.filter(student=self.students[1], status=AttendanceStatus.ABSENT).update(status=AttendanceStatus.LATE)
+        # S2 left the group but keeps their records
+        group.students.remove(self.students[2])
+
+    def url(self, **params):
+        return reverse('export_attendance_matrix', args=[self.course.pk]) + ('?format=xlsx' if params else '')
+
+    def test_csv_and_xlsx_have_one_row_per_student_and_one_column_per_lecture(self):
+        response = self.client.get(self.url())
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines, [
+            'University ID,Name,2026-03-01 12:00,2026-03-02 12:00,Present,Absent,Late,Excused,Attendance %',
+            '100,S0,P,P,2,0,0,0,100.0',
+            '101,S1,P,L,1,0,1,0,100.0',
+            '102,S2,A,A,0,2,0,0,0.0',
+        ])
+
+        response = self.client.get(self.url(xlsx=True))
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[2], ('101', 'S1', 'P', 'L', 1, 0, 1, 0, 100))
+        self.assertEqual(len(rows), 4)
+
+
+class AnalyticsEngineTests(TestCase):
+
+    def test_vectorized_metrics_match_the_python_loops(self):
+        P, A, L, E = 1, 2, 3, 4
+        statuses = np.array([
+            [A, A, P, A, A, A],
+            [P, L, L, E, 0, P],
+            [P, P, A, A, A, A],
+            # the course has two groups: the other group's lectures are 0
+            [A, 0, A, 0, A, 0],
+            [0, A, 0, P, 0, A],
+        ], dtype=np.int8)
+        rng = np.random.default_rng(1)
+        statuses = np.vstack([statuses, rng.integers(0, 5, size=(200, 6), dtype=np.int8)])
+        analytics = CourseAnalytics(AttendanceMatrix([(i, str(i), '') for i in range(205)], [(j, None, '') for j in range(6)], statuses))
+
+        self.assertEqual(analytics.longest_streak[:5].tolist(), [3, 0, 4, 3, 1])
+        self.assertEqual(analytics.current_streak[:5].tolist(), [3, 0, 4, 3, 1])
+        self.assertEqual(analytics.crossed_at[:5].tolist(), [3, -1, 4, 4, -1])
+        self.assertEqual(analytics.late_ratio[1], round(2 / 4, 3))
+        reference = reference_metrics(statuses.tolist())
+        for field in ('absences', 'lates', 'late_ratio', 'longest_streak', 'current_streak', 'at_risk', 'crossed_at'):
+            self.assertEqual([r[field] for r in reference], getattr(analytics, field).tolist(), field)
+
+        out = io.StringIO()
+        call_command('benchmark_analytics', students=300, lectures=20, repeat=1, stdout=out)
+        self.assertIn('300 students x 20 lectures', out.getvalue())
+
+
+    def test_course_without_lectures_has_empty_metrics(self):
+        analytics = CourseAnalytics(AttendanceMatrix([(1, '1', ''), (2, '2', '')], [], np.zeros((2, 0), dtype=np.int8)))
+        self.assertEqual(analytics.current_streak.tolist(), [0, 0])
+        self.assertEqual(analytics.crossed_at.tolist(), [-1, -1])
+
+        doctor = DoctorProfile.objects.create_user(username='dr', password='pw', role=UserRole.DOCTOR)
+        self.client.force_login(doctor)
+        course = Course.objects.create(name='Algebra', code='AA1', doctor=doctor)
+        Group.objects.create(name='G1', course=course).students.add(Student.objects.create(name='S0', university_id='100'))
+        response = self.client.get(reverse('course_report', args=[course.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['student_data'][0]['current_streak'], 0)
+
+
+class AttendanceTrendTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        doctor = DoctorProfile.objects.create_user(username='dr', password='pw', role=UserRole.DOCTOR)
+        self.client.force_login(doctor)
+        self.course = Course.objects.create(name='Algebra', code='AA1', doctor=doctor)
+        self.group = Group.objects.create(name='G1', course=self.course)
+        self.group.students.add(*[Student.objects.create(name=f'S{i}', university_id=f'10{i}') for i in range(4)])
+        # Mon 2 and Thu 5 March are one week, Mon 9 March the next
+        for day, present in ((2, ['100', '101']), (5, ['100']), (9, ['100', '101', '102'])):
+            self.add_lecture(day, present)
+
+    def add_lecture(self, day, present):
+        with self.captureOnCommitCallbacks(execute=True):
+            return record_lecture_attendance(
+                self.group, f'L{day}', present, date_time=datetime(2026, 3, day, 10, tzinfo=dt_timezone.utc)
+            ).lecture
+
+    def get(self, **params):
+        return self.client.get(reverse('api_attendance_trends', args=['course', self.course.pk]), params).json()
+
+    def test_weekly_series_is_bucketed_in_sql_and_refreshed_incrementally(self):
+        self.assertEqual(self.get(), {
+            'scope': 'course', 'id': self.course.pk, 'bucket': 'week',
+            'buckets': ['2026-03-02', '2026-03-09'],
+            'total': [8, 4], 'present': [3, 3], 'absent': [5, 1], 'late': [0, 0], 'excused': [0, 0],
+            'rate': [37.5, 75.0],
+        })
+        with self.assertNumQueries(3):  # session, user and course lookups; the series comes from the cache
+            self.get()
+
+        lecture = self.add_lecture(16, ['103'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get()['total'], [8, 4, 4])
+        # only the week of the change is recomputed
+        self.assertIn("'2026-03-16'", queries.captured_queries[-1]['sql'])
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceRecord.objects.filter(lecture=lecture).delete()
+        self.assertEqual(self.get()['buckets'], ['2026-03-02', '2026-03-09'])
+
+        days = self.client.get(reverse('api_student_trends', args=['101']), {'bucket': 'day'}).json()
+        self.assertEqual((days['buckets'], days['present']), (['2026-03-02', '2026-03-05', '2026-03-09'], [1, 0, 1]))
+
+    # one cache entry per change: keep locmem from culling the series mid-test
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 10000},
+    }})
+    def test_changes_elsewhere_do_not_invalidate_and_only_long_gaps_recompute_in_full(self):
+        records = AttendanceRecord.objects.filter(lecture__course=self.course)
+        series = lambda: attendance_series('course', self.course.pk, records, {self.course.pk})
+        self.assertEqual(series()['refreshed'], 'full')
+
+        other = Course.objects.create(name='Physics', code='PH1', doctor=self.course.doctor)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(MAX_CHANGES + 100):
+                note_attendance_changes([(other.pk, datetime(2026, 3, 2, 10, tzinfo=dt_timezone.utc))])
+        self.assertEqual(series()['refreshed'], 'cached')
+
+        # workers logging changes at the same time each get their own entry
+        days = [date(2026, 3, day) for day in (16, 9, 23, 10, 11, 24, 17, 12)]
+        threads = [threading.Thread(target=_log_changes, args=({self.course.pk: day.isoformat()},)) for day in days]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(series()['refreshed'], 'partial')
+        self.assertIn("'2026-03-09'", queries.captured_queries[-1]['sql'])
+        self.assertEqual(series()['refreshed'], 'cached')
+
+        _log_changes({self.course.pk: '2026-03-09'})
+        self.assertEqual(series()['refreshed'], 'partial')
+        for _ in range(MAX_CHANGES + 1):
+            _log_changes({self.course.pk: '2026-03-09'})
+        self.assertEqual(series()['refreshed'], 'full')
+
+
+class LecturePdfCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        settings_override = override_settings(REPORT_PDF_CACHE_DIR=self.cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        doctor = DoctorProfile.objects.create_user(username='dr', password='pw')
+        course = Course.objects.create(name='Algebra', code='AA1', doctor=doctor)
+        group = Group.objects.create(name='G1', course=course)
+        group.students.add(*[Student.objects.create(name=f'S{i}', university_id=f'10{i}') for i in range(20)])
+        self.lecture = record_lecture_attendance(group, 'L1', ['100', '101']).lecture
+
+    def download(self):
+        response = self.client.get(reverse('export_attendance_pdf', args=[self.lecture.pk]))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return b''.join(response.streaming_content)
+
+    def test_unchanged_lecture_is_served_from_disk_and_record_changes_rerender(self):
+        with mock.patch('doctors.reports.render_pdf', wraps=reports.render_pdf) as render:
+            with self.assertNumQueries(2):
+                first = self.download()
+            self.assertTrue(first.startswith(b'%PDF'))
+            self.assertEqual(self.download(), first)
+            self.assertEqual(render.call_count, 1)
+
+            AttendanceRecord.objects.filter(lecture=self.lecture, student__university_id='102').update(status='P')
+            self.assertNotEqual(self.download(), first)
+            self.assertEqual(render.call_count, 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_pdf_removed_by_a_concurrent_store_is_rendered_again(self):
+        self.download()
+        # another request's _store deleted the cached file right before this one opened it
+        with mock.patch('doctors.reports.open', create=True, side_effect=FileNotFoundError), \
+                mock.patch('doctors.reports.render_pdf', wraps=reports.render_pdf) as render:
+            self.assertTrue(self.download().startswith(b'%PDF'))
+        self.assertEqual(render.call_count, 1)
+
+    def test_course_bundle_renders_on_a_pool_and_reuses_the_cache(self):
+        for topic in ('L2', 'L3'):
+            record_lecture_attendance(self.lecture.group, topic, ['100'])
+        output = os.path.join(self.cache_dir, 'bundle.zip')
+        out = io.StringIO()
+        call_command('export_course_pdfs', output, course=['AA1'], workers=2, stdout=out)
+        self.assertRegex(out.getvalue(), r'3 lectures \(3 rendered, 0 from cache\), \d+ pages in .* pages/s')
+        with zipfile.ZipFile(output) as bundle:
+            names = bundle.namelist()
+            self.assertEqual(len(names), 3)
+            self.assertTrue(all(n.startswith('AA1/') and bundle.read(n).startswith(b'%PDF') for n in names))
+
+        self.client.force_login(DoctorProfile.objects.get())
+        DoctorProfile.objects.update(role=UserRole.DOCTOR)
+        with mock.patch('doctors.reports.render_pdf') as render:
+            response = self.client.get(reverse('export_course_pdf_bundle', args=[self.lecture.course_id]))
+            with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as bundle:
+                self.assertEqual(sorted(bundle.namelist()), sorted(names))
+        render.assert_not_called()
+
+
+class StudentSearchTests(TestCase):
+
+    def setUp(self):
+        doctor = DoctorProfile.objects.create_user(username='dr', password='pw', role=UserRole.DOCTOR)
+        self.client.force_login(doctor)
+        course = Course.objects.create(name='Algebra', code='AA1', doctor=doctor)
+        self.group = Group.objects.create(name='G1', course=course)
+        self.students = [Student.objects.create(name=f'Mohamed {i:02}', university_id=f'2201{i:04}') for i in range(30)]
+        self.students.append(Student.objects.create(name='Sara Adel', university_id='23019999'))
+        self.group.students.add(*self.students)
+        with self.captureOnCommitCallbacks(execute=True):
+            for topic in ('L1', 'L2', 'L3'):
+                record_lecture_attendance(self.group, topic, [s.university_id for s in self.students[1:]])
+
+    def names(self, query):
+        return sorted(search_students(Student.objects.all(), query).values_list('name', flat=True))
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(self.names('ra ad'), ['Sara Adel'])
+        self.assertEqual(self.names('0199'), ['Sara Adel'])
+        sara = self.students[-1]
+        sara.name = 'Sara Nabil'
+        sara.save()
+        self.assertEqual(self.names('adel'), [])
+        self.assertEqual(self.names('nabil'), ['Sara Nabil'])
+        sara.delete()
+        self.assertEqual(self.names('sara'), [])
+
+    def test_search_page_is_paginated_with_batched_warnings(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('student_search'), {'query': 'mohamed'})
+        students = response.context['students']
+        self.assertEqual(response.context['page_obj'].paginator.count, 30)
+        self.assertEqual(len(students), 25)
+        self.assertEqual([s.has_warning for s in students[:2]], [True, False])
+        self.assertEqual(students[0].warning_status_text, 'High Risk (3 Absences in AA1)')
+
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(reverse('student_search'), {'query': 'mohamed', 'page': 2})
+        self.assertEqual(len(response.context['students']), 5)
+
+    def test_autocomplete_uses_the_index(self):
+        response = self.client.get(reverse('student_autocomplete'), {'q': 'sara'})
+        self.assertEqual([r['text'] for r in response.json()['results']], [str(self.students[-1])])
+
+
+class _StubRekognitionHandler(BaseHTTPRequestHandler):
+    """Speaks just enough of the Rekognition JSON protocol for the client tests."""
+    protocol_version = 'HTTP/1.1'
+    fail_with = None
+    requests = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        type(self).requests.append((self.headers['X-Amz-Target'], self.client_address))
+        if self.fail_with:
+            status, body = self.fail_with, {'__type': 'InternalServerError', 'message': 'boom'}
+        else:
+            status, body = 200, {'FaceMatches': [{'Similarity': 97.5, 'Face': {'FaceId': 'f-1', 'ExternalImageId': '1001'}}]}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-amz-json-1.1')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class RekognitionClientTests(TestCase):
+
+    def setUp(self):
+        _StubRekognitionHandler.fail_with = None
+        _StubRekognitionHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubRekognitionHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        endpoint = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.settings_override = override_settings(
+            AWS_REKOGNITION_ENDPOINT_URL=endpoint, AWS_ACCESS_KEY_ID='test',
+            AWS_SECRET_ACCESS_KEY='test', FACE_RETRY_ATTEMPTS=2, FACE_RETRY_BASE_DELAY=0,
+            FACE_BREAKER_FAILURE_THRESHOLD=2, FACE_BREAKER_RESET_SECONDS=60,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_search_reuses_one_keep_alive_connection(self):
+        backend = RekognitionBackend(client=build_rekognition_client())
+        for _ in range(3):
+            self.assertEqual(backend.search_faces(b'jpeg')[0].external_id, '1001')
+        # every call came through the same pooled socket
+        self.assertEqual(len({address for _, address in _StubRekognitionHandler.requests}), 1)
+
+    def test_breaker_fails_fast_after_repeated_server_errors(self):
+        _StubRekognitionHandler.fail_with = 500
+        backend = RekognitionBackend(client=build_rekognition_client())
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                backend.search_faces(b'jpeg')
+        sent = len(_StubRekognitionHandler.requests)
+        self.assertEqual(sent, 4)  # two calls x two attempts
+
+        with self.assertRaises(RecognitionUnavailable):
+            backend.search_faces(b'jpeg')
+        self.assertEqual(len(_StubRekognitionHandler.requests), sent)
+
+    def test_read_timeouts_are_retried_and_open_the_breaker(self):
+        client = mock.Mock()
+        client.search_faces_by_image.side_effect = botocore_exceptions.ReadTimeoutError(endpoint_url='http://rekognition')
+        backend = RekognitionBackend(client=client)
+        for _ in range(2):
+            with self.assertRaises(botocore_exceptions.ReadTimeoutError):
+                backend.search_faces(b'jpeg')
+        self.assertEqual(client.search_faces_by_image.call_count, 4)  # two calls x two attempts
+
+        with self.assertRaises(RecognitionUnavailable):
+            backend.search_faces(b'jpeg')
+        self.assertEqual(client.search_faces_by_image.call_count, 4)
+
+    def test_rejected_request_neither_retries_nor_resets_the_failure_count(self):
+        client = mock.Mock()
+        backend = RekognitionBackend(client=client)
+        client.search_faces_by_image.side_effect = botocore_exceptions.ReadTimeoutError(endpoint_url='http://rekognition')
+        with self.assertRaises(botocore_exceptions.ReadTimeoutError):
+            backend.search_faces(b'jpeg')
+        client.search_faces_by_image.side_effect = botocore_exceptions.ClientError(
+            {'Error': {'Code': 'InvalidParameterException'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}, 'SearchFacesByImage'
+        )
+        with self.assertRaises(botocore_exceptions.ClientError):
+            backend.search_faces(b'jpeg')
+        self.assertEqual((client.search_faces_by_image.call_count, backend.breaker.failures), (3, 1))
+
+    def test_half_open_breaker_closes_after_a_successful_trial(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        now[0] = 11
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+
+@override_settings(FACE_RECOGNITION_BACKEND='stub', FACE_STUB_LATENCY_MS=0)
+class ReconcileFaceCollectionTests(TestCase):
+
+    def setUp(self):
+        StubRecognitionBackend.reset()
+        recognition.reset_recognition_backend()
+        self.addCleanup(StubRecognitionBackend.reset)
+        self.addCleanup(recognition.reset_recognition_backend)
+
+    def test_duplicate_and_orphan_faces_are_deleted(self):
+        backend = recognition.get_recognition_backend()
+        student = Student.objects.create(name='Mona', university_id='1001')
+        old_face = backend.index_face(make_image(1), '1001')
+        student.face_id = backend.index_face(make_image(2), '1001')
+        student.save()
+        backend.index_face(make_image(3), 'graduated-1')
+
+        call_command('reconcile_face_collection', stdout=io.StringIO())
+
+        remaining = dict(backend.list_faces())
+        self.assertEqual(list(remaining), [student.face_id])
+        self.assertNotIn(old_face, remaining)
+        snapshot = FaceCollectionSnapshot.objects.get()
+        self.assertEqual((snapshot.faces_before, snapshot.faces_after), (3, 1))
+        self.assertEqual((snapshot.duplicates_deleted, snapshot.orphans_deleted), (1, 1))
+
+    def test_face_saved_while_the_collection_is_listed_is_kept(self):
+        backend = recognition.get_recognition_backend()
+        student = Student.objects.create(name='Mona', university_id='1001')
+        student.face_id = backend.index_face(make_image(1), '1001')
+        student.save()
+        new_face = backend.index_face(make_image(2), '1001')
+        list_faces = backend.list_faces
+
+        def list_while_indexing(collection_id=None):
+            yield from list_faces(collection_id=collection_id)
+            # index_students_faces saves the new face after it was listed as a duplicate
+            Student.objects.filter(pk=student.pk).update(face_id=new_face)
+
+        with mock.patch.object(backend, 'list_faces', list_while_indexing):
+            call_command('reconcile_face_collection', stdout=io.StringIO())
+        self.assertIn(new_face, dict(backend.list_faces()))
+        snapshot = FaceCollectionSnapshot.objects.get()
+        self.assertEqual((snapshot.faces_after, snapshot.duplicates_deleted), (2, 0))
+        # the replaced face was still current when listed; the next run removes it
+        call_command('reconcile_face_collection', stdout=io.StringIO())
+        self.assertEqual(list(dict(backend.list_faces())), [new_face])
+
+    def test_snapshot_counts_the_faces_the_backend_deleted(self):
+        backend = recognition.get_recognition_backend()
+        orphans = [backend.index_face(make_image(seed), f'graduated-{seed}') for seed in range(3)]
+        delete_faces = backend.delete_faces
+
+        def delete_some(face_ids, collection_id=None):
+            # the backend refuses one of the faces
+            return delete_faces([face_id for face_id in face_ids if face_id != orphans[0]], collection_id=collection_id)
+
+        with mock.patch.object(backend, 'delete_faces', delete_some):
+            call_command('reconcile_face_collection', stdout=io.StringIO())
+        snapshot = FaceCollectionSnapshot.objects.get()
+        self.assertEqual((snapshot.faces_after, snapshot.orphans_deleted), (1, 2))
+
+    @override_settings(FACE_SHARD_KEY='course')
+    def test_shard_faces_of_deleted_students_are_deleted(self):
+        backend = recognition.get_recognition_backend()
+        course = Course.objects.create(name='AI', code='CS101', doctor=DoctorProfile.objects.create_user(username='dr', password='pw'))
+        shard = shard_collection_id(Group.objects.create(name='G1', course=course))
+        kept, gone = (Student.objects.create(name=f'S{i}', university_id=f'100{i}') for i in range(2))
+        for student, seed in ((kept, 1), (gone, 2)):
+            StudentFaceShard.objects.create(
+                student=student, collection_id=shard, face_id=backend.index_face(make_image(seed), student.university_id, collection_id=shard)
+            )
+        gone.delete()
+
+        call_command('reconcile_face_collection', stdout=io.StringIO())
+        self.assertEqual([external_id for _, external_id in backend.list_faces(collection_id=shard)], ['1000'])
+        snapshot = FaceCollectionSnapshot.objects.get(collection_id=shard)
+        self.assertEqual((snapshot.faces_before, snapshot.orphans_deleted), (2, 1))
+
+
+@override_settings(FACE_RECOGNITION_BACKEND='stub', FACE_STUB_LATENCY_MS=0,
+                   FACE_SHARD_KEY='course', FACE_SHARD_SYNC_ASYNC=False)
+class FaceShardTests(TestCase):
+
+    def setUp(self):
+        StubRecognitionBackend.reset()
+        recognition.reset_recognition_backend()
+        self.addCleanup(StubRecognitionBackend.reset)
+        self.addCleanup(recognition.reset_recognition_backend)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        doctor = DoctorProfile.objects.create_user(username='dr', password='pw')
+        course = Course.objects.create(name='AI', code='CS101', doctor=doctor)
+        self.group = Group.objects.create(name='G1', course=course)
+        self.student = Student(name='Mona', university_id='1001')
+        self.student.image.save('mona.jpg', ContentFile(make_image(5)), save=True)
+
+    def test_shards_follow_group_membership(self):
+        shard = shard_collection_id(self.group)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.groups.add(self.group)
+        self.assertEqual(StudentFaceShard.objects.get(student=self.student).collection_id, shard)
+
+        backend = recognition.get_recognition_backend()
+        self.assertEqual(backend.search_faces(make_image(5), collection_id=shard)[0].external_id, '1001')
+        self.assertEqual(search_for_group(make_image(5), self.group)[0].external_id, '1001')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.students.remove(self.student)
+        self.assertFalse(StudentFaceShard.objects.exists())
+        self.assertEqual(list(backend.list_faces(collection_id=shard)), [])
+
+    def test_missing_shard_is_skipped_and_an_empty_answer_is_final(self):
+        forget_missing_shards()
+        self.addCleanup(forget_missing_shards)
+        backend = mock.Mock()
+        backend.search_faces.side_effect = [RuntimeError('ResourceNotFoundException'), [], []]
+        shard = shard_collection_id(self.group)
+
+        self.assertEqual(search_in_shard(b'jpeg', shard, backend=backend), [])
+        self.assertEqual(search_in_shard(b'jpeg', shard, backend=backend), [])
+        # shard failed once, then the global collection only
+        self.assertEqual(
+            [call.kwargs.get('collection_id') for call in backend.search_faces.call_args_list], [shard, None, None]
+        )
+
+        forget_missing_shards()
+        backend.search_faces.side_effect = [[]]
+        backend.search_faces.reset_mock()
+        self.assertEqual(search_in_shard(b'jpeg', shard, backend=backend), [])
+        backend.search_faces.assert_called_once()
+
+
+class FrameQualityPrefilterTests(TestCase):
+
+    def test_blurry_and_dark_frames_are_rejected_with_a_reason(self):
+        sharp = open_frame(make_image(4))
+        self.assertIsNone(assess_frame_quality(sharp)[0])
+        self.assertEqual(assess_frame_quality(sharp.filter(ImageFilter.GaussianBlur(6)))[0], 'blurry')
+        self.assertEqual(assess_frame_quality(Image.new('RGB', (640, 480), (5, 5, 5)))[0], 'too_dark')
+
+
+class PrepareFrameTests(TestCase):
+
+    @override_settings(FACE_FRAME_MAX_EDGE=320, FACE_FRAME_JPEG_QUALITY=85)
+    def test_shrunk_frame_that_grows_reports_no_saving(self):
+        # heavily compressed noise: re-encoded at quality 85 it is bigger even after shrinking
+        noisy = io.BytesIO()
+        Image.effect_noise((400, 300), 90).convert('RGB').save(noisy, format='JPEG', quality=5)
+
+        frame = prepare_frame(noisy.getvalue())
+        self.assertEqual(max(frame.image.size), 320)
+        self.assertGreater(frame.stats['bytes_out'], frame.stats['bytes_in'])
+        self.assertEqual(frame.stats['upload_ms_saved'], 0)
@@ -0,0 +1,162 @@
+# doctors/trends.py
+"""
+Attendance trend series (per course, group or student) for the charts.
+
+Records are bucketed by ``TruncWeek`` / ``TruncDay`` of the lecture date in
+the database; a series is a handful of counters per bucket. Series are
+cached per (scope, bucket size, range) and refreshed incrementally. Each
+course has a change counter in the cache: the write paths report the
+(course, lecture date) of what they changed with ``note_attendance_changes``,
+which bumps the course's counter with an atomic ``incr`` and stores the
+changed day under the new number (a key written once, so concurrent writers
+never overwrite each other). A cached series remembers the counter of each
+of its courses and only recomputes the buckets from the earliest day logged
+since; changes to other courses don't touch it. When a course moved on by
+more than ``MAX_CHANGES`` (or its entries expired) the series is recomputed
+in full.
+"""
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDay, TruncWeek
+from django.utils import timezone
+
+from .models import AttendanceStatus
+
+BUCKETS = {'week': TruncWeek, 'day': TruncDay}
+SERIES_FIELDS = ['total', 'present', 'absent', 'late', 'excused']
+
+VERSION_KEY = 'trend-version:{}'
+CHANGE_KEY = 'trend-change:{}:{}'
+SERIES_KEY = 'trend:{}:{}:{}:{}:{}'
+MAX_CHANGES = 500
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+# ==============================================
+# Per-course change log (filled by the attendance write paths)
+# ==============================================
+
+def _bump_version(course_id):
+    key = VERSION_KEY.format(course_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def _log_changes(changes):
+    for course_id, day in changes.items():
+        # الرقم من incr مش بيتكرر بين الـ workers: كل تغيير ليه مفتاح لوحده ومفيش قراءة وكتابة فوق بعض
+        cache.set(CHANGE_KEY.format(course_id, _bump_version(course_id)), day, CACHE_TIMEOUT)
+
+
+def note_attendance_changes(course_dates):
+    """Report changed records as (course_id, lecture datetime) pairs, logged once the transaction commits."""
+    changes = {}
+    for course_id, date_time in course_dates:
+        day = timezone.localtime(date_time).date().isoformat()
+        changes[course_id] = min(changes.get(course_id, day), day)
+    if changes:
+        transaction.on_commit(lambda: _log_changes(changes))
+
+
+def _versions(course_ids):
+    keys = {course_id: VERSION_KEY.format(course_id) for course_id in course_ids}
+    found = cache.get_many(keys.values())
+    return {course_id: found.get(key, 0) for course_id, key in keys.items()}
+
+
+def _changed_since(seen, versions):
+    """(earliest day changed between the ``seen`` and current ``versions`` or None, complete?)."""
+    keys = []
+    for course_id, version in versions.items():
+        before = seen.get(course_id, 0)
+        if version < before or version - before > MAX_CHANGES:
+            return None, False
+        keys.extend(CHANGE_KEY.format(course_id, n) for n in range(before + 1, version + 1))
+    if not keys:
+        return None, True
+    days = cache.get_many(keys)
+    if len(days) != len(keys):
+        return None, False
+    return min(days.values()), True
+
+
+# ==============================================
+# Series
+# ==============================================
+
+def _bucket_start(day, bucket):
+    return day - timedelta(days=day.weekday()) if bucket == 'week' else day
+
+
+def _query(records, bucket, since, until):
+    if since:
+        records = records.filter(lecture__date_time__date__gte=since)
+    if until:
+        records = records.filter(lecture__date_time__date__lte=until)
+    rows = (
+        records.annotate(bucket=BUCKETS[bucket]('lecture__date_time'))
+        .values('bucket')
+        .annotate(
+            total=Count('pk'),
+            present=Count('pk', filter=Q(status=AttendanceStatus.PRESENT)),
+            absent=Count('pk', filter=Q(status=AttendanceStatus.ABSENT)),
+            late=Count('pk', filter=Q(status=AttendanceStatus.LATE)),
+            excused=Count('pk', filter=Q(status=AttendanceStatus.EXCUSED)),
+        )
+        .order_by('bucket')
+    )
+    return {
+        timezone.localtime(row['bucket']).date().isoformat(): [row[field] for field in SERIES_FIELDS]
+        for row in rows
+    }
+
+
+def attendance_series(scope, scope_id, records, course_ids, bucket='week', since=None, until=None):
+    """
+    Bucketed counters of ``records`` (the scope's ``AttendanceRecord`` queryset)
+    between the dates ``since`` and ``until`` (both optional, inclusive).
+    ``course_ids`` are the courses whose changes concern the scope. Returns
+    ``{'buckets': {iso date: [total, present, absent, late, excused]},
+    'refreshed': 'cached' | 'partial' | 'full'}``.
+    """
+    key = SERIES_KEY.format(scope, scope_id, bucket, since or '', until or '')
+    # الأرقام بتتقرا قبل الـ query: تغيير بيحصل في النص بيتحسب تاني المرة الجاية مش بيضيع
+    versions = _versions(course_ids)
+    cached = cache.get(key)
+    if cached is not None:
+        changed_from, complete = _changed_since(cached['versions'], versions)
+        if complete and changed_from is None:
+            return {'buckets': cached['buckets'], 'refreshed': 'cached'}
+        if complete:
+            # بس الـ buckets من أول يوم اتغير وطالع بتتحسب تاني
+            start = _bucket_start(date.fromisoformat(changed_from), bucket)
+            fresh_since = max(start, since) if since else start
+            buckets = {day: counts for day, counts in cached['buckets'].items() if day < start.isoformat()}
+            buckets.update(_query(records, bucket, fresh_since, until))
+            buckets = dict(sorted(buckets.items()))
+            cache.set(key, {'versions': versions, 'buckets': buckets}, CACHE_TIMEOUT)
+            return {'buckets': buckets, 'refreshed': 'partial'}
+
+    buckets = _query(records, bucket, since, until)
+    cache.set(key, {'versions': versions, 'buckets': buckets}, CACHE_TIMEOUT)
+    return {'buckets': buckets, 'refreshed': 'full'}
+
+
+def series_payload(buckets):
+    """Column-wise series (one list per counter) plus the attendance rate per bucket."""
+    days = list(buckets)
+    payload = {'buckets': days}
+    for i, field in enumerate(SERIES_FIELDS):
+        payload[field] = [buckets[day][i] for day in days]
+    payload['rate'] = [
+        round((counts[1] + counts[3]) / counts[0] * 100, 2) if counts[0] else 0.0
+        for counts in buckets.values()
+    ]
+    return payload
@@ -33,11 +33,18 @@ urlpatterns = [
 
     # 6. ميزات بصمة الوجه (Face Recognition)
     path('attendance/verify-face/', views.face_attendance_check, name='face_attendance_check'),
+    path('attendance/verify-face/frame/', views.face_attendance_frame_check, name='face_attendance_frame_check'),
+    path('attendance/verify-faces/batch/', views.face_attendance_batch_check, name='face_attendance_batch_check'),
+    path('attendance/face-session/open/', views.face_attendance_session_open, name='face_attendance_session_open'),
+    path('attendance/face-session/close/', views.face_attendance_session_close, name='face_attendance_session_close'),
     path('attendance/sync-aws/', views.index_students_to_aws, name='sync_students_aws'),
+    path('attendance/face-metrics/', views.face_metrics, name='face_metrics'),
 
     # 7. التقارير والإحصائيات
     path('reports/', views.report_home, name='report_home'),
     path('reports/course/<int:course_id>/', views.course_report, name='course_report'), 
+    path('reports/course/<int:course_id>/matrix/', views.export_attendance_matrix, name='export_attendance_matrix'),
+    path('reports/course/<int:course_id>/pdfs/', views.export_course_pdf_bundle, name='export_course_pdf_bundle'),
     path('doctors/', views.doctor_list, name='doctor_list'),
 
     # 8. الملف الشخصي والجدول الأكاديمي
@@ -54,6 +61,9 @@ urlpatterns = [
     path('api/student/announcements/<str:university_id>/', api_views.StudentAnnouncementsView.as_view(), name='api_student_announcements'),
     path('api/student/full-attendance/<str:university_id>/', api_views.StudentFullAttendanceView.as_view(), name='api_student_full_attendance'),
     path('api/student/statistics/<str:university_id>/', api_views.StudentStatisticsView.as_view(), name='api_student_statistics'),
+    path('api/attendance/scan-events/sync/', api_views.ScanEventSyncView.as_view(), name='api_scan_events_sync'),
+    path('api/attendance/trends/<str:scope>/<int:pk>/', api_views.AttendanceTrendView.as_view(), name='api_attendance_trends'),
+    path('api/student/trends/<str:university_id>/', api_views.StudentAttendanceTrendView.as_view(), name='api_student_trends'),
     path('api/health/', api_views.ApiHealthCheckView.as_view(), name='api_health'),
     
     path('lecture/<int:lecture_id>/pdf/', views.export_attendance_pdf, name='export_attendance_pdf'),
@@ -1,27 +1,46 @@
 # Doctors/Views
-import io
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import models
 from django.http import JsonResponse
 from dal import autocomplete 
-from .models import Course, Group, Student, Lecture, UserRole, AttendanceStatus, AttendanceRecord
-from datetime import datetime
+from .models import Course, Group, Student, Lecture, UserRole, AttendanceStatus, AttendanceRecord, AttendanceSummary
 import pandas as pd
 from io import BytesIO
-from django.db.models import Count, Q, F 
+from django.db.models import Count, Q, F, ExpressionWrapper, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.core.paginator import Paginator
 import json
 import base64
-import boto3
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import unquote
+from django.utils import timezone
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.base import ContentFile
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
-from django.template.loader import get_template
-from xhtml2pdf import pisa
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
 from .models import Lecture
-from .models import Announcement
+from .models import Announcement, AttendanceSession
+from .recognition import get_recognition_backend, FaceBox, RecognitionUnavailable, WHOLE_FRAME
+from .imaging import (
+    crop_faces, prepare_frame, assess_frame_quality, frame_dhash, hamming,
+    FRAME_COUNTERS, QUALITY_COUNTERS, QUALITY_REASONS,
+)
+from . import metrics
+from .face_shards import schedule_shard_sync, search_for_group, search_in_shard, shard_collection_id
+from .attendance import get_active_session, close_session, record_lecture_attendance, RosterEntry, SessionClosed, SessionConflict
+from .summaries import doctor_warnings
+from .search import search_students
+from .exports import AttendanceMatrix, iter_csv, write_xlsx
+from .reports import open_lecture_pdf, iter_zip_bundle, PdfRenderError
+from .analytics import CourseAnalytics, WARNING_THRESHOLD, is_at_risk, warning_status_text
+from .ingest import iter_attendance_ids
+from concurrent.futures import ThreadPoolExecutor
 # ==============================================
 # 0. دوال مساعدة (Helper Functions)
 # ==============================================
@@ -29,6 +48,16 @@ from .models import Announcement
 def is_doctor(user):
     return user.is_authenticated and user.role == UserRole.DOCTOR
 
+def _absences_by_course(student_ids, course_ids=None):
+    """{(student_id, course_id): absences} from AttendanceSummary (one indexed query)."""
+    summaries = AttendanceSummary.objects.filter(student_id__in=student_ids)
+    if course_ids is not None:
+        summaries = summaries.filter(course_id__in=course_ids)
+    return {
+        (student_id, course_id): absent
+        for student_id, course_id, absent in summaries.values_list('student_id', 'course_id', 'absent')
+    }
+
 def _annotate_student_warnings(students_queryset, warning_threshold):
     students_queryset = students_queryset.annotate(
         total_absences=Count(
@@ -38,15 +67,6 @@ def _annotate_student_warnings(students_queryset, warning_threshold):
     )
     return students_queryset
 
-# دالة للاتصال بـ AWS (Reusable Client)
-def get_rekognition_client():
-    return boto3.client(
-        'rekognition',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_REGION_NAME
-    )
-
 # ==============================================
 # 1. دوال Autocomplete (DAL Views)
 # ==============================================
@@ -74,7 +94,7 @@ class StudentAutocomplete(autocomplete.Select2QuerySetView):
     def get_queryset(self):
         if not self.request.user.is_authenticated:
             return Student.objects.none()
-        qs = Student.objects.all()
+        qs = Student.objects.all().order_by('name')
         if self.forwarded:
             lecture_id = self.forwarded.get('lecture')            
             if lecture_id:
@@ -85,7 +105,7 @@ class StudentAutocomplete(autocomplete.Select2QuerySetView):
                 except Lecture.DoesNotExist:
                     return Student.objects.none()
         if self.q:
-            qs = qs.filter(Q(name__icontains=self.q) | Q(university_id__icontains=self.q))
+            qs = search_students(qs, self.q)
         return qs
 
 
@@ -100,37 +120,9 @@ def doctor_dashboard(request):
         return redirect('login') 
     courses = Course.objects.filter(doctor=request.user)
     num_courses = courses.count()    
-    warning_threshold = 3    
-    warnings_list = []
-    students_with_absences = Student.objects.filter(groups__course__in=courses).distinct().annotate(
-        total_absences_overall=Count(
-            'attendance_records', 
-            filter=Q(attendance_records__status=AttendanceStatus.ABSENT, attendance_records__lecture__course__in=courses)
-        )
-    )
-
-    for student in students_with_absences:
-        student_warning_details = []
-        for course in courses:
-            absences_in_course = student.attendance_records.filter(
-                lecture__course=course, 
-                status=AttendanceStatus.ABSENT
-            ).count()
-            
-            if absences_in_course >= warning_threshold:
-                student_warning_details.append({
-                    'course_name': course.name,
-                    'course_code': course.code,
-                    'absences': absences_in_course
-                })
-        
-        if student_warning_details: 
-             warnings_list.append({
-                'name': student.name,
-                'university_id': student.university_id,
-                'total_absences': student.total_absences_overall, 
-                'warning_courses': student_warning_details
-            })
+    warning_threshold = WARNING_THRESHOLD
+    # استعلام واحد على AttendanceSummary، ومتخزن في الكاش لحد ما بيانات الدكتور تتغير
+    warnings_list = doctor_warnings(request.user.pk, warning_threshold)
 
     last_lecture = Lecture.objects.filter(course__in=courses).order_by('-date_time').first()
 
@@ -276,6 +268,9 @@ def select_group_for_attendance(request):
     return render(request, 'doctors/attendance_select_group.html', context)
 
 
+UNMATCHED_IDS_SHOWN = 20
+
+
 @login_required
 def take_attendance(request, group_id):
     if not is_doctor(request.user):
@@ -287,34 +282,17 @@ def take_attendance(request, group_id):
         if 'attendance_file' in request.FILES:
             attendance_file = request.FILES['attendance_file']
             try:
-                lecture = Lecture.objects.create(
-                    course=group.course,
-                    group=group,
-                    topic=lecture_topic,
-                    date_time=datetime.now()
-                )
-                attended_ids = set()
-                file_content = attendance_file.read().decode('utf-8')
-                if attendance_file.name.lower().endswith('.csv'):
-                    df = pd.read_csv(BytesIO(file_content.encode('utf-8')))
-                    id_col = next((col for col in df.columns if 'id' in col.lower()), None)
-                    if id_col:
-                        attended_ids = {str(id).strip() for id in df[id_col].dropna()}
-                else: # ملف نصي (TXT)
-                    attended_ids = {line.strip() for line in file_content.splitlines() if line.strip()}
-                group_students = group.students.all()
-                present_count = 0
-                for student in group_students:
-                    is_present = student.university_id in attended_ids
-                    AttendanceRecord.objects.create(
-                        lecture=lecture,
-                        student=student,
-                        status=AttendanceStatus.PRESENT if is_present else AttendanceStatus.ABSENT 
+                # الـ IDs بتتقري من الملف واحد واحد، والمحاضرة وكل السجلات بتتكتب في transaction واحدة
+                result = record_lecture_attendance(group, lecture_topic, iter_attendance_ids(attendance_file))
+                messages.success(request, f'Attendance recorded. Present: {result.present_count}, Absent: {result.absent_count}.')
+                if result.unmatched_ids:
+                    shown = ', '.join(result.unmatched_ids[:UNMATCHED_IDS_SHOWN])
+                    more = len(result.unmatched_ids) - UNMATCHED_IDS_SHOWN
+                    messages.warning(
+                        request,
+                        f'{len(result.unmatched_ids)} ID(s) in the file are not in {group.name}: {shown}'
+                        + (f' and {more} more.' if more > 0 else '.')
                     )
-                    if is_present:
-                        present_count += 1
-                abs_count = group_students.count() - present_count
-                messages.success(request, f'Attendance recorded. Present: {present_count}, Absent: {abs_count}.')
                 return redirect('dashboard')
 
             except Exception as e:
@@ -322,13 +300,145 @@ def take_attendance(request, group_id):
         else:
             messages.error(request, 'Please select a file.')
 
-    context = {'group': group}
+    context = {
+        'group': group,
+        'kiosk_fps': settings.FACE_KIOSK_FPS,
+        'kiosk_max_in_flight': settings.FACE_KIOSK_MAX_IN_FLIGHT,
+        'duplicate_hash_distance': settings.FACE_DUPLICATE_HASH_DISTANCE,
+        'duplicate_window_seconds': settings.FACE_DUPLICATE_WINDOW_SECONDS,
+    }
     return render(request, 'doctors/take_attendance.html', context)
 
 # ----------------------------------------------
 # ميزة بصمة الوجه الجديدة (Face Recognition Add-on)
 # ----------------------------------------------
 
+def _recent_scans_key(group_id, lecture_topic):
+    topic = hashlib.sha1(lecture_topic.encode('utf-8')).hexdigest()[:16]
+    return f'face-recent-scans:{group_id}:{topic}:{timezone.now().date().isoformat()}'
+
+
+def _recent_scan_for(group_id, lecture_topic, image, present):
+    """
+    university_id of a recent scan whose face is (almost) the same in this
+    frame, as long as that student is marked present. Each recent scan is
+    compared on its own face box, not on the whole frame.
+    """
+    now = time.time()
+    window = settings.FACE_DUPLICATE_WINDOW_SECONDS
+    for box, seen_hash, university_id, student_pk, seen_at in cache.get(_recent_scans_key(group_id, lecture_topic), []):
+        if now - seen_at > window or student_pk not in present:
+            continue
+        if hamming(seen_hash, frame_dhash(image, FaceBox(*box))) <= settings.FACE_DUPLICATE_HASH_DISTANCE:
+            return university_id
+    return None
+
+
+def _remember_scan(group_id, lecture_topic, image, box, entry):
+    key = _recent_scans_key(group_id, lecture_topic)
+    now = time.time()
+    window = settings.FACE_DUPLICATE_WINDOW_SECONDS
+    recent = [scan for scan in cache.get(key, []) if now - scan[4] <= window]
+    recent.append((tuple(box), frame_dhash(image, box), entry.university_id, entry.pk, now))
+    cache.set(key, recent[-50:], timeout=window)
+
+
+def _student_payload(entry, **extra):
+    return {
+        'success': True,
+        'student_name': entry.name,
+        'university_id': entry.university_id,
+        'image_url': entry.image_url,
+        **extra,
+    }
+
+
+def _roster_entry(session, university_id):
+    """Roster entry for a recognised face; students outside the group are looked up (and 404) as before."""
+    entry = session.roster.get(university_id)
+    if entry is None:
+        student = get_object_or_404(Student, university_id=university_id)
+        entry = RosterEntry(student.pk, student.name, student.university_id, student.image.url if student.image else '')
+    return entry
+
+
+def _check_single_face(image_bytes, group_id, lecture_topic):
+    """Recognise the one face in the frame and mark the student present (shared by both upload formats)."""
+    # تصغير الصورة وضبط اتجاهها قبل ما نبعتها لمحرك التعرف
+    frame = prepare_frame(image_bytes)
+    # فلتر محلي سريع: صورة مهزوزة / مظلمة / من غير وش مش بنبعتها لمحرك التعرف أصلاً
+    if settings.FACE_QUALITY_PREFILTER:
+        reason, scores = assess_frame_quality(frame.image)
+        if reason:
+            return JsonResponse({
+                'success': False,
+                'rejected': True,
+                'reason': reason,
+                'message': QUALITY_REASONS[reason],
+                'scores': scores,
+            })
+
+    # المجموعة والمحاضرة والطلاب والحاضرين محفوظين في الذاكرة: مفيش قراءة من الداتابيز لكل طالب
+    # (بعد الفلتر: الصورة المرفوضة ما بتفتحش جلسة ولا بتلمس الداتابيز)
+    session = get_active_session(group_id, lecture_topic)
+
+    # وضع الكشك: نفس الطالب لسه واقف قدام الكاميرا ومتسجل حاضر -> مفيش داعي نسأل محرك التعرف تاني
+    recent_id = _recent_scan_for(group_id, lecture_topic, frame.image, session.present)
+    if recent_id:
+        metrics.incr('kiosk.duplicate_frames')
+        return JsonResponse(_student_payload(_roster_entry(session, recent_id), already_marked=True))
+
+    # البحث في shard المقرر بس، ولو مفيش نتيجة نرجع للـ collection العام
+    recognition_started = time.perf_counter()
+    matches = search_for_group(frame.jpeg, session.group, max_faces=1)
+    timings = _server_timing(frame, recognition_started)
+    if matches:
+        u_id = matches[0].external_id
+        entry = _roster_entry(session, u_id)
+        # الطالب متسجل حاضر قبل كده؟ مفيش كتابة في الداتابيز
+        marked = session.mark_present(entry.pk)
+        # مكان الوش في الصورة: من نتيجة البحث، أو من الـ detector بتاع المحرك لو مابيرجعهوش
+        box = matches[0].box or (get_recognition_backend().detect_faces(frame.jpeg) or [WHOLE_FRAME])[0]
+        _remember_scan(group_id, lecture_topic, frame.image, box, entry)
+
+        response = JsonResponse(_student_payload(
+            entry, already_marked=not marked,
+            face_box={'left': box.left, 'top': box.top, 'width': box.width, 'height': box.height},
+        ))
+        response['Server-Timing'] = timings
+        return response
+
+    response = JsonResponse({'success': False, 'message': 'وجه غير معروف'})
+    response['Server-Timing'] = timings
+    return response
+
+
+class FrameTooLarge(Exception):
+    """The uploaded frame is bigger than FACE_FRAME_MAX_UPLOAD_BYTES."""
+
+
+def _face_error_response(exc):
+    if isinstance(exc, RecognitionUnavailable):
+        return JsonResponse({'success': False, 'message': 'خدمة بصمة الوجه غير متاحة مؤقتاً، حاول بعد قليل'}, status=503)
+    if isinstance(exc, FrameTooLarge):
+        return JsonResponse({'success': False, 'message': 'حجم الصورة أكبر من المسموح'}, status=413)
+    if isinstance(exc, SessionConflict):
+        return JsonResponse({
+            'success': False,
+            'message': f'يوجد جلسة تحضير مفتوحة لهذه المجموعة بعنوان "{exc.session.lecture.topic}"، أنهِها أولاً',
+            'open_topic': exc.session.lecture.topic,
+        }, status=409)
+    if isinstance(exc, SessionClosed):
+        return JsonResponse({
+            'success': False,
+            'message': f'تم إنهاء جلسة تحضير "{exc.lecture_topic}" لهذه المجموعة',
+            'session_closed': True,
+        }, status=409)
+    import traceback
+    print(traceback.format_exc()) 
+    return JsonResponse({'success': False, 'message': f'حدث خطأ: {str(exc)}'})
+
+
 @login_required
 def face_attendance_check(request):
     if request.method == 'POST':
@@ -339,84 +449,299 @@ def face_attendance_check(request):
             lecture_topic = data.get('lecture_topic', 'Unspecified Topic') 
             format, imgstr = image_data.split(';base64,')
             image_file = ContentFile(base64.b64decode(imgstr))
-            client = get_rekognition_client()
-            response = client.search_faces_by_image(
-                CollectionId='smart_attendance_collection',
-                Image={'Bytes': image_file.read()},
-                MaxFaces=1,
-                FaceMatchThreshold=85
-            )
-            if response['FaceMatches']:
-                u_id = response['FaceMatches'][0]['Face']['ExternalImageId']
-                student = get_object_or_404(Student, university_id=u_id)
-                group = get_object_or_404(Group, id=group_id)
-
-                from django.utils import timezone
-                today = timezone.now().date()
-                lecture, created = Lecture.objects.get_or_create(
-                    group=group,
-                    course=group.course,
-                    date_time__date=today,
-                    topic=lecture_topic,
-                    defaults={
-                        'date_time': timezone.now()
-                    }
-                )
-                if created:
-                    all_students = group.students.all()
-                    attendance_records = []
-                    for s in all_students:
-                        attendance_records.append(AttendanceRecord(
-                            lecture=lecture,
-                            student=s,
-                            status=AttendanceStatus.ABSENT 
-                        ))
-                    AttendanceRecord.objects.bulk_create(attendance_records)
-                AttendanceRecord.objects.update_or_create(
-                    lecture=lecture,
-                    student=student,
-                    defaults={'status': AttendanceStatus.PRESENT}
-                )
-
-                return JsonResponse({
-                    'success': True, 
-                    'student_name': student.name,
-                    'university_id': student.university_id,
-                    'image_url': student.image.url if student.image else ''
-                })
-            
-            return JsonResponse({'success': False, 'message': 'وجه غير معروف'})
+            return _check_single_face(image_file.read(), group_id, lecture_topic)
         except Exception as e:
-            import traceback
-            print(traceback.format_exc()) 
-            return JsonResponse({'success': False, 'message': f'حدث خطأ: {str(e)}'})
+            return _face_error_response(e)
             
     return JsonResponse({'success': False, 'message': 'طلب غير صالح'})
 
+
+# ----------------------------------------------
+# فتح / إنهاء جلسة التحضير (كذا جهاز على نفس الجلسة)
+# ----------------------------------------------
+
+@login_required
+def face_attendance_session_open(request):
+    """Open (or join) the group's attendance session for a lecture topic."""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'طلب غير صالح'})
+    try:
+        data = json.loads(request.body)
+        group = get_object_or_404(
+            Group.objects.select_related('course'), id=data.get('group_id'), course__doctor=request.user
+        )
+        active = get_active_session(
+            group.pk, data.get('lecture_topic', 'Unspecified Topic'), group=group, user=request.user, reopen=True
+        )
+        return JsonResponse({
+            'success': True,
+            'session_id': active.session.pk,
+            'lecture_id': active.lecture.pk,
+            'present_count': len(active.present),
+            'roster_count': len(active.roster),
+        })
+    except Exception as e:
+        return _face_error_response(e)
+
+
+@login_required
+def face_attendance_session_close(request):
+    """Close the session: everybody who was not scanned is written as absent in one insert."""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'طلب غير صالح'})
+    try:
+        data = json.loads(request.body)
+        session = get_object_or_404(
+            AttendanceSession, id=data.get('session_id'), group__course__doctor=request.user
+        )
+        session, absent_count = close_session(session)
+        present_count = AttendanceRecord.objects.filter(
+            lecture_id=session.lecture_id, status=AttendanceStatus.PRESENT
+        ).count()
+        return JsonResponse({'success': True, 'present_count': present_count, 'absent_count': absent_count})
+    except Exception as e:
+        return _face_error_response(e)
+
+
+# ----------------------------------------------
+# رفع الصورة كـ binary (JPEG خام أو multipart) بدل base64 جوه JSON
+# ----------------------------------------------
+
+_frame_buffers = threading.local()
+
+
+@contextmanager
+def _frame_upload(request):
+    """
+    Stream the uploaded frame into a per-thread buffer that is reused across
+    requests, and yield ``(frame_view, group_id, lecture_topic)``. Accepts a raw
+    ``image/*`` body (group and topic in ``X-Group-Id`` / ``X-Lecture-Topic``
+    headers, URL-encoded, or in the query string) or multipart with a
+    ``frame`` file field and ``group_id`` / ``lecture_topic`` form fields.
+    """
+    limit = settings.FACE_FRAME_MAX_UPLOAD_BYTES
+    if request.content_type == 'multipart/form-data':
+        upload = request.FILES['frame']
+        if upload.size > limit:
+            raise FrameTooLarge()
+        chunks = upload.chunks()
+        group_id = request.POST.get('group_id')
+        lecture_topic = request.POST.get('lecture_topic')
+    else:
+        if int(request.META.get('CONTENT_LENGTH') or 0) > limit:
+            raise FrameTooLarge()
+        chunks = iter(lambda: request.read(64 * 1024), b'')
+        group_id = request.headers.get('X-Group-Id') or request.GET.get('group_id')
+        lecture_topic = unquote(request.headers.get('X-Lecture-Topic', '')) or request.GET.get('lecture_topic')
+
+    buffer = getattr(_frame_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _frame_buffers.buffer = bytearray(512 * 1024)
+    size = 0
+    for chunk in chunks:
+        end = size + len(chunk)
+        if end > limit:
+            raise FrameTooLarge()
+        if end > len(buffer):
+            buffer.extend(bytes(max(end - len(buffer), len(buffer))))
+        buffer[size:end] = chunk
+        size = end
+
+    view = memoryview(buffer)[:size]
+    try:
+        yield view, group_id, lecture_topic or 'Unspecified Topic'
+    finally:
+        view.release()
+
+
+@login_required
+def face_attendance_frame_check(request):
+    """Same as ``face_attendance_check`` but the frame arrives as binary JPEG, not base64 JSON."""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'طلب غير صالح'})
+    try:
+        with _frame_upload(request) as (frame_bytes, group_id, lecture_topic):
+            return _check_single_face(frame_bytes, group_id, lecture_topic)
+    except Exception as e:
+        return _face_error_response(e)
+
+
+def _server_timing(frame, recognition_started):
+    """Server-Timing header: preprocessing cost, recognition time and bytes saved."""
+    recognition_ms = (time.perf_counter() - recognition_started) * 1000
+    return (
+        f'preprocess;dur={frame.stats["preprocess_ms"]}, '
+        f'recognition;dur={recognition_ms:.2f}, '
+        f'upload-saved;dur={frame.stats["upload_ms_saved"]};desc="{frame.stats["bytes_in"]}->{frame.stats["bytes_out"]} bytes"'
+    )
+
+
+@login_required
+def face_metrics(request):
+    """Counters of the face pipeline (payload sizes, preprocessing time, prefilter rejections) as JSON."""
+    if not is_doctor(request.user) and not request.user.is_superuser:
+        return JsonResponse({'detail': 'Access Denied.'}, status=403)
+    counters = metrics.read(FRAME_COUNTERS + QUALITY_COUNTERS + ('kiosk.duplicate_frames',))
+    frames = counters['frames.count'] or 1
+    checked = counters['quality.checked'] or 1
+    return JsonResponse({
+        'counters': counters,
+        'frames': {
+            'avg_bytes_in': round(counters['frames.bytes_in'] / frames),
+            'avg_bytes_out': round(counters['frames.bytes_out'] / frames),
+            'avg_preprocess_ms': round(counters['frames.preprocess_us'] / frames / 1000, 2),
+            'avg_upload_ms_saved': round(counters['frames.upload_us_saved'] / frames / 1000, 2),
+        },
+        # نسب الرفض لكل سبب عشان نضبط الحدود في الإعدادات
+        'quality_rejection_rates': {
+            reason: round(counters[f'quality.rejected.{reason}'] / checked, 4) for reason in QUALITY_REASONS
+        },
+        'quality_thresholds': {
+            'min_sharpness': settings.FACE_MIN_SHARPNESS,
+            'min_brightness': settings.FACE_MIN_BRIGHTNESS,
+            'max_brightness': settings.FACE_MAX_BRIGHTNESS,
+            'min_skin_ratio': settings.FACE_MIN_SKIN_RATIO,
+        },
+    })
+
+
+# Bounded thread pool shared by all classroom-photo requests in this process
+# (threads are only started on first use).
+_face_match_pool = ThreadPoolExecutor(
+    max_workers=settings.FACE_BATCH_WORKERS,
+    thread_name_prefix='face-match'
+)
+
+
+def _match_face_crop(backend, shard, crop_bytes):
+    # بيشتغل في thread من الـ pool: مفيش ORM هنا، الـ shard متحدد في thread الطلب
+    try:
+        matches = search_in_shard(crop_bytes, shard, max_faces=1, backend=backend)
+        return matches[0] if matches else None, None
+    except RecognitionUnavailable:
+        # الخدمة كلها واقعة مش وش واحد: بتطلع من الـ pool وترجع 503 زي صورة الوش الواحد
+        raise
+    except Exception as e:
+        return None, str(e)
+
+
+@login_required
+def face_attendance_batch_check(request):
+    """
+    Classroom-photo mode: detect every face in one frame, match the crops in
+    parallel and mark all recognised students of the group present at once.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'طلب غير صالح'})
+    try:
+        if request.content_type == 'application/json':
+            data = json.loads(request.body)
+            format, imgstr = data.get('image').split(';base64,')
+            return _check_classroom_photo(
+                request, base64.b64decode(imgstr), data.get('group_id'),
+                data.get('lecture_topic', 'Unspecified Topic')
+            )
+        with _frame_upload(request) as (frame_bytes, group_id, lecture_topic):
+            return _check_classroom_photo(request, frame_bytes, group_id, lecture_topic)
+    except Exception as e:
+        return _face_error_response(e)
+
+
+def _check_classroom_photo(request, image_bytes, group_id, lecture_topic):
+    """Shared by the JSON and binary uploads of ``face_attendance_batch_check``."""
+    group = get_object_or_404(Group.objects.select_related('course'), id=group_id, course__doctor=request.user)
+    # صورة القاعة بتحتاج دقة أعلى عشان الوشوش البعيدة
+    frame = prepare_frame(image_bytes, max_edge=settings.FACE_BATCH_FRAME_MAX_EDGE)
+
+    backend = get_recognition_backend()
+    boxes = backend.detect_faces(frame.jpeg)[:settings.FACE_BATCH_MAX_FACES]
+    if not boxes:
+        return JsonResponse({'success': False, 'message': 'لم يتم العثور على وجوه في الصورة', 'faces': []})
+    crops = crop_faces(frame.image, boxes)
+    # الجلسة والطلاب ورقم الـ shard بيتجهزوا هنا في thread الطلب قبل ما الـ pool يشتغل
+    session = get_active_session(group.pk, lecture_topic, group=group)
+    roster = session.roster
+    shard = shard_collection_id(group)
+    recognition_started = time.perf_counter()
+    results = list(_face_match_pool.map(lambda crop: _match_face_crop(backend, shard, crop), crops))
+    timings = _server_timing(frame, recognition_started)
+
+    faces = []
+    present = {}
+    for index, (box, (match, error)) in enumerate(zip(boxes, results)):
+        face = {
+            'index': index,
+            'box': {'left': box.left, 'top': box.top, 'width': box.width, 'height': box.height},
+            'matched': False,
+        }
+        if error:
+            face['message'] = f'حدث خطأ: {error}'
+        elif match is None:
+            face['message'] = 'وجه غير معروف'
+        elif match.external_id not in roster:
+            face.update({'university_id': match.external_id, 'message': 'الطالب غير مسجل في هذه المجموعة'})
+        else:
+            student = roster[match.external_id]
+            present[student.pk] = student
+            face.update({
+                'matched': True,
+                'student_name': student.name,
+                'university_id': student.university_id,
+                'similarity': round(match.similarity, 2),
+                'image_url': student.image_url,
+            })
+        faces.append(face)
+
+    # upsert واحد للي لسه مش متسجلين حاضرين
+    session.mark_many_present(present)
+
+    response = JsonResponse({
+        'success': True,
+        'faces_detected': len(boxes),
+        'marked_count': len(present),
+        'faces': faces,
+    })
+    response['Server-Timing'] = timings
+    return response
+
+
 @login_required
 def index_students_to_aws(request):
-    client = get_rekognition_client()
+    backend = get_recognition_backend()
     try:
-        client.create_collection(CollectionId='smart_attendance_collection')
-    except:
+        backend.ensure_collection()
+    except Exception:
         pass
 
-    students = Student.objects.exclude(image='')
-    success_count = 0
-    for student in students:
+    students = Student.objects.exclude(image='').only('pk', 'university_id', 'image', 'face_id', 'image_hash')
+    indexed, replaced_faces = [], []
+    with backend.batch() as batch:
+        for student in students:
+            try:
+                with open(student.image.path, 'rb') as img:
+                    image_bytes = img.read()
+                digest = hashlib.sha256(image_bytes).hexdigest()
+                # نفس الصورة متفهرسة قبل كده: مانضيفش وش مكرر في الـ collection
+                if student.face_id and student.image_hash == digest:
+                    continue
+                face_id = batch.index_face(image_bytes, student.university_id)
+                if not face_id:
+                    continue
+                if student.face_id:
+                    replaced_faces.append(student.face_id)
+                student.face_id, student.image_hash, student.indexed_at = face_id, digest, timezone.now()
+                indexed.append(student)
+            except Exception:
+                continue
+    Student.objects.bulk_update(indexed, ['face_id', 'image_hash', 'indexed_at'])
+    schedule_shard_sync([s.pk for s in indexed], reindex=True)
+    if replaced_faces:
         try:
-            with open(student.image.path, 'rb') as img:
-                client.index_faces(
-                    CollectionId='smart_attendance_collection',
-                    Image={'Bytes': img.read()},
-                    ExternalImageId=str(student.university_id),
-                    MaxFaces=1
-                )
-                success_count += 1
+            backend.delete_faces(replaced_faces)
         except Exception:
-            continue
-            
-    messages.success(request, f"تمت مزامنة {success_count} طالب مع نظام بصمة الوجه.")
+            pass  # reconcile_face_collection will clean them up
+
+    messages.success(request, f"تمت مزامنة {len(indexed)} طالب مع نظام بصمة الوجه.")
     return redirect('dashboard')
 
 
@@ -433,6 +758,8 @@ def report_home(request):
     context = {'courses': courses}
     return render(request, 'doctors/report_home.html', context)
 
+COURSE_REPORT_PAGE_SIZE = 50
+
 @login_required
 def course_report(request, course_id):
     if not is_doctor(request.user):
@@ -440,28 +767,61 @@ def course_report(request, course_id):
         return redirect('dashboard')    
     course = get_object_or_404(Course, pk=course_id, doctor=request.user)    
     total_lectures = course.lectures.count() 
-    student_data = []
-    students_in_course = Student.objects.filter(groups__course=course).distinct()
-    for student in students_in_course:
-        absent_count = student.attendance_records.filter( 
-            lecture__course=course, 
-            status=AttendanceStatus.ABSENT
-        ).count()        
-        attendance_percentage = (total_lectures - absent_count) / total_lectures * 100 if total_lectures > 0 else 0
-        is_warning = absent_count >= 3
-        student_data.append({
-            'name': student.name,
-            'id': student.university_id,
-            'absent_count': absent_count,
-            'attendance_percentage': f'{attendance_percentage:.1f}%',
-            'is_warning': is_warning
-        })
-    student_data.sort(key=lambda x: x['absent_count'], reverse=True)
+    warning_threshold = WARNING_THRESHOLD
+    risk_filter = request.GET.get('risk', 'all')
+
+    # استعلام واحد للصفحة: الغياب من AttendanceSummary ونسبة الحضور والترتيب في الـ SQL
+    enrolled = Student.objects.filter(groups__course=course).values('pk')
+    students = Student.objects.filter(pk__in=enrolled).annotate(
+        absent_count=Coalesce(
+            Subquery(AttendanceSummary.objects.filter(course=course, student=OuterRef('pk')).values('absent')[:1]),
+            0,
+        ),
+    )
+    if risk_filter == 'at_risk':
+        students = students.filter(absent_count__gte=warning_threshold)
+    elif risk_filter == 'stable':
+        students = students.filter(absent_count__lt=warning_threshold)
+    else:
+        risk_filter = 'all'
+    if total_lectures:
+        students = students.annotate(attendance_percentage=ExpressionWrapper(
+            (total_lectures - F('absent_count')) * 100.0 / total_lectures, output_field=models.FloatField()
+        ))
+    else:
+        students = students.annotate(attendance_percentage=Value(0.0, output_field=models.FloatField()))
+    students = students.order_by('-absent_count', 'name', 'pk').values(
+        'pk', 'name', 'university_id', 'absent_count', 'attendance_percentage'
+    )
+
+    page = Paginator(students, COURSE_REPORT_PAGE_SIZE).get_page(request.GET.get('page'))
+    # سلسلة الغياب ونسبة التأخير لطلاب الصفحة بس (مصفوفة صغيرة من analytics)
+    analytics = CourseAnalytics.for_course(course, student_ids=[row['pk'] for row in page]).by_student()
+    student_data = [
+        {
+            'name': row['name'],
+            'id': row['university_id'],
+            'absent_count': row['absent_count'],
+            'attendance_percentage': f"{row['attendance_percentage']:.1f}",
+            'is_warning': is_at_risk(row['absent_count'], warning_threshold),
+            'longest_streak': analytics[row['pk']]['longest_streak'],
+            'current_streak': analytics[row['pk']]['current_streak'],
+            'late_ratio': f"{analytics[row['pk']]['late_ratio'] * 100:.0f}",
+            'crossed_on': analytics[row['pk']]['crossed_on'],
+        }
+        for row in page
+    ]
+    at_risk_count = AttendanceSummary.objects.filter(
+        course=course, student__in=enrolled, absent__gte=warning_threshold
+    ).count()
     context = {
         'course': course,
         'total_lectures': total_lectures,
         'student_data': student_data,
-        'warning_threshold': 3,
+        'page_obj': page,
+        'risk_filter': risk_filter,
+        'at_risk_count': at_risk_count,
+        'warning_threshold': warning_threshold,
     }
     return render(request, 'doctors/course_report.html', context)
 
@@ -469,12 +829,34 @@ def course_report(request, course_id):
 # ==============================================
 # 6. دوال الطلاب والبحث (Student Views)
 # ==============================================
+STUDENT_SEARCH_PAGE_SIZE = 25
+
+def _set_warning_status(students, warning_threshold):
+    """warning_status_text / has_warning for a page of students (two queries in total)."""
+    student_ids = [student.pk for student in students]
+    enrolled = set(
+        Student.groups.through.objects.filter(student_id__in=student_ids)
+        .values_list('student_id', 'group__course_id')
+    )
+    over_threshold = {}
+    for student_id, course_id, course_code, absences in (
+        AttendanceSummary.objects.filter(student_id__in=student_ids, absent__gte=warning_threshold)
+        .values_list('student_id', 'course_id', 'course__code', 'absent').order_by('course_id')
+    ):
+        if (student_id, course_id) in enrolled:
+            over_threshold.setdefault(student_id, []).append({'absences': absences, 'course_code': course_code})
+
+    for student in students:
+        student_warning_details = over_threshold.get(student.pk, [])
+        student.warning_status_text = warning_status_text(student_warning_details)
+        student.has_warning = bool(student_warning_details)
+
 @login_required
 def student_search(request):
     if not is_doctor(request.user):
         messages.error(request, 'Access Denied.')
         return redirect('dashboard')
-    warning_threshold = 3
+    warning_threshold = WARNING_THRESHOLD
     search_query = request.GET.get('query', '').strip()
     searched_student = None
     students_qs = Student.objects.all().order_by('name')
@@ -488,11 +870,9 @@ def student_search(request):
             warning_courses = []
             total_absences_overall = 0
             all_course_absences = []
+            absences = _absences_by_course([searched_student.pk])
             for course in enrolled_courses:
-                absences_in_course = searched_student.attendance_records.filter(
-                    lecture__course=course,
-                    status=AttendanceStatus.ABSENT 
-                ).count()
+                absences_in_course = absences.get((searched_student.pk, course.pk), 0)
                 
                 total_absences_overall += absences_in_course
                 
@@ -501,10 +881,10 @@ def student_search(request):
                         'course_name': course.name,
                         'course_code': course.code,
                         'absences': absences_in_course,
-                        'is_warning': absences_in_course >= warning_threshold
+                        'is_warning': is_at_risk(absences_in_course, warning_threshold)
                     })
                 
-                if absences_in_course >= warning_threshold:
+                if is_at_risk(absences_in_course, warning_threshold):
                     warning_courses.append({
                         'course_name': course.name,
                         'course_code': course.code,
@@ -514,12 +894,7 @@ def student_search(request):
             searched_student.total_absences = total_absences_overall
             searched_student.all_course_absences = all_course_absences
             
-            if len(warning_courses) > 1:
-                searched_student.warning_status_text = f"High Risk ({len(warning_courses)} Courses)"
-            elif len(warning_courses) == 1:
-                searched_student.warning_status_text = f"High Risk ({warning_courses[0]['absences']} Absences in {warning_courses[0]['course_code']})"
-            else:
-                searched_student.warning_status_text = "Safe (0)"
+            searched_student.warning_status_text = warning_status_text(warning_courses)
 
             searched_student.has_warning = len(warning_courses) > 0
             searched_student.warning_courses = warning_courses
@@ -527,75 +902,20 @@ def student_search(request):
             final_student_list = [searched_student]
             
         else:
-            students_qs = students_qs.filter(
-                Q(name__icontains=search_query) | Q(university_id__icontains=search_query)
-            )
-            if not students_qs.exists():
-                messages.warning(request, f'No students found matching "{search_query}".')
-            
-            for student in students_qs:
-                student_warning_details = []
-                enrolled_courses = Course.objects.filter(groups__students=student).distinct()
-                
-                for course in enrolled_courses:
-                    absences = student.attendance_records.filter(
-                        lecture__course=course,
-                        status=AttendanceStatus.ABSENT
-                    ).count()
-                    
-                    if absences >= warning_threshold:
-                        student_warning_details.append({
-                            'absences': absences,
-                            'course_code': course.code
-                        })
-                
-                if len(student_warning_details) > 1:
-                    student.warning_status_text = f"High Risk ({len(student_warning_details)} Courses)"
-                    student.has_warning = True
-                elif len(student_warning_details) == 1:
-                    absences = student_warning_details[0]['absences']
-                    course_code = student_warning_details[0]['course_code']
-                    student.warning_status_text = f"High Risk ({absences} in {course_code})"
-                    student.has_warning = True
-                else:
-                    student.warning_status_text = "Safe (0)"
-                    student.has_warning = False
+            students_qs = search_students(students_qs, search_query)
 
-                final_student_list.append(student)
-            
-    else:
-        for student in students_qs:
-            student_warning_details = []
-            enrolled_courses = Course.objects.filter(groups__students=student).distinct()
-            
-            for course in enrolled_courses:
-                absences = student.attendance_records.filter(
-                    lecture__course=course,
-                    status=AttendanceStatus.ABSENT
-                ).count()
-                
-                if absences >= warning_threshold:
-                    student_warning_details.append({
-                        'absences': absences,
-                        'course_code': course.code
-                    })
-            
-            if len(student_warning_details) > 1:
-                student.warning_status_text = f"High Risk ({len(student_warning_details)} Courses)"
-                student.has_warning = True
-            elif len(student_warning_details) == 1:
-                absences = student_warning_details[0]['absences']
-                course_code = student_warning_details[0]['course_code']
-                student.warning_status_text = f"High Risk ({absences} in {course_code})"
-                student.has_warning = True
-            else:
-                student.warning_status_text = "Safe (0)"
-                student.has_warning = False
-
-            final_student_list.append(student)
+    # البحث بالاسم / جزء من الرقم أو من غير بحث: صفحة واحدة والإنذارات بتتحسب للصفحة كلها مرة واحدة
+    page_obj = None
+    if searched_student is None:
+        page_obj = Paginator(students_qs, STUDENT_SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+        if search_query and not page_obj.paginator.count:
+            messages.warning(request, f'No students found matching "{search_query}".')
+        final_student_list = list(page_obj)
+        _set_warning_status(final_student_list, warning_threshold)
 
     context = {
         'students': final_student_list,
+        'page_obj': page_obj,
         'search_query': search_query,
         'searched_student': searched_student,
         'warning_threshold': warning_threshold, 
@@ -605,19 +925,23 @@ def student_search(request):
 
 @login_required
 def group_student_list(request, group_id):
-    group = get_object_or_404(Group, id=group_id, course__doctor=request.user)
-    warning_threshold = 3
-    students = group.students.all().order_by('university_id').annotate(
-        total_absences=Count(
-            'attendance_records',
-            filter=Q(attendance_records__status=AttendanceStatus.ABSENT)
+    group = get_object_or_404(Group.objects.select_related('course'), id=group_id, course__doctor=request.user)
+    # الغياب في مقرر المجموعة بس (AttendanceSummary)، مش مجموع كل المقررات
+    students = list(group.students.all().order_by('university_id').annotate(
+        total_absences=Coalesce(
+            Subquery(AttendanceSummary.objects.filter(course=group.course, student=OuterRef('pk')).values('absent')[:1]),
+            0,
+        )
+    ))
+    for student in students:
+        student.has_warning = is_at_risk(student.total_absences)
+        student.warning_status_text = warning_status_text(
+            [{'absences': student.total_absences, 'course_code': group.course.code}] if student.has_warning else []
         )
-    )
 
     context = {
         'group': group,
         'students': students,
-        'warning_threshold': warning_threshold, 
     }
     return render(request, 'doctors/group_student_list.html', context)
 
@@ -677,67 +1001,49 @@ def update_schedule_image(request):
     messages.error(request, "No image selected.")
     return redirect('doctor_dashboard')
     
+@login_required
+def export_attendance_matrix(request, course_id):
+    """Students x lectures grid of a course as CSV (default) or XLSX (?format=xlsx)."""
+    if not (is_doctor(request.user) or request.user.is_superuser):
+        messages.error(request, 'Access Denied.')
+        return redirect('dashboard')
+    courses = Course.objects.all() if request.user.is_superuser else Course.objects.filter(doctor=request.user)
+    course = get_object_or_404(courses, pk=course_id)
+    matrix = AttendanceMatrix.for_course(course)
+    filename = f"attendance_{course.code}_{timezone.now():%Y%m%d}"
+    if request.GET.get('format') == 'xlsx':
+        return FileResponse(
+            write_xlsx(matrix, title=course.code),
+            as_attachment=True,
+            filename=f"{filename}.xlsx",
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    response = StreamingHttpResponse(iter_csv(matrix), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+@login_required
+def export_course_pdf_bundle(request, course_id):
+    """ZIP with the attendance PDF of every lecture of a course, rendered in parallel and streamed."""
+    if not is_doctor(request.user):
+        messages.error(request, 'Access Denied.')
+        return redirect('dashboard')
+    course = get_object_or_404(Course, pk=course_id, doctor=request.user)
+    lectures = course.lectures.select_related('course', 'group').order_by('date_time', 'pk')
+    response = StreamingHttpResponse(iter_zip_bundle(lectures.iterator()), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="attendance_pdfs_{course.code}.zip"'
+    return response
+
 def export_attendance_pdf(request, lecture_id):
-    lecture = get_object_or_404(Lecture, id=lecture_id)
-    attendance_records = lecture.attendance_records.all()
-    html_string = f"""
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body {{ font-family: sans-serif; padding: 20px; }}
-            h2 {{ text-align: center; color: #333; }}
-            table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
-            th, td {{ border: 1px solid #ddd; padding: 10px; text-align: left; }}
-            th {{ background-color: #f4f4f4; }}
-            .present {{ color: green; font-weight: bold; }}
-            .absent {{ color: red; font-weight: bold; }}
-        </style>
-    </head>
-    <body>
-        <h2>Attendance Report</h2>
-        <p><strong>Course:</strong> {lecture.course.name}</p>
-        <p><strong>Lecture:</strong> {lecture.topic or 'Regular Lecture'}</p>
-        <p><strong>Date:</strong> {lecture.date_time.strftime('%Y-%m-%d %H:%M')}</p>
-        <p><strong>Group:</strong> {lecture.group.name}</p>
-        
-        <table>
-            <thead>
-                <tr>
-                    <th>Student Name</th>
-                    <th>ID</th>
-                    <th>Status</th>
-                </tr>
-            </thead>
-            <tbody>
-    """    
-    for record in attendance_records:
-        status_text = "Present" if record.status in ['P', 'Present'] else "Absent"
-        status_class = "present" if record.status in ['P', 'Present'] else "absent"
-        
-        html_string += f"""
-            <tr>
-                <td>{record.student.name}</td>
-                <td>{record.student.university_id}</td>
-                <td class="{status_class}">{status_text}</td>
-            </tr>
-        """
-        
-    html_string += """
-            </tbody>
-        </table>
-    </body>
-    </html>
-    """
-    result = io.BytesIO()
-    pdf = pisa.pisaDocument(io.BytesIO(html_string.encode("UTF-8")), result)
-    
-    if not pdf.err:
-        response = HttpResponse(result.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="Attendance_{lecture.id}.pdf"'
-        return response
-    
-    return HttpResponse("Error generating PDF", status=400)
+    lecture = get_object_or_404(Lecture.objects.select_related('course', 'group'), id=lecture_id)
+    # الـ PDF متخزن على الديسك باسم hash للـ HTML: لو بيانات المحاضرة ماتغيرتش مش بنرندر تاني
+    try:
+        pdf = open_lecture_pdf(lecture)
+    except PdfRenderError:
+        return HttpResponse("Error generating PDF", status=400)
+    return FileResponse(
+        pdf, as_attachment=True, filename=f"Attendance_{lecture.id}.pdf", content_type='application/pdf'
+    )
 
 @login_required
 def create_announcement(request):